@@ -0,0 +1,104 @@
+"""Benchmark allocation from Ipv4PrivateNetworkSpace.
+
+Compares the original string-set implementation (which rebuilt the unused
+set on every allocate_address call) with the incrementally maintained free
+pool, and the original per-MAC DataFrame writes of MerakiNetworkMapper with
+the batch assignment. Run with:
+
+    python3 bench_networkspace.py
+"""
+import ipaddress
+import time
+from devicetable import DeviceTable
+from ipv4privatenetworkspace import Ipv4PrivateNetworkSpace
+from netorgmeraki import MerakiNetworkMapper
+
+CIDR = '10.10.0.0/16'
+RESERVED = 200
+BEFORE_SIZES = [250, 500, 1000, 2000]
+AFTER_SIZES = [250, 500, 1000, 2000, 8000, 32000]
+MAPPING_BEFORE_SIZES = [1000, 2000, 4000]
+MAPPING_AFTER_SIZES = [1000, 2000, 4000, 50000]
+
+class StringSetNetworkSpace :
+    """The original implementation, kept here as the baseline."""
+
+    def __init__(self, cidr) :
+        ip_network = ipaddress.ip_network(cidr)
+        self.__address_set = { format(item) for item in ip_network.hosts() }
+        self.__used_set = set()
+
+    def get_unused_set(self) :
+        """Return the set of IPv4 addresses that are available to be allocated."""
+        return self.__address_set - self.__used_set
+
+    def allocate_address(self) :
+        """Allocate an IP address."""
+        return_address = self.get_unused_set().pop()
+        self.__used_set.add(return_address)
+        return return_address
+
+    def allocate_specific_address(self, ip_address) :
+        """Allocate a specific IP address."""
+        self.__used_set.add(ip_address)
+        return ip_address
+
+def time_mapping(network_space_class, number_of_devices) -> float:
+    """Time reserving RESERVED addresses then assigning number_of_devices more."""
+    reserved_ips = [str(ipaddress.ip_address('10.10.1.0') + (i * 7)) for i in range(RESERVED)]
+    start = time.perf_counter()
+    network_space = network_space_class(CIDR)
+    for ip in reserved_ips:
+        network_space.allocate_specific_address(ip)
+    for _ in range(number_of_devices):
+        network_space.allocate_address()
+    return time.perf_counter() - start
+
+def build_device_table(number_of_devices) -> DeviceTable:
+    """Build a device table where every device needs an IP."""
+    return DeviceTable([
+        {'mac': f'mac{i}', 'known': True, 'reserved': False, 'active': False,
+         'ip': '', 'group': f'group{i % 10}', 'name': f'device{i}'}
+        for i in range(number_of_devices)])
+
+def time_per_mac_mapping(number_of_devices) -> float:
+    """Time the original mapping: one boolean-mask write per MAC."""
+    # pylint: disable=invalid-name
+    device_table = build_device_table(number_of_devices)
+    df = device_table.df
+    start = time.perf_counter()
+    network_space = Ipv4PrivateNetworkSpace(CIDR)
+    for mac in df.query("ip == ''")['mac'].tolist():
+        df.loc[df["mac"] == mac, "ip"] = network_space.allocate_address()
+    return time.perf_counter() - start
+
+def time_batch_mapping(number_of_devices) -> float:
+    """Time MerakiNetworkMapper, which assigns every IP in one indexed write."""
+    device_table = build_device_table(number_of_devices)
+    start = time.perf_counter()
+    MerakiNetworkMapper({'vlan_subnet': CIDR}, device_table)
+    return time.perf_counter() - start
+
+def main():
+    """Print the before and after timings."""
+    print(f'Assigning IPs to new devices in {CIDR} with {RESERVED} existing reservations')
+    print(f'{"devices":>8} {"before (s)":>12} {"after (s)":>12} {"after us/device":>16}')
+    for number_of_devices in AFTER_SIZES:
+        before = ''
+        if number_of_devices in BEFORE_SIZES:
+            before = f'{time_mapping(StringSetNetworkSpace, number_of_devices):.4f}'
+        after = time_mapping(Ipv4PrivateNetworkSpace, number_of_devices)
+        per_device = after / number_of_devices * 1e6
+        print(f'{number_of_devices:>8} {before:>12} {after:>12.4f} {per_device:>16.2f}')
+    print()
+    print(f'Mapping a device table into {CIDR}')
+    print(f'{"devices":>8} {"before (s)":>12} {"after (s)":>12}')
+    for number_of_devices in MAPPING_AFTER_SIZES:
+        before = ''
+        if number_of_devices in MAPPING_BEFORE_SIZES:
+            before = f'{time_per_mac_mapping(number_of_devices):.4f}'
+        after = time_batch_mapping(number_of_devices)
+        print(f'{number_of_devices:>8} {before:>12} {after:>12.4f}')
+
+if __name__ == "__main__":
+    main()
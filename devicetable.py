@@ -1,12 +1,81 @@
 """All the things associated with Loading, building and accessing a device table."""
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
+LOAD_ENGINES = ['records', 'columnar', 'streaming']
+
+# Column types of the device table. Anything not listed (mac, ip, name)
+# stays a string so it can be queried, exported and compared as before.
+DEVICE_TABLE_SCHEMA = {
+    'known': 'bool',
+    'reserved': 'bool',
+    'active': 'bool',
+    'group': 'category'
+}
+
 class DeviceTable :
-    """The device table is the heart of Network Organizer."""
+    """The device table is the heart of Network Organizer.
+
+    Each device (row) is identified by its unique MAC (if a MAC is given
+    more than once, the first is kept). Lookups by MAC and
+    by IP go through indexes rather than scanning the DataFrame. Use
+    set_ips() to change IPs so the IP index stays current. Columns are
+    typed according to DEVICE_TABLE_SCHEMA.
+    """
     def __init__(self,data) -> None:
         # pylint: disable=invalid-name
         self.df = pd.DataFrame(data)
+        self.df = self.df.astype(
+            {column: dtype for column, dtype in DEVICE_TABLE_SCHEMA.items() if column in self.df})
+        if 'mac' in self.df and not self.df['mac'].is_unique:
+            for mac in self.df.loc[self.df['mac'].duplicated(), 'mac'].unique():
+                print(f'DeviceTable: {mac} appears more than once, keeping the first')
+            self.df = self.df.drop_duplicates('mac').reset_index(drop=True)
+        macs = self.df['mac'].tolist() if 'mac' in self.df else []
+        self.__mac_index = dict(zip(macs, range(len(macs))))
+        self.__ip_index = None
+        self.__records = None
+
+    def get_macs(self) -> list:
+        """Return the MACs of every device, in table order."""
+        return list(self.__mac_index)
+
+    def get_by_mac(self, mac):
+        """Return the device (a dict of column -> value) with the given MAC or None."""
+        position = self.__mac_index.get(mac)
+        if position is None:
+            return None
+        return self.__get_records()[position]
+
+    def get_by_ip(self, ip):
+        """Return the device (a dict of column -> value) with the given IP or None."""
+        position = self.__get_ip_index().get(ip)
+        if position is None:
+            return None
+        return self.__get_records()[position]
+
+    def set_ips(self, mask, ips) -> None:
+        """Set the IPs of the devices selected by the boolean mask."""
+        self.df.loc[mask, 'ip'] = ips
+        self.__ip_index = None
+        self.__records = None
+
+    def __get_records(self) -> list:
+        """Return every device as a dict, in table order, building them if needed."""
+        if self.__records is None:
+            self.__records = self.df.to_dict('records')
+        return self.__records
+
+    def __get_ip_index(self) -> dict:
+        """Return the IP -> row position index, building it if needed."""
+        if self.__ip_index is None:
+            ips = self.df['ip'].tolist() if 'ip' in self.df else []
+            self.__ip_index = {}
+            for position, ip in enumerate(ips):
+                if ip:
+                    self.__ip_index.setdefault(ip, position)
+        return self.__ip_index
 
 class DeviceTableBuilder :
     """Efficiently Build a DeviceTable."""
@@ -46,12 +115,62 @@ class DeviceTableBuilder :
             data.append(merged)
         return DeviceTable(data)
 
+def _by_mac(df, keep, macs):
+    """Index a source frame by MAC, keeping the first or last entry per MAC, aligned to macs."""
+    return df.drop_duplicates('mac', keep=keep).set_index('mac').reindex(macs)
+
+def reconcile_device_table(known_devices, active_clients, fixed_ip_reservations) -> DeviceTable:
+    """Build a DeviceTable from the three sources with keyed outer joins.
+
+    Gives the same table as loading one record at a time: the known name
+    and group win, an active device keeps its current lease and an
+    inactive device takes its reserved IP.
+    """
+    # pylint: disable=invalid-name
+    # pylint: disable=line-too-long
+    known_df = pd.DataFrame(known_devices or [], columns=['mac', 'name', 'group'])
+    active_df = pd.DataFrame(active_clients or [], columns=['mac', 'description', 'ip'])
+    reserved_df = pd.DataFrame(
+        [{'mac': mac, **details} for mac, details in (fixed_ip_reservations or {}).items()],
+        columns=['mac', 'name', 'ip'])
+
+    # Devices appear in the order they are first seen across the sources
+    macs = pd.unique(pd.concat([known_df['mac'], active_df['mac'], reserved_df['mac']]))
+    known = _by_mac(known_df, 'last', macs)
+    first_active = _by_mac(active_df, 'first', macs)
+    last_active = first_active if active_df['mac'].is_unique else _by_mac(active_df, 'last', macs)
+    reserved = _by_mac(reserved_df, 'last', macs)
+    is_known = pd.Index(macs).isin(known_df['mac'])
+    is_active = pd.Index(macs).isin(active_df['mac'])
+    is_reserved = pd.Index(macs).isin(reserved_df['mac'])
+
+    lease = last_active['ip'].to_numpy()
+    reserved_ip = reserved['ip'].to_numpy()
+    name = np.where(is_known, known['name'].to_numpy(),
+        np.where(is_active, first_active['description'].to_numpy(), reserved['name'].to_numpy()))
+    for position in np.flatnonzero(is_active & is_reserved):
+        if lease[position] and lease[position] != reserved_ip[position]:
+            print(f'DeviceTableLoader: for {name[position]} reservation {reserved_ip[position]} differs to current lease {lease[position]}')
+            print(f'DeviceTableLoader: using current lease {lease[position]} to avoid potential for collisions')
+
+    return DeviceTable(pd.DataFrame({
+        'mac': macs,
+        'known': is_known,
+        'reserved': is_reserved,
+        'active': is_active,
+        'ip': np.where(is_active, lease, np.where(is_reserved, reserved_ip, '')),
+        'group': np.where(is_known, known['group'].to_numpy(), 'unclassified'),
+        'name': name}))
+
 class DeviceTableLoader :
     """Load data into the DeviceTable."""
 
     def __init__(self, known_devices_loader, active_clients_loader,
-                 fixed_ip_reservations_loader) -> None:
+                 fixed_ip_reservations_loader, engine='columnar') -> None:
+        if engine not in LOAD_ENGINES:
+            raise ValueError(f'unknown load engine {engine}')
         self.device_table_builder = DeviceTableBuilder()
+        self.engine = engine
         self.known_devices_loader = known_devices_loader
         self.active_clients_loader = active_clients_loader
         self.fixed_ip_reservations_loader = fixed_ip_reservations_loader
@@ -68,8 +187,15 @@ class DeviceTableLoader :
             self.device_table_builder.set_details(device['mac'], record)
 
     def load_active_clients(self) -> None:
-        """Load active clients into the DeviceTable."""
-        active_clients = self.active_clients_loader.load()
+        """Load active clients into the DeviceTable.
+
+        The streaming engine takes them from the loader's iterate(), a page
+        at a time, rather than from one list of every client.
+        """
+        if self.engine == 'streaming':
+            active_clients = self.active_clients_loader.iterate()
+        else:
+            active_clients = self.active_clients_loader.load()
         for active_client in active_clients :
             record = self.device_table_builder.get_details(active_client['mac'])
             if record:
@@ -112,6 +238,11 @@ class DeviceTableLoader :
 
     def load_all(self) -> DataFrame :
         """Load everything into the DeviceTable."""
+        if self.engine == 'columnar':
+            return reconcile_device_table(
+                self.known_devices_loader.load(),
+                self.active_clients_loader.load(),
+                self.fixed_ip_reservations_loader.load())
         self.load_known()
         self.load_active_clients()
         self.load_fixed_ip_reservations()
@@ -0,0 +1,91 @@
+"""Active clients seen by previous polls, kept in a local JSON file."""
+import json
+import math
+import os
+from typing import Iterable, Iterator, List
+
+# Lookback (in seconds) the Dashboard API uses when no timespan is given
+DEFAULT_ACTIVE_CLIENTS_TIMESPAN = 86400
+
+# The Dashboard API client fields a cached client keeps. The legacy
+# netorgmeraki loader keeps the same fields, so either can read a cache the
+# other wrote.
+CLIENT_FIELDS = ['mac', 'dhcpHostname', 'description', 'ip', 'vlan']
+
+# Seconds the window asked for overlaps the previous poll, so a client seen
+# while that poll was in flight isn't missed
+POLL_OVERLAP = 60
+
+class ActiveClientsCache:
+    """The clients seen over the last timespan seconds, keyed by MAC.
+
+    The first poll (or one after more than timespan seconds) asks the
+    Dashboard API for the whole timespan. Later polls only ask for the
+    window since the previous poll and merge what comes back into the
+    cached clients. A client not seen for timespan seconds is dropped.
+    source identifies what was polled (e.g. the serial and VLAN), so a
+    change of configuration starts again with a full poll. Clients are kept
+    as Dashboard API clients with only the CLIENT_FIELDS, and a cache written
+    with other fields is ignored.
+    """
+
+    def __init__(self, filename: str, timespan: int, source: str) -> None:
+        self.filename = filename
+        self.timespan = timespan
+        self.source = source
+        self.__clients = {}
+
+    @classmethod
+    def from_config(cls, config: dict, vlan_ids: List[str]) -> 'ActiveClientsCache':
+        """Create the active clients cache if one is configured, otherwise return None."""
+        if not config.get('active_clients_cache'):
+            return None
+        scope = config.get('active_clients_scope', 'device')
+        polled = config['serial_id'] if scope == 'device' else config['network_id']
+        return cls(
+            config['active_clients_cache'],
+            config.get('active_clients_timespan', DEFAULT_ACTIVE_CLIENTS_TIMESPAN),
+            f'{scope} {polled} vlan {",".join(str(vlan_id) for vlan_id in vlan_ids)}')
+
+    def get_window(self, now: float) -> int:
+        """Load the cache and return how many seconds back the next poll needs to ask for."""
+        self.__clients = {}
+        polled_at = None
+        if os.path.exists(self.filename):
+            with open(self.filename, encoding='utf8') as cache_file:
+                cache = json.load(cache_file)
+            if cache.get('source') == self.source and cache.get('fields') == CLIENT_FIELDS:
+                polled_at = cache['polled_at']
+                self.__clients = cache['clients']
+        if polled_at is None or now - polled_at >= self.timespan:
+            return self.timespan
+        return min(self.timespan, math.ceil(now - polled_at) + POLL_OVERLAP)
+
+    def merge(self, recent_clients: Iterable[dict], now: float) -> Iterator[dict]:
+        """Yield every client, the ones from the latest poll first, then save the cache.
+
+        recent_clients are Dashboard API clients; only their CLIENT_FIELDS
+        are kept and yielded.
+
+        The recent clients are passed on as they arrive, so the pages of the
+        latest poll are still streamed. The cached clients themselves are
+        held in memory (they're loaded from and saved to one JSON file), and
+        the cache is only saved once every client has been yielded.
+        """
+        for client in recent_clients:
+            previous = self.__clients.get(client['mac'])
+            if previous is not None and previous['seen_at'] == now:
+                # Already yielded from this poll
+                continue
+            client = {field: client.get(field) for field in CLIENT_FIELDS}
+            self.__clients[client['mac']] = {**client, 'seen_at': now}
+            yield client
+        self.__clients = {
+            mac: client for mac, client in self.__clients.items()
+            if now - client['seen_at'] < self.timespan}
+        for client in self.__clients.values():
+            if client['seen_at'] != now:
+                yield {key: value for key, value in client.items() if key != 'seen_at'}
+        with open(self.filename, 'w', encoding='utf8') as cache_file:
+            cache_file.write(json.dumps(
+                {'source': self.source, 'fields': CLIENT_FIELDS, 'polled_at': now, 'clients': self.__clients}, indent=2))
@@ -1,27 +1,95 @@
 
-from typing import List
-import meraki
+import time
+from typing import Iterable, Iterator, List
+from adapters.activeclients_cache import ActiveClientsCache
+from adapters.meraki_dashboard import SharedMerakiDashboard, get_vlans
 from ports import ActiveClient, ActiveClientsPort
 
+# Where active clients are collected from: the clients of the one device
+# (serial_id) chosen in the wizard, or every client in the network.
+ACTIVE_CLIENTS_SCOPES = ['device', 'network']
+
+# Largest page the network clients endpoint allows
+NETWORK_CLIENTS_PER_PAGE = 1000
+
 class ActiveClientsMerakiAdapter(ActiveClientsPort):
 
-    def __init__(self, config: dict) -> None:
-        self.dashboard = meraki.DashboardAPI(config['api_key'], suppress_logging=True)
+    def __init__(self, config: dict, dashboard: SharedMerakiDashboard = None) -> None:
+        self.dashboard = dashboard if dashboard else SharedMerakiDashboard.from_config(config)
         self.serial_id = config['serial_id']
-        self.vlan_id   = str(config['vlan_id'])
+        self.network_id = config.get('network_id')
+        self.vlan_ids  = [vlan['vlan_id'] for vlan in get_vlans(config)]
+        self.scope = config.get('active_clients_scope', 'device')
+        self.per_page = NETWORK_CLIENTS_PER_PAGE
+        self.timespan = config.get('active_clients_timespan')
+        self.cache = ActiveClientsCache.from_config(config, self.vlan_ids)
+        if self.scope not in ACTIVE_CLIENTS_SCOPES:
+            raise ValueError(f'unknown active clients scope {self.scope}')
 
     # overriding abstract method
     def load(self) -> List[ActiveClient]:
-        list_of_active_clients: List[ActiveClient] = []
-        device_clients = self.dashboard.devices.getDeviceClients(self.serial_id)
-        # pylint: disable=line-too-long
-        filtered_for_vlan = [ device_client for device_client in device_clients if device_client['vlan'] == self.vlan_id]
-        for device_client in filtered_for_vlan:
-            active_client = ActiveClient(
+        return list(self.iterate())
+
+    def iterate(self) -> Iterator[ActiveClient]:
+        """Yield the active clients one page at a time, so only one page is held in memory.
+
+        With a cache, only the clients seen since the previous poll are
+        fetched and they are merged into the cached clients.
+        """
+        if self.cache is None:
+            for page in self.__get_pages(self.timespan):
+                yield from ActiveClientsMerakiAdapter.iterate_active_clients(page, self.vlan_ids)
+            return
+        now = time.time()
+        window = self.cache.get_window(now)
+        recent_clients = (
+            device_client
+            for page in self.__get_pages(window)
+            for device_client in ActiveClientsMerakiAdapter.iterate_vlan_clients(page, self.vlan_ids))
+        yield from ActiveClientsMerakiAdapter.iterate_active_clients(
+            self.cache.merge(recent_clients, now), self.vlan_ids)
+
+    def __get_pages(self, timespan: int = None) -> Iterator[list]:
+        """Yield the pages of clients seen over the last timespan seconds (the API default if None)."""
+        timespan_kwargs = {} if timespan is None else {'timespan': timespan}
+        if self.scope != 'network':
+            # The device clients endpoint isn't paginated
+            yield self.dashboard.devices.getDeviceClients(self.serial_id, **timespan_kwargs)
+            return
+        starting_after = {}
+        while True:
+            page = self.dashboard.networks.getNetworkClients(
+                self.network_id, total_pages=1, perPage=self.per_page,
+                **ActiveClientsMerakiAdapter.get_vlan_filter(self.vlan_ids), **timespan_kwargs, **starting_after)
+            yield page
+            if len(page) < self.per_page:
+                return
+            starting_after = {'startingAfter': page[-1]['id']}
+
+    @staticmethod
+    def get_vlan_filter(vlan_ids: List[str]) -> dict:
+        """Return the network clients filter for the VLANs (the API can only filter on one)."""
+        return {'vlan': vlan_ids[0]} if len(vlan_ids) == 1 else {}
+
+    @staticmethod
+    def iterate_vlan_clients(device_clients: Iterable[dict], vlan_ids: List[str]) -> Iterator[dict]:
+        """Yield the device (or network) clients that are on the VLANs."""
+        return (device_client for device_client in device_clients if str(device_client['vlan']) in vlan_ids)
+
+    @staticmethod
+    def iterate_active_clients(device_clients: Iterable[dict], vlan_ids: List[str]) -> Iterator[ActiveClient]:
+        """Yield an ActiveClient for each of the device (or network) clients on the VLANs."""
+        for device_client in ActiveClientsMerakiAdapter.iterate_vlan_clients(device_clients, vlan_ids):
+            yield ActiveClient(
                 mac=device_client['mac'],
-                name=device_client['dhcpHostname'],
+                # Network clients have no dhcpHostname
+                name=device_client.get('dhcpHostname'),
                 description=device_client['description'],
-                ip_address=device_client['ip']
+                ip_address=device_client['ip'],
+                vlan_id=str(device_client['vlan'])
             )
-            list_of_active_clients.append(active_client)
-        return list_of_active_clients
\ No newline at end of file
+
+    @staticmethod
+    def to_active_clients(device_clients: list, vlan_ids: List[str]) -> List[ActiveClient]:
+        """Convert the device (or network) clients on the VLANs to a list of ActiveClient."""
+        return list(ActiveClientsMerakiAdapter.iterate_active_clients(device_clients, vlan_ids))
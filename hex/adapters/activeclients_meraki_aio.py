@@ -0,0 +1,40 @@
+import time
+from typing import List
+from adapters.activeclients_cache import ActiveClientsCache
+from adapters.activeclients_meraki import ACTIVE_CLIENTS_SCOPES, NETWORK_CLIENTS_PER_PAGE, ActiveClientsMerakiAdapter
+from adapters.meraki_dashboard import SharedAsyncMerakiDashboard, get_vlans
+from ports import ActiveClient, AsyncActiveClientsPort
+
+class ActiveClientsMerakiAsyncAdapter(AsyncActiveClientsPort):
+    """Load active clients with the asyncio Meraki SDK."""
+
+    def __init__(self, config: dict, dashboard: SharedAsyncMerakiDashboard) -> None:
+        self.dashboard = dashboard
+        self.serial_id = config['serial_id']
+        self.network_id = config.get('network_id')
+        self.vlan_ids  = [vlan['vlan_id'] for vlan in get_vlans(config)]
+        self.scope = config.get('active_clients_scope', 'device')
+        if self.scope not in ACTIVE_CLIENTS_SCOPES:
+            raise ValueError(f'unknown active clients scope {self.scope}')
+        self.timespan = config.get('active_clients_timespan')
+        self.cache = ActiveClientsCache.from_config(config, self.vlan_ids)
+
+    # overriding abstract method
+    async def load(self) -> List[ActiveClient]:
+        now = time.time()
+        timespan = self.cache.get_window(now) if self.cache else self.timespan
+        timespan_kwargs = {} if timespan is None else {'timespan': timespan}
+        dashboard = await self.dashboard.get_dashboard()
+        if self.scope == 'network':
+            clients = await dashboard.networks.getNetworkClients(
+                self.network_id, total_pages='all', perPage=NETWORK_CLIENTS_PER_PAGE,
+                **ActiveClientsMerakiAdapter.get_vlan_filter(self.vlan_ids), **timespan_kwargs)
+        else:
+            clients = await dashboard.devices.getDeviceClients(self.serial_id, **timespan_kwargs)
+        if self.cache is not None:
+            clients = self.cache.merge(ActiveClientsMerakiAdapter.iterate_vlan_clients(clients, self.vlan_ids), now)
+        return ActiveClientsMerakiAdapter.to_active_clients(clients, self.vlan_ids)
+
+    # overriding method
+    async def close(self) -> None:
+        await self.dashboard.close()
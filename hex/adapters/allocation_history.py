@@ -0,0 +1,33 @@
+"""The IP each device was given by previous runs, kept in a local JSON file."""
+import json
+import os
+
+class AllocationHistory:
+    """MAC -> IP history used by the sticky allocation strategy."""
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'AllocationHistory':
+        """Create the allocation history if the sticky strategy is configured, otherwise return None."""
+        if config.get('ip_allocation_strategy', 'lowest') != 'sticky':
+            return None
+        return cls(config.get(
+            'ip_allocation_history',
+            os.path.join(os.path.expanduser('~'), '.netorg.history.json')))
+
+    def load(self) -> dict:
+        """Load the MAC -> IP history, which is empty before the first save."""
+        if not os.path.exists(self.filename):
+            return {}
+        with open(self.filename, encoding='utf8') as history_file:
+            return json.load(history_file)
+
+    def save(self, fixed_ip_reservations: dict) -> None:
+        """Remember the IP each device in the fixed IP reservations was given."""
+        history = self.load()
+        for mac, reservation_details in fixed_ip_reservations.items():
+            history[mac] = reservation_details['ip']
+        with open(self.filename, 'w', encoding='utf8') as history_file:
+            history_file.write(json.dumps(history, indent=2))
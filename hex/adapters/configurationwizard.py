@@ -1,6 +1,8 @@
 import getpass
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 import meraki
+from adapters.meraki_dashboard import SharedMerakiDashboard
 from ports import ConfigurationWizardPort
 
 class ConfigurationWizardConsoleAdapter(ConfigurationWizardPort):
@@ -106,6 +108,59 @@ class NoVlansFound(MerakiWrapperException) :
     # pylint: disable=missing-class-docstring
     pass
 
+class MerakiTopology :
+    """The devices and VLANs of the networks in an org, kept for the session.
+
+    prefetch() starts fetching them for every network in the background,
+    a few at a time, as soon as the networks are known. By the time a
+    network has been chosen its devices and VLANs are usually in already.
+    A network whose fetch hasn't started yet is fetched straight away
+    rather than waiting behind the others. Every fetch goes through the
+    dashboard's request scheduler, so prefetching a large org stays within
+    the requests per second allowed for the API key.
+    """
+
+    def __init__(self, dashboard, max_workers=8) -> None:
+        self.dashboard = dashboard
+        self.max_workers = max_workers
+        self.__executor = None
+        self.__devices = {}
+        self.__vlans = {}
+
+    def prefetch(self, networks) -> None:
+        """Start fetching the devices and VLANs of every network."""
+        self.__executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        for network in networks:
+            network_id = network['id']
+            self.__devices[network_id] = self.__executor.submit(
+                self.dashboard.networks.getNetworkDevices, network_id)
+            self.__vlans[network_id] = self.__executor.submit(
+                self.dashboard.appliance.getNetworkApplianceVlans, network_id)
+
+    def get_devices(self, network_id) -> list:
+        """Return the devices in the network."""
+        return MerakiTopology.__get(self.__devices, network_id, self.dashboard.networks.getNetworkDevices)
+
+    def get_vlans(self, network_id) -> list:
+        """Return the VLANs of the network."""
+        return MerakiTopology.__get(self.__vlans, network_id, self.dashboard.appliance.getNetworkApplianceVlans)
+
+    def close(self) -> None:
+        """Stop fetching. Whatever has been fetched already is kept."""
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
+
+    @staticmethod
+    def __get(futures, network_id, fetch) -> list:
+        """Return the result of the fetch for the network, fetching it now if it hasn't started."""
+        future = futures.get(network_id)
+        if future is None or future.cancel():
+            future = Future()
+            future.set_result(fetch(network_id))
+            futures[network_id] = future
+        return future.result()
+
 class MerakiWrapper :
     """Wrapper for the Meraki dashboard API."""
 
@@ -177,6 +232,11 @@ class MerakiWrapper :
     def find_network_id(dashboard, org_id, chooser_func) -> str:
         """Return the network id."""
         networks = dashboard.organizations.getOrganizationNetworks(org_id)
+        return MerakiWrapper.choose_network_id(networks, chooser_func)
+
+    @staticmethod
+    def choose_network_id(networks, chooser_func) -> str:
+        """Return the id of the only network, or the one selected by the user."""
         if len(networks) == 0 :
             raise NoNetworksFound
         if len(networks) > 1 :
@@ -187,6 +247,11 @@ class MerakiWrapper :
     def find_device_serial_id(dashboard, network_id, chooser_func) -> str:
         """Return the device serial id."""
         devices = dashboard.networks.getNetworkDevices(network_id)
+        return MerakiWrapper.choose_device_serial_id(devices, chooser_func)
+
+    @staticmethod
+    def choose_device_serial_id(devices, chooser_func) -> str:
+        """Return the serial id of the only device, or the one selected by the user."""
         if len(devices) == 0 :
             raise NoDevicesFound
         if len(devices) > 1 :
@@ -197,6 +262,11 @@ class MerakiWrapper :
     def find_vlan_id(dashboard, network_id, chooser_func) -> str:
         """Return the VLAN id."""
         vlans = dashboard.appliance.getNetworkApplianceVlans(network_id)
+        return MerakiWrapper.choose_vlan_id(vlans, chooser_func)
+
+    @staticmethod
+    def choose_vlan_id(vlans, chooser_func) -> str:
+        """Return the id of the only VLAN, or the one selected by the user."""
         if len(vlans) == 0 :
             raise NoVlansFound
         if len(vlans) > 1 :
@@ -209,10 +279,11 @@ class MerakiWrapper :
         vlan = dashboard.appliance.getNetworkApplianceVlan(network_id, str(vlan_id))
         return vlan['subnet']
 
-    def __init__(self, api_key) :
+    def __init__(self, api_key, dashboard=None) :
         if not api_key :
             raise InvalidApiKey
-        self.dashboard = meraki.DashboardAPI(api_key, suppress_logging=True)
+        self.dashboard = dashboard if dashboard else SharedMerakiDashboard(api_key)
+        self.topology = MerakiTopology(self.dashboard)
         self.org_id = ''
         self.network_id = ''
         self.serial_id = ''
@@ -223,14 +294,17 @@ class MerakiWrapper :
         """Fully initialize the wrapper."""
         try :
             self.org_id = MerakiWrapper.find_org_id(self.dashboard)
-            self.network_id = MerakiWrapper.find_network_id(
-                self.dashboard, self.org_id, chooser_func)
-            self.serial_id = MerakiWrapper.find_device_serial_id(
-                self.dashboard, self.network_id, chooser_func)
-            self.vlan_id = MerakiWrapper.find_vlan_id(
-                self.dashboard, self.network_id, chooser_func)
-            self.vlan_subnet = MerakiWrapper.find_vlan_subnet(
-                self.dashboard,self.network_id,self.vlan_id)
+            networks = self.dashboard.organizations.getOrganizationNetworks(self.org_id)
+            # Fetch every network's devices and VLANs while the user chooses
+            self.topology.prefetch(networks)
+            self.network_id = MerakiWrapper.choose_network_id(networks, chooser_func)
+            self.serial_id = MerakiWrapper.choose_device_serial_id(
+                self.topology.get_devices(self.network_id), chooser_func)
+            vlans = self.topology.get_vlans(self.network_id)
+            self.vlan_id = MerakiWrapper.choose_vlan_id(vlans, chooser_func)
+            self.vlan_subnet = next(vlan['subnet'] for vlan in vlans if vlan['id'] == self.vlan_id)
         except meraki.exceptions.APIError as exc:
             print(f'Failed to initialize MerakiWrapper: {exc}')
             raise MerakiWrapperException from exc
+        finally:
+            self.topology.close()
@@ -1,73 +1,148 @@
+import hashlib
+import json
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
-import meraki
 from deepdiff import DeepDiff
-from devicetable import DeviceTable
-from networkspace import NetworkMapper
+from adapters.allocation_history import AllocationHistory
+from adapters.meraki_dashboard import SharedMerakiDashboard, get_vlans
+from devicetable import DeviceTable, PartitionedDeviceTable
+from networkspace import NetworkMapper, create_allocation_strategy
 from ports import FixedIpReservation, FixedIpReservationsPort
 
+def fingerprint_fixed_ip_reservations(fixed_ip_reservations) -> str:
+    """Return a hash of fixed IP reservations that ignores the order of MACs and fields."""
+    canonical = json.dumps(fixed_ip_reservations or {}, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf8')).hexdigest()
+
 class FixedIpReservationsMerakiAdapter(FixedIpReservationsPort):
 
-    def __init__(self, config: dict) -> None:
-        self.dashboard = meraki.DashboardAPI(config['api_key'], suppress_logging=True)
+    def __init__(self, config: dict, dashboard: SharedMerakiDashboard = None) -> None:
+        self.dashboard = dashboard if dashboard else SharedMerakiDashboard.from_config(config)
         self.network_id = config['network_id']
-        self.vlan_id = str(config['vlan_id'])
-        self.vlan_subnet = config['vlan_subnet']
-        
+        self.vlans = get_vlans(config)
+        self.vlan_id = self.vlans[0]['vlan_id']
+        self.vlan_subnet = self.vlans[0]['vlan_subnet']
+        self.allocation_strategy = config.get('ip_allocation_strategy', 'lowest')
+        self.allocation_history = AllocationHistory.from_config(config)
+
     # overriding abstract method
     def load(self) -> List[FixedIpReservation]:
+        vlan_ids = [vlan['vlan_id'] for vlan in self.vlans]
+        with ThreadPoolExecutor(max_workers=len(vlan_ids)) as executor:
+            vlans = list(executor.map(self.__get_vlan, vlan_ids))
+        return [
+            fixed_ip_reservation
+            for vlan_id, vlan in zip(vlan_ids, vlans)
+            for fixed_ip_reservation in FixedIpReservationsMerakiAdapter.to_fixed_ip_reservations(vlan, vlan_id)]
+
+    # overriding abstract method
+    def save(self,device_table: DeviceTable) -> None: #TODO
+        """Map each VLAN's devices into its subnet, in parallel, then push each VLAN that changed once."""
+        partitions = self.get_partitions(device_table)
+        vlan_subnets = {vlan['vlan_id']: vlan['vlan_subnet'] for vlan in self.vlans}
+        def plan_partition(vlan_id) -> dict:
+            return self.plan(partitions[vlan_id], vlan_subnets[vlan_id])
+        with ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+            plans = dict(zip(partitions, executor.map(plan_partition, partitions)))
+            updates = [
+                executor.submit(self.__update_vlan, vlan_id, new_fixed_ip_reservations)
+                for vlan_id, new_fixed_ip_reservations in plans.items()
+                if self.__needs_update(vlan_id, new_fixed_ip_reservations)]
+            for update in updates:
+                update.result()
+        self.save_history({mac: details for plan in plans.values() for mac, details in plan.items()})
+
+    def get_partitions(self, device_table: DeviceTable) -> dict:
+        """Return VLAN -> DeviceTable for the VLANs the device table covers."""
+        if isinstance(device_table, PartitionedDeviceTable):
+            return device_table.partitions
+        return {self.vlan_id: device_table}
+
+    def __needs_update(self, vlan_id: str, new_fixed_ip_reservations: dict) -> bool:
+        """Show what would change on the VLAN and return False if nothing would."""
+        before_vlan = self.__get_vlan(vlan_id)
+        old_fixed_ip_reservations = before_vlan['fixedIpAssignments']
+        FixedIpReservationsMerakiAdapter.show_diffs(old_fixed_ip_reservations, new_fixed_ip_reservations)
+        print(old_fixed_ip_reservations)
+        print(new_fixed_ip_reservations)
+        if FixedIpReservationsMerakiAdapter.is_unchanged(old_fixed_ip_reservations, new_fixed_ip_reservations):
+            writes_avoided = self.dashboard.vlan_snapshots.count_write_avoided()
+            # pylint: disable=line-too-long
+            print(f'Fixed IP reservations for VLAN {vlan_id} are unchanged, skipping the update ({writes_avoided} write(s) avoided this run)')
+            return False
+        return True
+
+    def __update_vlan(self, vlan_id: str, new_fixed_ip_reservations: dict) -> None:
+        """Push the fixed IP reservations to the VLAN."""
+        after_vlan = self.dashboard.appliance.updateNetworkApplianceVlan(
+            self.network_id, vlan_id,
+            fixedIpAssignments=new_fixed_ip_reservations)
+        self.dashboard.vlan_snapshots.put(self.network_id, vlan_id, after_vlan)
+
+    def __get_vlan(self, vlan_id: str = None) -> dict:
+        """Return the VLAN, reading it from the Dashboard API only if there is no fresh snapshot."""
+        vlan_id = vlan_id if vlan_id else self.vlan_id
+        vlan = self.dashboard.vlan_snapshots.get(self.network_id, vlan_id)
+        if vlan is None:
+            vlan = self.dashboard.appliance.getNetworkApplianceVlan(self.network_id, str(vlan_id))
+            self.dashboard.vlan_snapshots.put(self.network_id, vlan_id, vlan)
+        return vlan
+
+    @staticmethod
+    def is_unchanged(old_fixed_ip_reservations, new_fixed_ip_reservations) -> bool:
+        """Return True if pushing the new fixed IP reservations would change nothing."""
+        return (fingerprint_fixed_ip_reservations(old_fixed_ip_reservations)
+            == fingerprint_fixed_ip_reservations(new_fixed_ip_reservations))
+
+    @staticmethod
+    def to_fixed_ip_reservations(vlan: dict, vlan_id: str = None) -> List[FixedIpReservation]:
+        """Convert the fixedIpAssignments of a VLAN to a list of FixedIpReservation."""
         list_of_fixed_ip_reservations: List[FixedIpReservation] = []
-        vlan = self.dashboard.appliance.getNetworkApplianceVlan(self.network_id, str(self.vlan_id))
         reservations = vlan['fixedIpAssignments']
         if reservations:
             for mac, reservation_details in reservations.items():
                 fixed_ip_reservation = FixedIpReservation(
                     mac=mac,
                     name=reservation_details['name'],
-                    ip_address=reservation_details['ip']
+                    ip_address=reservation_details['ip'],
+                    vlan_id=vlan_id
                 )
                 list_of_fixed_ip_reservations.append(fixed_ip_reservation)
         return list_of_fixed_ip_reservations
 
-    # overriding abstract method
-    def save(self,device_table: DeviceTable) -> None: #TODO
-        network_mapper = NetworkMapper(self.vlan_subnet,device_table)
+    def plan(self, device_table: DeviceTable, vlan_subnet: str = None) -> dict:
+        """Map the device table into the VLAN subnet and return the fixed IP reservations to push."""
+        strategy = create_allocation_strategy(self.allocation_strategy, self.allocation_history.load() if self.allocation_history else {})
+        network_mapper = NetworkMapper(vlan_subnet if vlan_subnet else self.vlan_subnet,device_table,strategy)
         network_mapper.map_to_network_space()
-        new_fixed_ip_reservations = FixedIpReservationsMerakiAdapter.__generate_fixed_ip_reservations(device_table)
-        before_vlan = self.dashboard.appliance.getNetworkApplianceVlan(self.network_id, str(self.vlan_id))
-        old_fixed_ip_reservations = before_vlan['fixedIpAssignments']
-        FixedIpReservationsMerakiAdapter.__show_diffs(old_fixed_ip_reservations, new_fixed_ip_reservations)
-        # pylint: disable=unused-variable
-        print(old_fixed_ip_reservations)
-        print(new_fixed_ip_reservations)
-        response = self.dashboard.appliance.updateNetworkApplianceVlan(
-            self.network_id, self.vlan_id,
-            fixedIpAssignments=new_fixed_ip_reservations)
+        return FixedIpReservationsMerakiAdapter.__generate_fixed_ip_reservations(device_table)
+
+    def save_history(self, fixed_ip_reservations) -> None:
+        """Remember the IP each device was given for the sticky allocation strategy."""
+        if self.allocation_history:
+            self.allocation_history.save(fixed_ip_reservations)
 
     @staticmethod
     def __generate_fixed_ip_reservations(device_table: DeviceTable) -> dict:
-        """Generate fixed IP reservations."""
-        # pylint: disable=invalid-name
+        """Generate fixed IP reservations in a single pass over the device table's MAC index."""
         ip_reservations_dict = {}
-        df = device_table.df
-        skip_these_macs = df.query("not known and reserved and not active").mac.unique().tolist()
-        macs = df.mac.unique().tolist()
-        for mac in macs :
-            if mac not in skip_these_macs:
-                device_df = df.query('mac == @mac')
-                if device_df.shape[0] == 1:
-                    ip = device_df.iloc[0]['ip']
-                    name = device_df.iloc[0]['name']
-                    ip_reservations_dict[mac] = {
-                        'ip': ip,
-                        'name': name
-                    }
-            else:
+        for mac in device_table.get_macs():
+            device = device_table.get_by_mac(mac)
+            if device['reserved'] and not device['known'] and not device['active']:
                 print(f'MerakiFixedIpReservationsGenerator: skipping {mac}')
+                continue
+            holder = device_table.get_by_ip(device['ip'])
+            if holder is not None and holder['mac'] != mac:
+                print(f'MerakiFixedIpReservationsGenerator: {mac} has the same IP {device["ip"]} as {holder["mac"]}')
+            ip_reservations_dict[mac] = {
+                'ip': device['ip'],
+                'name': device['name']
+            }
         return ip_reservations_dict
 
     @staticmethod
-    def __show_diffs(old_fixed_ip_reservations, new_fixed_ip_reservations):
+    def show_diffs(old_fixed_ip_reservations, new_fixed_ip_reservations):
         """Show the before and after differences to the fixed IP reservations."""
         diff = DeepDiff(old_fixed_ip_reservations, new_fixed_ip_reservations)
         if diff:
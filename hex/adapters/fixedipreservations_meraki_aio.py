@@ -0,0 +1,72 @@
+import asyncio
+from typing import List
+from adapters.fixedipreservations_meraki import FixedIpReservationsMerakiAdapter
+from adapters.meraki_dashboard import SharedAsyncMerakiDashboard, get_vlans
+from devicetable import DeviceTable
+from ports import AsyncFixedIpReservationsPort, FixedIpReservation
+
+class FixedIpReservationsMerakiAsyncAdapter(AsyncFixedIpReservationsPort):
+    """Load and save fixed IP reservations with the asyncio Meraki SDK.
+
+    Mapping the device table and working out the reservations is the same
+    as for the blocking adapter, which is used for everything but the I/O.
+    Each VLAN is read and written concurrently.
+    """
+
+    def __init__(self, config: dict, dashboard: SharedAsyncMerakiDashboard) -> None:
+        self.dashboard = dashboard
+        self.network_id = config['network_id']
+        self.vlans = get_vlans(config)
+        self.vlan_id = self.vlans[0]['vlan_id']
+        # Never calls the Dashboard API, so its blocking client is never created
+        self.planner = FixedIpReservationsMerakiAdapter(config)
+
+    # overriding abstract method
+    async def load(self) -> List[FixedIpReservation]:
+        vlan_ids = [vlan['vlan_id'] for vlan in self.vlans]
+        vlans = await asyncio.gather(*[self.__get_vlan(vlan_id) for vlan_id in vlan_ids])
+        return [
+            fixed_ip_reservation
+            for vlan_id, vlan in zip(vlan_ids, vlans)
+            for fixed_ip_reservation in FixedIpReservationsMerakiAdapter.to_fixed_ip_reservations(vlan, vlan_id)]
+
+    # overriding abstract method
+    async def save(self, device_table: DeviceTable) -> None:
+        """Map each VLAN's devices into its subnet, then push each VLAN that changed once."""
+        vlan_subnets = {vlan['vlan_id']: vlan['vlan_subnet'] for vlan in self.vlans}
+        plans = {
+            vlan_id: self.planner.plan(partition, vlan_subnets[vlan_id])
+            for vlan_id, partition in self.planner.get_partitions(device_table).items()}
+        await asyncio.gather(*[
+            self.__save_vlan(vlan_id, new_fixed_ip_reservations)
+            for vlan_id, new_fixed_ip_reservations in plans.items()])
+        self.planner.save_history({mac: details for plan in plans.values() for mac, details in plan.items()})
+
+    # overriding method
+    async def close(self) -> None:
+        await self.dashboard.close()
+
+    async def __save_vlan(self, vlan_id: str, new_fixed_ip_reservations: dict) -> None:
+        """Push the fixed IP reservations to the VLAN, unless nothing would change."""
+        before_vlan = await self.__get_vlan(vlan_id)
+        old_fixed_ip_reservations = before_vlan['fixedIpAssignments']
+        FixedIpReservationsMerakiAdapter.show_diffs(old_fixed_ip_reservations, new_fixed_ip_reservations)
+        if FixedIpReservationsMerakiAdapter.is_unchanged(old_fixed_ip_reservations, new_fixed_ip_reservations):
+            writes_avoided = self.dashboard.vlan_snapshots.count_write_avoided()
+            # pylint: disable=line-too-long
+            print(f'Fixed IP reservations for VLAN {vlan_id} are unchanged, skipping the update ({writes_avoided} write(s) avoided this run)')
+            return
+        dashboard = await self.dashboard.get_dashboard()
+        after_vlan = await dashboard.appliance.updateNetworkApplianceVlan(
+            self.network_id, vlan_id,
+            fixedIpAssignments=new_fixed_ip_reservations)
+        self.dashboard.vlan_snapshots.put(self.network_id, vlan_id, after_vlan)
+
+    async def __get_vlan(self, vlan_id: str) -> dict:
+        """Return the VLAN, reading it from the Dashboard API only if there is no fresh snapshot."""
+        vlan = self.dashboard.vlan_snapshots.get(self.network_id, vlan_id)
+        if vlan is None:
+            dashboard = await self.dashboard.get_dashboard()
+            vlan = await dashboard.appliance.getNetworkApplianceVlan(self.network_id, vlan_id)
+            self.dashboard.vlan_snapshots.put(self.network_id, vlan_id, vlan)
+        return vlan
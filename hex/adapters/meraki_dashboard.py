@@ -0,0 +1,336 @@
+"""Shared Meraki Dashboard API client used by all the Meraki adapters."""
+import asyncio
+import threading
+import time
+import meraki
+import meraki.aio
+import meraki.exceptions
+from requests.adapters import HTTPAdapter
+
+def get_vlans(config: dict) -> list:
+    """Return the VLANs to organize as a list of {'vlan_id', 'vlan_subnet'}.
+
+    These come from the vlans setting if there is one, otherwise from
+    vlan_id and vlan_subnet. The first VLAN is where devices that are
+    neither active nor reserved are given an IP.
+    """
+    vlans = config.get('vlans') or [{'vlan_id': config['vlan_id'], 'vlan_subnet': config.get('vlan_subnet')}]
+    return [{'vlan_id': str(vlan['vlan_id']), 'vlan_subnet': vlan.get('vlan_subnet')} for vlan in vlans]
+
+class VlanSnapshotCache:
+    """Run-scoped snapshots of VLANs read from the Dashboard API.
+
+    The fixed IP reservation adapters read a VLAN when loading and need it
+    again just before updating it. Keeping the snapshot means one organize
+    does one read and one write per VLAN. If max_age (seconds) is set, a
+    snapshot older than that is treated as stale and read again. Updates
+    skipped because the VLAN already matched are counted in writes_avoided.
+    """
+
+    def __init__(self, max_age: float = None) -> None:
+        self.max_age = max_age
+        self.writes_avoided = 0
+        self.__snapshots = {}
+        self.__lock = threading.Lock()
+
+    def get(self, network_id: str, vlan_id: str):
+        """Return the snapshot of the VLAN, or None if there isn't a fresh one."""
+        with self.__lock:
+            snapshot = self.__snapshots.get((network_id, str(vlan_id)))
+        if snapshot is None:
+            return None
+        vlan, taken_at = snapshot
+        if self.max_age is not None and time.monotonic() - taken_at > self.max_age:
+            return None
+        return vlan
+
+    def put(self, network_id: str, vlan_id: str, vlan: dict) -> None:
+        """Remember the VLAN as read from (or written to) the Dashboard API."""
+        with self.__lock:
+            self.__snapshots[(network_id, str(vlan_id))] = (vlan, time.monotonic())
+
+    def count_write_avoided(self) -> int:
+        """Count a VLAN update that was skipped because nothing changed and return the total this run."""
+        with self.__lock:
+            self.writes_avoided += 1
+            return self.writes_avoided
+
+class MerakiRequestScheduler:
+    """Token bucket that every Dashboard API call made with an API key goes through.
+
+    Meraki gives each organization a budget of requests per second. Tokens
+    refill at rate per second, up to burst. When reads (get... operations)
+    and writes are both waiting, reads go first, but only until a write has
+    waited maximum_write_deferral seconds: then reads wait for it, so a
+    steady stream of reads can't hold a write back forever. A 429 response
+    pauses every caller sharing the scheduler for the Retry-After the API
+    asked for.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: int = 10, maximum_retries: int = 3,
+                 maximum_write_deferral: float = 1.0) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.maximum_retries = maximum_retries
+        self.maximum_write_deferral = maximum_write_deferral
+        self.requests = 0
+        self.throttled = 0
+        self.__tokens = float(burst)
+        self.__updated = time.monotonic()
+        self.__paused_until = 0.0
+        self.__waiting_reads = 0
+        # When each waiting write joined the line, oldest first
+        self.__waiting_writes = []
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def is_read(operation_name: str) -> bool:
+        """Return True if the Dashboard API operation only reads."""
+        return operation_name.startswith('get')
+
+    def acquire(self, read: bool = True) -> None:
+        """Block until a request may be sent."""
+        joined = self.__join(read)
+        try:
+            wait = self.__take(read, joined)
+            while wait > 0:
+                time.sleep(wait)
+                wait = self.__take(read, joined)
+        finally:
+            self.__leave(read, joined)
+
+    async def acquire_async(self, read: bool = True) -> None:
+        """Wait, without blocking the event loop, until a request may be sent."""
+        joined = self.__join(read)
+        try:
+            wait = self.__take(read, joined)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.__take(read, joined)
+        finally:
+            self.__leave(read, joined)
+
+    def pause(self, seconds: float) -> None:
+        """Stop every caller sending requests for the given number of seconds."""
+        with self.__lock:
+            self.throttled += 1
+            self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+
+    def observe_response(self, response, *args, **kwargs) -> None:
+        """requests response hook: pause everyone when the API answers 429."""
+        # pylint: disable=unused-argument
+        if response.status_code == 429:
+            self.pause(MerakiRequestScheduler.get_retry_after(response))
+
+    def call(self, operation_name: str, operation, *args, **kwargs):
+        """Call a blocking Dashboard API operation once the scheduler allows it."""
+        read = MerakiRequestScheduler.is_read(operation_name)
+        for attempt in range(self.maximum_retries + 1):
+            self.acquire(read)
+            try:
+                return operation(*args, **kwargs)
+            except meraki.exceptions.APIError as exc:
+                if exc.status != 429 or attempt == self.maximum_retries:
+                    raise
+                self.pause(MerakiRequestScheduler.get_retry_after(exc.response))
+        return None
+
+    async def call_async(self, operation_name: str, operation, *args, **kwargs):
+        """Call an asyncio Dashboard API operation once the scheduler allows it."""
+        read = MerakiRequestScheduler.is_read(operation_name)
+        for attempt in range(self.maximum_retries + 1):
+            await self.acquire_async(read)
+            try:
+                return await operation(*args, **kwargs)
+            except meraki.exceptions.AsyncAPIError as exc:
+                if exc.status != 429 or attempt == self.maximum_retries:
+                    raise
+                self.pause(MerakiRequestScheduler.get_retry_after(exc.response))
+        return None
+
+    @staticmethod
+    def get_retry_after(response) -> float:
+        """Return the Retry-After of a 429 response in seconds (1 if missing)."""
+        try:
+            return float(response.headers['Retry-After'])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return 1.0
+
+    def __join(self, read: bool) -> float:
+        """Join the line of waiting requests and return when this request joined."""
+        with self.__lock:
+            joined = time.monotonic()
+            if read:
+                self.__waiting_reads += 1
+            else:
+                self.__waiting_writes.append(joined)
+        return joined
+
+    def __leave(self, read: bool, joined: float) -> None:
+        """Leave the line of waiting requests."""
+        with self.__lock:
+            if read:
+                self.__waiting_reads -= 1
+            else:
+                self.__waiting_writes.remove(joined)
+
+    def __take(self, read: bool, joined: float) -> float:
+        """Take a token and return 0, or return how long to wait before trying again."""
+        with self.__lock:
+            now = time.monotonic()
+            if now < self.__paused_until:
+                return self.__paused_until - now
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            overdue = now - self.maximum_write_deferral
+            if read and self.__waiting_writes and self.__waiting_writes[0] <= overdue:
+                # A write has let reads go first for long enough
+                return 1 / self.rate
+            if not read and self.__waiting_reads and joined > overdue:
+                return 1 / self.rate
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                self.requests += 1
+                return 0
+            return (1 - self.__tokens) / self.rate
+
+# Requests per second used when meraki_requests_per_second isn't set
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+
+REQUEST_SCHEDULERS = {}
+REQUEST_SCHEDULERS_LOCK = threading.Lock()
+
+def get_request_scheduler(api_key: str, rate: float = DEFAULT_REQUESTS_PER_SECOND) -> MerakiRequestScheduler:
+    """Return the scheduler shared by everything using api_key, creating it if needed.
+
+    Raises ValueError if the scheduler for api_key runs at a different rate.
+    """
+    with REQUEST_SCHEDULERS_LOCK:
+        if api_key not in REQUEST_SCHEDULERS:
+            REQUEST_SCHEDULERS[api_key] = MerakiRequestScheduler(rate=rate, burst=max(1, int(rate)))
+        scheduler = REQUEST_SCHEDULERS[api_key]
+    if scheduler.rate != rate:
+        raise ValueError(
+            f'requests for this API key are already scheduled at {scheduler.rate} per second, not {rate}')
+    return scheduler
+
+def get_config_request_scheduler(config: dict) -> MerakiRequestScheduler:
+    """Return the scheduler for the API key in config, at its meraki_requests_per_second."""
+    return get_request_scheduler(
+        config['api_key'], config.get('meraki_requests_per_second', DEFAULT_REQUESTS_PER_SECOND))
+
+class ScheduledApi:
+    """Pass through to a Dashboard API (or one of its sections), scheduling every operation."""
+
+    def __init__(self, api, scheduler: MerakiRequestScheduler, is_async: bool = False) -> None:
+        self.__api = api
+        self.__scheduler = scheduler
+        self.__is_async = is_async
+        self.__sections = {}
+
+    def __getattr__(self, name):
+        attribute = getattr(self.__api, name)
+        if name.startswith('_'):
+            return attribute
+        if not callable(attribute):
+            # A section such as appliance or devices
+            if name not in self.__sections:
+                self.__sections[name] = ScheduledApi(attribute, self.__scheduler, self.__is_async)
+            return self.__sections[name]
+        if self.__is_async:
+            async def scheduled_async(*args, **kwargs):
+                return await self.__scheduler.call_async(name, attribute, *args, **kwargs)
+            return scheduled_async
+        def scheduled(*args, **kwargs):
+            return self.__scheduler.call(name, attribute, *args, **kwargs)
+        return scheduled
+
+class SharedMerakiDashboard:
+    """One meraki.DashboardAPI, created on first use, shared by every Meraki adapter.
+
+    Attribute access is passed through to the underlying DashboardAPI
+    (e.g. dashboard.appliance.getNetworkApplianceVlan(...)). Its HTTP
+    session keeps a pool of connections so concurrent requests reuse
+    the same TLS sessions rather than opening new ones. Every call goes
+    through the request scheduler shared by everything using the API key.
+    VLANs read during the run are kept in vlan_snapshots.
+    """
+
+    def __init__(self, api_key: str, pool_size: int = 10, vlan_snapshot_max_age: float = None,
+                 scheduler: MerakiRequestScheduler = None) -> None:
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.vlan_snapshots = VlanSnapshotCache(vlan_snapshot_max_age)
+        self.scheduler = scheduler if scheduler else get_request_scheduler(api_key)
+        self.__dashboard = None
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'SharedMerakiDashboard':
+        """Create the dashboard for the API key in config, scheduled at its meraki_requests_per_second."""
+        return cls(
+            config['api_key'],
+            vlan_snapshot_max_age=config.get('vlan_snapshot_max_age'),
+            scheduler=get_config_request_scheduler(config))
+
+    def get_dashboard(self) -> ScheduledApi:
+        """Return the (scheduled) DashboardAPI, creating it if needed."""
+        with self.__lock:
+            if self.__dashboard is None:
+                dashboard = meraki.DashboardAPI(self.api_key, suppress_logging=True)
+                # The Dashboard API redirects to a shard, so pool a few hosts
+                pooled_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                # pylint: disable=protected-access
+                dashboard._session._req_session.mount('https://', pooled_adapter)
+                # The SDK retries a 429 itself, so watch responses to pause the other callers too
+                dashboard._session._req_session.hooks['response'].append(self.scheduler.observe_response)
+                self.__dashboard = ScheduledApi(dashboard, self.scheduler)
+            return self.__dashboard
+
+    def __getattr__(self, name):
+        return getattr(self.get_dashboard(), name)
+
+class SharedAsyncMerakiDashboard:
+    """One meraki.aio.AsyncDashboardAPI, created on first use inside the event loop.
+
+    Share one instance between the async Meraki adapters so they use the
+    same HTTP session and the same limit on concurrent requests. Every
+    call goes through the request scheduler. Call close() when done.
+    """
+
+    def __init__(self, api_key: str, maximum_concurrent_requests: int = 8,
+                 vlan_snapshot_max_age: float = None,
+                 scheduler: MerakiRequestScheduler = None) -> None:
+        self.api_key = api_key
+        self.maximum_concurrent_requests = maximum_concurrent_requests
+        self.vlan_snapshots = VlanSnapshotCache(vlan_snapshot_max_age)
+        self.scheduler = scheduler if scheduler else get_request_scheduler(api_key)
+        self.__dashboard = None
+        self.__scheduled_dashboard = None
+        self.__lock = asyncio.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'SharedAsyncMerakiDashboard':
+        """Create the dashboard for the API key in config, scheduled at its meraki_requests_per_second."""
+        return cls(
+            config['api_key'],
+            vlan_snapshot_max_age=config.get('vlan_snapshot_max_age'),
+            scheduler=get_config_request_scheduler(config))
+
+    async def get_dashboard(self) -> ScheduledApi:
+        """Return the (scheduled) AsyncDashboardAPI, creating it if needed."""
+        async with self.__lock:
+            if self.__dashboard is None:
+                self.__dashboard = meraki.aio.AsyncDashboardAPI(
+                    self.api_key,
+                    suppress_logging=True,
+                    maximum_concurrent_requests=self.maximum_concurrent_requests)
+                self.__scheduled_dashboard = ScheduledApi(self.__dashboard, self.scheduler, is_async=True)
+            return self.__scheduled_dashboard
+
+    async def close(self) -> None:
+        """Close the HTTP session, if one was opened."""
+        if self.__dashboard is not None:
+            await self.__dashboard.__aexit__(None, None, None)
+            self.__dashboard = None
+            self.__scheduled_dashboard = None
@@ -1,17 +1,23 @@
 import requests
 import json
+from requests.adapters import HTTPAdapter
 from ports import SecureNetworkAnalyticsSessionPort
 try:
     requests.packages.urllib3.disable_warnings()
 except:
     pass
 
+# Connections pooled for the hostgroup requests made at once, unless
+# sna_max_concurrent_requests says otherwise
+POOL_SIZE = 8
+
 class SecureNetworkAnalyticsSessionAdapter(SecureNetworkAnalyticsSessionPort):
     """Secure Network Analytics Session."""
 
     XSRF_HEADER_NAME = 'X-XSRF-TOKEN'
 
-    def __init__(self) -> None:
+    def __init__(self, pool_size: int = POOL_SIZE) -> None:
+        self.pool_size = pool_size
         self.__host = None
         self.__api_session = None
         self.__tenant_id = None
@@ -50,6 +56,7 @@ class SecureNetworkAnalyticsSessionAdapter(SecureNetworkAnalyticsSessionPort):
     def __authenticate(self, user: str, password: str) -> None:
         """Authenticate with Secure Network Analytics."""
         self.__api_session = requests.Session()
+        self.__api_session.mount('https://', HTTPAdapter(pool_maxsize=self.pool_size))
         uri = "https://" + self.__host + "/token/v2/authenticate"
         login_request_data = {
             "username": user,
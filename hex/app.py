@@ -1,3 +1,5 @@
+import asyncio
+import inspect
 from devicetableloader import DeviceTableLoader
 from ports import ActiveClientsPort, DeviceTableCsvOutPort, FixedIpReservationsPort, KnownDevicesPort, SecureNetworkAnalyticsHostGroupManagementPort
 from scan import NetorgScanner
@@ -9,12 +11,33 @@ class NetOrganizerApp():
                  active_clients_port: ActiveClientsPort,
                  fixed_ip_reservations_port: FixedIpReservationsPort,
                  device_table_csv_out_port: DeviceTableCsvOutPort,
-                 sna_hostgroup_port: SecureNetworkAnalyticsHostGroupManagementPort) -> None:
+                 sna_hostgroup_port: SecureNetworkAnalyticsHostGroupManagementPort,
+                 load_engine: str = 'columnar',
+                 vlan_ids: list = None) -> None:
         self.known_devices_port = known_devices_port
         self.active_clients_port = active_clients_port
         self.fixed_ip_reservations_port = fixed_ip_reservations_port 
         self.device_table_csv_out_port = device_table_csv_out_port
         self.sna_hostgroup_port = sna_hostgroup_port 
+        self.load_engine = load_engine
+        self.vlan_ids = vlan_ids
+        self.__event_loop = None
+
+    def __enter__(self) -> 'NetOrganizerApp':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the async ports, if any, and the event loop they ran on."""
+        if self.__event_loop is None:
+            return
+        for port in [self.active_clients_port, self.fixed_ip_reservations_port]:
+            if inspect.iscoroutinefunction(getattr(port, 'close', None)):
+                self.__run(port.close())
+        self.__event_loop.close()
+        self.__event_loop = None
 
     def do_devicetable(self) -> None:
         device_table = self.__load_device_table()
@@ -34,14 +57,14 @@ class NetOrganizerApp():
     def do_organize(self) -> None:
         device_table = self.__load_device_table() 
         self.known_devices_port.save(device_table)
-        self.fixed_ip_reservations_port.save(device_table)
+        self.__save_fixed_ip_reservations(device_table)
 
     def do_push_changes_to_sna(self) -> None:
         device_table = self.__load_device_table() 
         # Ensure things are organized before we push changes to SNA
         # Mostly this is to ensure devices have IPs
         self.known_devices_port.save(device_table)
-        self.fixed_ip_reservations_port.save(device_table) 
+        self.__save_fixed_ip_reservations(device_table)
         self.sna_hostgroup_port.update_host_groups(device_table)
 
     def __load_device_table(self):
@@ -49,5 +72,27 @@ class NetOrganizerApp():
         device_table_loader = DeviceTableLoader(
             self.known_devices_port,
             self.active_clients_port,
-            self.fixed_ip_reservations_port)
-        return device_table_loader.load_all()
\ No newline at end of file
+            self.fixed_ip_reservations_port,
+            engine=self.load_engine,
+            vlan_ids=self.vlan_ids)
+        if inspect.iscoroutinefunction(self.active_clients_port.load) or \
+                inspect.iscoroutinefunction(self.fixed_ip_reservations_port.load):
+            return self.__run(device_table_loader.load_all_async())
+        return device_table_loader.load_all()
+
+    def __save_fixed_ip_reservations(self, device_table) -> None:
+        """Save the fixed IP reservations, on the event loop if the port is async."""
+        if inspect.iscoroutinefunction(self.fixed_ip_reservations_port.save):
+            self.__run(self.fixed_ip_reservations_port.save(device_table))
+        else:
+            self.fixed_ip_reservations_port.save(device_table)
+
+    def __run(self, coroutine):
+        """Run a coroutine of the async ports.
+
+        Every coroutine runs on the same event loop, so the async Meraki
+        adapters keep one HTTP session for the whole command.
+        """
+        if self.__event_loop is None:
+            self.__event_loop = asyncio.new_event_loop()
+        return self.__event_loop.run_until_complete(coroutine)
\ No newline at end of file
@@ -2,9 +2,109 @@
 import pandas as pd
 from pandas import DataFrame
 
+# Column types of the device table. Anything not listed (mac, ip, name)
+# stays a string so it can be queried, exported and compared as before.
+DEVICE_TABLE_SCHEMA = {
+    'known': 'bool',
+    'reserved': 'bool',
+    'active': 'bool',
+    'group': 'category'
+}
+
 class DeviceTable :
-    """The device table is the heart of Network Organizer."""
+    """The device table is the heart of Network Organizer.
+
+    Each device (row) is identified by its unique MAC (if a MAC is given
+    more than once, the first is kept). Lookups by MAC and
+    by IP go through indexes rather than scanning the DataFrame. Use
+    set_ips() to change IPs so the IP index stays current. Columns are
+    typed according to DEVICE_TABLE_SCHEMA.
+    """
     def __init__(self,data) -> None:
         # pylint: disable=invalid-name
         self.df = pd.DataFrame(data)
+        self.df = self.df.astype(
+            {column: dtype for column, dtype in DEVICE_TABLE_SCHEMA.items() if column in self.df})
+        if 'mac' in self.df and not self.df['mac'].is_unique:
+            for mac in self.df.loc[self.df['mac'].duplicated(), 'mac'].unique():
+                print(f'DeviceTable: {mac} appears more than once, keeping the first')
+            self.df = self.df.drop_duplicates('mac').reset_index(drop=True)
+        macs = self.df['mac'].tolist() if 'mac' in self.df else []
+        self.__mac_index = dict(zip(macs, range(len(macs))))
+        self.__ip_index = None
+        self.__records = None
+
+    def get_macs(self) -> list:
+        """Return the MACs of every device, in table order."""
+        return list(self.__mac_index)
+
+    def get_by_mac(self, mac):
+        """Return the device (a dict of column -> value) with the given MAC or None."""
+        position = self.__mac_index.get(mac)
+        if position is None:
+            return None
+        return self.__get_records()[position]
+
+    def get_by_ip(self, ip):
+        """Return the device (a dict of column -> value) with the given IP or None."""
+        position = self.__get_ip_index().get(ip)
+        if position is None:
+            return None
+        return self.__get_records()[position]
+
+    def set_ips(self, mask, ips) -> None:
+        """Set the IPs of the devices selected by the boolean mask."""
+        self.df.loc[mask, 'ip'] = ips
+        self.__ip_index = None
+        self.__records = None
+
+    def __get_records(self) -> list:
+        """Return every device as a dict, in table order, building them if needed."""
+        if self.__records is None:
+            self.__records = self.df.to_dict('records')
+        return self.__records
+
+    def __get_ip_index(self) -> dict:
+        """Return the IP -> row position index, building it if needed."""
+        if self.__ip_index is None:
+            ips = self.df['ip'].tolist() if 'ip' in self.df else []
+            self.__ip_index = {}
+            for position, ip in enumerate(ips):
+                if ip:
+                    self.__ip_index.setdefault(ip, position)
+        return self.__ip_index
+
+class PartitionedDeviceTable :
+    """A device table split by VLAN, one DeviceTable per VLAN.
+
+    Each device is in exactly one partition. df gives every partition as
+    one DataFrame with a vlan column, so the whole table can be scanned,
+    exported and saved as before. IPs are changed per partition.
+    """
+    def __init__(self, partitions: dict) -> None:
+        self.partitions = partitions
+
+    @property
+    def df(self) -> DataFrame:
+        """Return every partition as one DataFrame with a vlan column."""
+        # pylint: disable=invalid-name
+        df = pd.concat(
+            [partition.df.assign(vlan=vlan_id) for vlan_id, partition in self.partitions.items()],
+            ignore_index=True)
+        return df.astype({column: dtype for column, dtype in DEVICE_TABLE_SCHEMA.items() if column in df})
+
+    def get_by_mac(self, mac):
+        """Return the device (a dict of column -> value) with the given MAC or None."""
+        for partition in self.partitions.values():
+            device = partition.get_by_mac(mac)
+            if device is not None:
+                return device
+        return None
 
+    def get_by_ip(self, ip):
+        """Return the device (a dict of column -> value) with the given IP or None."""
+        for partition in self.partitions.values():
+            device = partition.get_by_ip(ip)
+            if device is not None:
+                return device
+        return None
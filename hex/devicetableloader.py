@@ -1,6 +1,14 @@
 
-from ports import ActiveClientsPort, FixedIpReservationsPort, KnownDevicesPort
-from devicetable import DeviceTable
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
+import numpy as np
+import pandas as pd
+from ports import ActiveClient, ActiveClientsPort, AsyncActiveClientsPort, AsyncFixedIpReservationsPort, FixedIpReservation, FixedIpReservationsPort, KnownDevice, KnownDevicesPort
+from devicetable import DeviceTable, PartitionedDeviceTable
+
+LOAD_ENGINES = ['records', 'columnar', 'streaming']
 
 class DeviceTableBuilder :
     """Efficiently Build a DeviceTable."""
@@ -40,28 +48,175 @@ class DeviceTableBuilder :
             data.append(merged)
         return DeviceTable(data)
 
+def _by_mac(df, keep, macs):
+    """Index a source frame by MAC, keeping the first or last entry per MAC, aligned to macs."""
+    return df.drop_duplicates('mac', keep=keep).set_index('mac').reindex(macs)
+
+def reconcile_device_table(known_devices, active_clients, fixed_ip_reservations) -> DeviceTable:
+    """Build a DeviceTable from the three sources with keyed outer joins.
+
+    Gives the same table as loading one record at a time: the known name
+    and group win, an active device keeps its current lease and an
+    inactive device takes its reserved IP.
+    """
+    # pylint: disable=invalid-name
+    # pylint: disable=line-too-long
+    known_df = pd.DataFrame(known_devices or [], columns=list(KnownDevice._fields))
+    active_df = pd.DataFrame(active_clients or [], columns=list(ActiveClient._fields))
+    reserved_df = pd.DataFrame(fixed_ip_reservations or [], columns=list(FixedIpReservation._fields))
+
+    # Devices appear in the order they are first seen across the sources
+    macs = pd.unique(pd.concat([known_df['mac'], active_df['mac'], reserved_df['mac']]))
+    known = _by_mac(known_df, 'last', macs)
+    first_active = _by_mac(active_df, 'first', macs)
+    last_active = first_active if active_df['mac'].is_unique else _by_mac(active_df, 'last', macs)
+    first_reserved = _by_mac(reserved_df, 'first', macs)
+    last_reserved = first_reserved if reserved_df['mac'].is_unique else _by_mac(reserved_df, 'last', macs)
+    is_known = pd.Index(macs).isin(known_df['mac'])
+    is_active = pd.Index(macs).isin(active_df['mac'])
+    is_reserved = pd.Index(macs).isin(reserved_df['mac'])
+
+    lease = last_active['ip_address'].to_numpy()
+    reserved_ip = last_reserved['ip_address'].to_numpy()
+    name = np.where(is_known, known['name'].to_numpy(),
+        np.where(is_active, first_active['description'].to_numpy(), first_reserved['name'].to_numpy()))
+    for position in np.flatnonzero(is_active & is_reserved):
+        if lease[position] and lease[position] != reserved_ip[position]:
+            print(f'DeviceTableLoader: for {name[position]} reservation {reserved_ip[position]} differs to current lease {lease[position]}')
+            print(f'DeviceTableLoader: using current lease {lease[position]} to avoid potential for collisions')
+
+    return DeviceTable(pd.DataFrame({
+        'mac': macs,
+        'known': is_known,
+        'reserved': is_reserved,
+        'active': is_active,
+        'ip': np.where(is_active, lease, np.where(is_reserved, reserved_ip, '')),
+        'group': np.where(is_known, known['group'].to_numpy(), 'unclassified'),
+        'name': name}))
+
+def partition_sources(known_devices, active_clients, fixed_ip_reservations, vlan_ids: List[str]) -> dict:
+    """Split the three sources by VLAN, returning VLAN -> (known devices, active clients, fixed IP reservations).
+
+    A device goes to the VLAN it is active on, else the VLAN of its first
+    reservation, else the first VLAN. A partition is only given the active
+    clients and reservations from its own VLAN, so every IP in it is from
+    that VLAN's subnet. A reservation (or lease) on any other VLAN is left
+    behind from a move: it is dropped and reported, and so is removed from
+    that VLAN when the reservations are saved.
+    """
+    # pylint: disable=line-too-long
+    # Every client has to be seen before any is placed, so page in all of them
+    active_clients = list(active_clients or [])
+    fixed_ip_reservations = fixed_ip_reservations or []
+    partitions = {vlan_id: ([], [], []) for vlan_id in vlan_ids}
+    vlan_of_mac = {}
+    for active_client in active_clients:
+        vlan_of_mac.setdefault(active_client.mac, active_client.vlan_id)
+    for fixed_ip_reservation in fixed_ip_reservations:
+        vlan_of_mac.setdefault(fixed_ip_reservation.mac, fixed_ip_reservation.vlan_id)
+    def get_vlan_id(mac) -> str:
+        vlan_id = vlan_of_mac.get(mac)
+        return vlan_id if vlan_id in partitions else vlan_ids[0]
+    for known_device in known_devices or []:
+        partitions[get_vlan_id(known_device.mac)][0].append(known_device)
+    for active_client in active_clients:
+        vlan_id = get_vlan_id(active_client.mac)
+        if active_client.vlan_id == vlan_id:
+            partitions[vlan_id][1].append(active_client)
+        else:
+            print(f'DeviceTableLoader: {active_client.mac} is active on VLAN {vlan_id}, ignoring its lease {active_client.ip_address} on VLAN {active_client.vlan_id}')
+    for fixed_ip_reservation in fixed_ip_reservations:
+        vlan_id = get_vlan_id(fixed_ip_reservation.mac)
+        if fixed_ip_reservation.vlan_id == vlan_id:
+            partitions[vlan_id][2].append(fixed_ip_reservation)
+        else:
+            print(f'DeviceTableLoader: {fixed_ip_reservation.mac} has moved to VLAN {vlan_id}, dropping its reservation {fixed_ip_reservation.ip_address} on VLAN {fixed_ip_reservation.vlan_id}')
+    return partitions
+
 class DeviceTableLoader :
     """Load data into the DeviceTable."""
 
     def __init__(self, 
                  known_devices_port: KnownDevicesPort, 
-                 active_clients_port: ActiveClientsPort,
-                 fixed_ip_reservations_port: FixedIpReservationsPort) -> None:
+                 active_clients_port: Union[ActiveClientsPort, AsyncActiveClientsPort],
+                 fixed_ip_reservations_port: Union[FixedIpReservationsPort, AsyncFixedIpReservationsPort],
+                 engine: str = 'columnar',
+                 concurrent: bool = True,
+                 vlan_ids: List[str] = None) -> None:
+        if engine not in LOAD_ENGINES:
+            raise ValueError(f'unknown load engine {engine}')
         self.device_table_builder = DeviceTableBuilder()
+        self.engine = engine
+        self.concurrent = concurrent
+        self.vlan_ids = vlan_ids
         self.known_devices_port = known_devices_port
         self.active_clients_port = active_clients_port
         self.fixed_ip_reservations_port = fixed_ip_reservations_port
 
     def load_all(self) -> DeviceTable :
         """Load everything into the DeviceTable."""
-        self.__load_known()
-        self.__load_active_clients()
-        self.__load_fixed_ip_reservations()
+        return self.__build(*self.__fetch_all())
+
+    async def load_all_async(self) -> DeviceTable :
+        """Load everything into the DeviceTable from within an event loop.
+
+        Ports with an async load() (e.g. the meraki.aio adapters) are awaited
+        and blocking ports run in a worker thread, all three at once, so one
+        loop can load the device tables of many networks together.
+        """
+        ports = [self.known_devices_port, self.active_clients_port, self.fixed_ip_reservations_port]
+        return self.__build(*await asyncio.gather(*[DeviceTableLoader.__load_async(port) for port in ports]))
+
+    @staticmethod
+    async def __load_async(port):
+        """Load from a port, without blocking the event loop."""
+        if inspect.iscoroutinefunction(port.load):
+            return await port.load()
+        return await asyncio.to_thread(port.load)
+
+    def __build(self, known_devices, active_clients, fixed_ip_reservations) -> DeviceTable:
+        """Reconcile the loaded sources into the DeviceTable, partitioned by VLAN if there is more than one."""
+        if not self.vlan_ids or len(self.vlan_ids) == 1:
+            return self.__build_partition(known_devices, active_clients, fixed_ip_reservations)
+        partitions = partition_sources(known_devices, active_clients, fixed_ip_reservations, self.vlan_ids)
+        return PartitionedDeviceTable({
+            vlan_id: self.__build_partition(*sources) for vlan_id, sources in partitions.items()})
+
+    def __build_partition(self, known_devices, active_clients, fixed_ip_reservations) -> DeviceTable:
+        """Reconcile the loaded sources into a DeviceTable using the chosen engine."""
+        if self.engine == 'columnar':
+            return reconcile_device_table(known_devices, active_clients, fixed_ip_reservations)
+        self.device_table_builder = DeviceTableBuilder()
+        self.__load_known(known_devices)
+        self.__load_active_clients(active_clients)
+        self.__load_fixed_ip_reservations(fixed_ip_reservations)
         return self.device_table_builder.build()
 
-    def __load_known(self) -> None:
+    def __fetch_all(self) -> tuple:
+        """Fetch from all three ports, in parallel when concurrent.
+
+        The sources are independent of each other (two Meraki round trips
+        and a file read) so the fetch takes as long as the slowest one.
+        """
+        ports = [self.known_devices_port, self.active_clients_port, self.fixed_ip_reservations_port]
+        if self.engine == 'streaming':
+            # Active clients are paged into the DeviceTableBuilder as they arrive
+            known_devices, fixed_ip_reservations = self.__fetch([ports[0], ports[2]])
+            return known_devices, self.active_clients_port.iterate(), fixed_ip_reservations
+        return self.__fetch(ports)
+
+    def __fetch(self, ports) -> tuple:
+        """Load from each of the ports, in parallel when concurrent."""
+        if not self.concurrent:
+            return tuple(port.load() for port in ports)
+        with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+            futures = [executor.submit(port.load) for port in ports]
+            return tuple(future.result() for future in futures)
+
+    def __load_known(self, known_devices=None) -> None:
         """Load known devices into the DeviceTable."""
-        known_devices = self.known_devices_port.load()
+        if known_devices is None:
+            known_devices = self.known_devices_port.load()
         for known_device in known_devices :
             # All we know at this point is the device is known
             record = DeviceTableBuilder.generate_new_record()
@@ -70,9 +225,10 @@ class DeviceTableLoader :
             record['name'] = known_device.name
             self.device_table_builder.set_details(known_device.mac, record)
 
-    def __load_active_clients(self) -> None:
+    def __load_active_clients(self, active_clients=None) -> None:
         """Load active clients into the DeviceTable."""
-        active_clients = self.active_clients_port.load()
+        if active_clients is None:
+            active_clients = self.active_clients_port.load()
         for active_client in active_clients :
             record = self.device_table_builder.get_details(active_client.mac)
             if record:
@@ -88,10 +244,11 @@ class DeviceTableLoader :
                 record['name'] = active_client.description
                 self.device_table_builder.set_details(active_client.mac, record)
 
-    def __load_fixed_ip_reservations(self) -> None:
+    def __load_fixed_ip_reservations(self, fixed_ip_reservations=None) -> None:
         """Load fixed IP reservations into the DeviceTable."""
         # pylint: disable=line-too-long
-        fixed_ip_reservations = self.fixed_ip_reservations_port.load()
+        if fixed_ip_reservations is None:
+            fixed_ip_reservations = self.fixed_ip_reservations_port.load()
         if fixed_ip_reservations:
             #for mac, fixed_ip_reservation_details in fixed_ip_reservations.items():
             for fixed_ip_reservation in fixed_ip_reservations:
@@ -2,28 +2,51 @@
 import argparse
 import sys
 from adapters.activeclients_meraki import ActiveClientsMerakiAdapter
+from adapters.activeclients_meraki_aio import ActiveClientsMerakiAsyncAdapter
 from adapters.configuration_jsonfile import NetorgConfigurationJsonFileAdapter
 from adapters.configurationwizard import ConfigurationWizardConsoleAdapter
 from adapters.configurationwizard_sna import ConfigurationWizardForSnaConsoleAdapter
 from adapters.devicetableout_console import DeviceTableCsvOutConsoleAdapter
 from adapters.fixedipreservations_meraki import FixedIpReservationsMerakiAdapter
+from adapters.fixedipreservations_meraki_aio import FixedIpReservationsMerakiAsyncAdapter
 from adapters.knowndevices_yamlfile import KnownDevicesYamlFileAdapter
+from adapters.meraki_dashboard import SharedAsyncMerakiDashboard, SharedMerakiDashboard, get_vlans
 from adapters.sna_hostgroups import SecureNetworkAnalyticsHostGroupManagementAdapter
-from adapters.sna_session import SecureNetworkAnalyticsSessionAdapter
+from adapters.sna_session import POOL_SIZE, SecureNetworkAnalyticsSessionAdapter
 from app import NetOrganizerApp
 
+# How the Meraki adapters talk to the Dashboard API: blocking (requests,
+# with a thread pool) or asyncio (meraki.aio, on one event loop)
+MERAKI_IO = ['blocking', 'asyncio']
+
+def create_meraki_ports(config: dict) -> tuple:
+    """Create the active clients and fixed IP reservations ports for the configured meraki_io."""
+    meraki_io = config.get('meraki_io', 'blocking')
+    if meraki_io not in MERAKI_IO:
+        raise ValueError(f'unknown meraki_io {meraki_io}')
+    if meraki_io == 'asyncio':
+        dashboard = SharedAsyncMerakiDashboard.from_config(config)
+        return (ActiveClientsMerakiAsyncAdapter(config, dashboard),
+                FixedIpReservationsMerakiAsyncAdapter(config, dashboard))
+    dashboard = SharedMerakiDashboard.from_config(config)
+    return ActiveClientsMerakiAdapter(config, dashboard), FixedIpReservationsMerakiAdapter(config, dashboard)
+
 def create_net_organizer_app() -> NetOrganizerApp:
     net_organizer_configurator = NetorgConfigurationJsonFileAdapter()
     config = net_organizer_configurator.load()
+    active_clients_port, fixed_ip_reservations_port = create_meraki_ports(config)
     net_organizer_app = NetOrganizerApp(
         known_devices_port=KnownDevicesYamlFileAdapter(config),
-        active_clients_port=ActiveClientsMerakiAdapter(config),
-        fixed_ip_reservations_port=FixedIpReservationsMerakiAdapter(config),
+        active_clients_port=active_clients_port,
+        fixed_ip_reservations_port=fixed_ip_reservations_port,
         device_table_csv_out_port=DeviceTableCsvOutConsoleAdapter(config),
         sna_hostgroup_port=SecureNetworkAnalyticsHostGroupManagementAdapter(
             config,
-            sna_session_port=SecureNetworkAnalyticsSessionAdapter()
-        )
+            sna_session_port=SecureNetworkAnalyticsSessionAdapter(
+                config.get('sna_max_concurrent_requests', POOL_SIZE))
+        ),
+        load_engine=config.get('device_table_load_engine', 'columnar'),
+        vlan_ids=[vlan['vlan_id'] for vlan in get_vlans(config)]
     )
     return net_organizer_app
 
@@ -42,32 +65,32 @@ def do_configure() -> None:
 def do_scan() -> None:
     """Perform scan."""
     print("Scan")
-    net_organizer_app = create_net_organizer_app()
-    net_organizer_app.do_scan()
+    with create_net_organizer_app() as net_organizer_app:
+        net_organizer_app.do_scan()
 
 def do_devicetable() -> None:
     """Perform devicetable (export)."""
     print("Export the device table")
-    net_organizer_app = create_net_organizer_app()
-    net_organizer_app.do_devicetable()
+    with create_net_organizer_app() as net_organizer_app:
+        net_organizer_app.do_devicetable()
 
 def do_generate() -> None:
     """Perform generate (devices.yml)."""
     print("Generate")
-    net_organizer_app = create_net_organizer_app()
-    net_organizer_app.do_save_known_devices()
+    with create_net_organizer_app() as net_organizer_app:
+        net_organizer_app.do_save_known_devices()
 
 def do_organize() -> None:
     """Perform organize."""
     print("Organize")
-    net_organizer_app = create_net_organizer_app()
-    net_organizer_app.do_organize()
+    with create_net_organizer_app() as net_organizer_app:
+        net_organizer_app.do_organize()
 
 def do_push_changes_to_sna() -> None:
     """Perform push changes to SNA."""
     print("Pushing changes to Secure Network Analytics")
-    net_organizer_app = create_net_organizer_app()
-    net_organizer_app.do_push_changes_to_sna()
+    with create_net_organizer_app() as net_organizer_app:
+        net_organizer_app.do_push_changes_to_sna()
 
 def get_parser() -> argparse.ArgumentParser:
     """Figure out what the user wants to happen and make it so."""
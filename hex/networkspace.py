@@ -1,62 +1,440 @@
+import bisect
 import ipaddress
+import socket
+from abc import ABC, abstractmethod
+from collections.abc import Set
 
 # pylint: disable=missing-class-docstring
 class NetworkIsOutOfSpace(Exception):
     pass
 
+def ip_to_int(ip_address) -> int:
+    """Convert a dotted quad IPv4 address to an integer."""
+    return int(ipaddress.IPv4Address(ip_address))
+
+def int_to_ip(value) -> str:
+    """Convert an integer to a dotted quad IPv4 address."""
+    return socket.inet_ntoa(value.to_bytes(4, 'big'))
+
+def collapse_ips(list_of_ips) -> list:
+    """Collapse a list of IPs into as few ranges as possible.
+
+    Contiguous, aligned runs become CIDRs and lone addresses stay as plain
+    IPs e.g. ['192.168.128.16/30', '192.168.128.40']. Empty IPs are ignored.
+    """
+    networks = ipaddress.collapse_addresses(
+        ipaddress.IPv4Network(ip) for ip in set(list_of_ips) if ip)
+    return [ str(network.network_address) if network.prefixlen == 32 else str(network)
+        for network in networks ]
+
+class Ipv4AddressIntervals(Set) :
+    """Read-only set of IPv4 addresses backed by sorted, disjoint integer intervals.
+
+    Behaves like a set of dotted quad strings (len, in, iteration and the
+    usual set operators) without materializing every address.
+    """
+
+    def __init__(self, starts, ends) -> None:
+        self.__starts = list(starts)
+        self.__ends = list(ends)
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def __contains__(self, ip_address) -> bool:
+        try:
+            value = ip_to_int(ip_address)
+        except ValueError:
+            return False
+        index = bisect.bisect_right(self.__starts, value) - 1
+        return index >= 0 and value <= self.__ends[index]
+
+    def __iter__(self):
+        for start, end in zip(self.__starts, self.__ends):
+            for value in range(start, end + 1):
+                yield int_to_ip(value)
+
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in zip(self.__starts, self.__ends))
+
+class AllocationStrategy(ABC) :
+    """Decide which free address a device is given.
+
+    Strategies only query the network space, so the same input always
+    produces the same plan.
+    """
+
+    @abstractmethod
+    def choose(self, network_space, mac=None, group=None):
+        """Return the free address (as an integer) to allocate, or None if full."""
+
+    def prepare(self, group_sizes, group_ips=None) -> None:
+        """Called once before allocation.
+
+        group_sizes is the number of devices in each group that need an
+        address and group_ips the addresses (as integers) the group's other
+        devices already have.
+        """
+
+    def allocate_batch(self, network_space, macs, groups) -> list:
+        """Allocate an address for each device, returning them as dotted quads.
+
+        Allocates one device at a time with choose(). Override this when a
+        strategy can allocate many devices at once.
+        """
+        return [network_space.allocate_address(mac, group) for mac, group in zip(macs, groups)]
+
+class LowestFirstStrategy(AllocationStrategy) :
+    """Allocate the lowest free address."""
+
+    def choose(self, network_space, mac=None, group=None):
+        return network_space.find_lowest_free()
+
+    def allocate_batch(self, network_space, macs, groups) -> list:
+        # The lowest free addresses can be taken from the free pool a whole run at a time
+        return network_space.allocate_lowest(len(macs))
+
+class HighestFirstStrategy(AllocationStrategy) :
+    """Allocate the highest free address."""
+
+    def choose(self, network_space, mac=None, group=None):
+        return network_space.find_highest_free()
+
+class GroupBlockStrategy(AllocationStrategy) :
+    """Allocate each group's devices from an aligned block reserved for that group.
+
+    Each block is sized to the smallest power of two that holds every device
+    in the group (at least block_size), so a group collapses into one CIDR.
+    A group whose devices already have addresses in one aligned block, shared
+    with no other group, keeps that block and its new devices are added to it.
+    """
+
+    def __init__(self, block_size=4) -> None:
+        if block_size < 1 or block_size & (block_size - 1):
+            raise ValueError("block_size must be a power of two")
+        self.block_size = block_size
+        self.__group_block_sizes = {}
+        self.__blocks = {}
+        # Every group's blocks, sorted by first address
+        self.__reserved_firsts = []
+        self.__reserved_lasts = []
+
+    def prepare(self, group_sizes, group_ips=None) -> None:
+        group_ips = group_ips if group_ips else {}
+        for group, size in group_sizes.items():
+            self.__group_block_sizes[group] = self.__get_block_size(size)
+        all_ips = sorted(value for values in group_ips.values() for value in values)
+        for group, values in group_ips.items():
+            if not values:
+                continue
+            block_size = self.__get_block_size(len(values) + group_sizes.get(group, 0))
+            first = min(values) // block_size * block_size
+            last = first + block_size - 1
+            in_block = bisect.bisect_right(all_ips, last) - bisect.bisect_left(all_ips, first)
+            # Only seed the block if it holds all of the group's addresses and
+            # nobody else's (so the seeded blocks never overlap)
+            if max(values) <= last and in_block == len(values):
+                self.__reserve(group, first, last)
+
+    def __get_block_size(self, size) -> int:
+        """Return the size of a block that holds size devices."""
+        return max(self.block_size, 1 << (size - 1).bit_length())
+
+    def get_blocks(self) -> dict:
+        """Return the blocks reserved so far as group -> list of (first, last) integers."""
+        return self.__blocks
+
+    def get_block_cidrs(self) -> dict:
+        """Return the blocks reserved so far as group -> list of CIDR strings."""
+        return {
+            group: [str(cidr) for first, last in blocks
+                for cidr in ipaddress.summarize_address_range(
+                    ipaddress.IPv4Address(first), ipaddress.IPv4Address(last))]
+            for group, blocks in self.__blocks.items()}
+
+    def choose(self, network_space, mac=None, group=None):
+        blocks = self.__blocks.setdefault(group, [])
+        for first, last in blocks:
+            value = network_space.find_lowest_free(first, last)
+            if value is not None:
+                return value
+        block_size = self.__group_block_sizes.get(group, self.block_size)
+        first = network_space.find_free_block(block_size, self.__reserved_firsts, self.__reserved_lasts)
+        if first is None:
+            # No whole block left, fall back to a free address outside the
+            # other groups' blocks, and only then to any free address
+            value = self.__find_lowest_unreserved(network_space)
+            return value if value is not None else network_space.find_lowest_free()
+        self.__reserve(group, first, first + block_size - 1)
+        return first
+
+    def __reserve(self, group, first, last) -> None:
+        """Reserve the block [first, last] for the group."""
+        self.__blocks.setdefault(group, []).append((first, last))
+        index = bisect.bisect_right(self.__reserved_firsts, first)
+        self.__reserved_firsts.insert(index, first)
+        self.__reserved_lasts.insert(index, last)
+
+    def __find_lowest_unreserved(self, network_space):
+        """Return the lowest free address that is in no group's block or None."""
+        value = network_space.find_lowest_free()
+        while value is not None:
+            index = bisect.bisect_right(self.__reserved_firsts, value) - 1
+            if index < 0 or value > self.__reserved_lasts[index]:
+                return value
+            value = network_space.find_lowest_free(self.__reserved_lasts[index] + 1)
+        return None
+
+class StickyStrategy(AllocationStrategy) :
+    """Give a device the address it had before (if it is still free)."""
+
+    def __init__(self, history, fallback=None) -> None:
+        self.history = history
+        self.fallback = fallback if fallback else LowestFirstStrategy()
+
+    def choose(self, network_space, mac=None, group=None):
+        if mac in self.history:
+            try:
+                value = ip_to_int(self.history[mac])
+                if network_space.is_free(value):
+                    return value
+            except ValueError:
+                pass
+        return self.fallback.choose(network_space, mac, group)
+
+ALLOCATION_STRATEGIES = {
+    'lowest': LowestFirstStrategy,
+    'highest': HighestFirstStrategy,
+    'group_block': GroupBlockStrategy,
+    'sticky': StickyStrategy
+}
+
+def create_allocation_strategy(name='lowest', history=None) -> AllocationStrategy:
+    """Create an allocation strategy by name."""
+    if name not in ALLOCATION_STRATEGIES:
+        raise ValueError(f'unknown allocation strategy {name}')
+    if name == 'sticky':
+        return StickyStrategy(history if history else {})
+    return ALLOCATION_STRATEGIES[name]()
+
 class Ipv4PrivateNetworkSpace :
-    """IPv4 private network space."""
+    """IPv4 private network space.
 
-    def __init__(self, cidr) :
+    Free addresses are held as a sorted list of disjoint integer intervals,
+    so memory grows with the number of allocations rather than the size
+    of the subnet. Which free address is handed out is decided by the
+    allocation strategy (lowest first by default).
+    """
+
+    def __init__(self, cidr, strategy=None) :
         ip_network = ipaddress.ip_network(cidr)
         if not ip_network.is_private:
             raise ValueError("CIDR must be in the private space")
         self.__cidr = cidr
-        self.__address_set = { format(item) for item in ip_network.hosts() }
+        self.__first, self.__last = Ipv4PrivateNetworkSpace.host_bounds(ip_network)
+        # Free pool maintained incrementally by every allocation. Intervals
+        # before __free_head have been exhausted and are compacted lazily.
+        self.__free_starts = [self.__first]
+        self.__free_ends = [self.__last]
+        self.__free_head = 0
         self.__used_set = set()
+        # Size -> where the next find_free_block for that size starts looking
+        self.__block_search_from = {}
+        self.__strategy = strategy if strategy else LowestFirstStrategy()
 
-    def allocate_address(self) :
-        """Allocate an IP address."""
-        try:
-            return_address = self.get_unused_set().pop()
-            self.__used_set.add(return_address)
-            return return_address
-        except KeyError as exc:
-            raise NetworkIsOutOfSpace() from exc
+    @staticmethod
+    def host_bounds(ip_network) -> tuple:
+        """Return the first and last usable host of a network as integers."""
+        first = int(ip_network.network_address)
+        last = int(ip_network.broadcast_address)
+        if ip_network.num_addresses > 2:
+            # Exclude the network and broadcast addresses
+            first += 1
+            last -= 1
+        return first, last
+
+    def get_address_set(self) -> Ipv4AddressIntervals:
+        """Return the set of all IPv4 addresses the space."""
+        return Ipv4AddressIntervals([self.__first], [self.__last])
+
+    def get_used_set(self) -> set:
+        """Return the set of IPv4 addresses that have been allocated."""
+        return { int_to_ip(value) for value in self.__used_set }
+
+    def get_unused_set(self) -> Ipv4AddressIntervals:
+        """Return the set of IPv4 addresses that are available to be allocated."""
+        head = self.__free_head
+        return Ipv4AddressIntervals(self.__free_starts[head:], self.__free_ends[head:])
+
+    def allocate_address(self, mac=None, group=None) :
+        """Allocate an IP address chosen by the allocation strategy."""
+        value = self.__strategy.choose(self, mac, group)
+        if value is None:
+            raise NetworkIsOutOfSpace()
+        self.__allocate(value)
+        return int_to_ip(value)
+
+    def allocate_addresses(self, macs, groups=None) -> list:
+        """Allocate an IP address for each device in one call.
+
+        Gives the same result as calling allocate_address() once per device,
+        but the strategy may allocate many devices at once (see
+        AllocationStrategy.allocate_batch).
+        """
+        if groups is None:
+            groups = [None] * len(macs)
+        return self.__strategy.allocate_batch(self, macs, groups)
+
+    def allocate_lowest(self, count) -> list:
+        """Allocate the lowest count free addresses, taking whole runs from the free pool at once.
+
+        Raises NetworkIsOutOfSpace, allocating nothing, if there are fewer
+        than count free addresses.
+        """
+        if count > len(self.get_unused_set()):
+            raise NetworkIsOutOfSpace()
+        return [int_to_ip(value) for value in self.__allocate_lowest(count)]
 
     def allocate_specific_address(self, ip_address) :
         """Allocate a specific IP address."""
-        if not ip_address in self.__address_set:
+        try:
+            value = ip_to_int(ip_address)
+        except ValueError as exc:
+            raise ValueError(f'specified ip_address not in {self.__cidr}') from exc
+        if not self.__first <= value <= self.__last:
             raise ValueError(f'specified ip_address not in {self.__cidr}')
-        if ip_address in self.__used_set:
+        if not self.__allocate(value):
             raise ValueError("specified ip_address already in use")
-        self.__used_set.add(ip_address)
         return ip_address
 
-    def get_address_set(self) -> list:
-        """Return the set of all IPv4 addresses the space."""
-        return self.__address_set
+    def is_free(self, value) -> bool:
+        """Return True if the address (as an integer) is free."""
+        return self.__find_free_index(value) is not None
 
-    def get_used_set(self):
-        """Return the set of IPv4 addresses that have been allocated."""
-        return self.__used_set
+    def find_lowest_free(self, lower=None, upper=None):
+        """Return the lowest free address in [lower, upper] (as an integer) or None."""
+        lower = self.__first if lower is None else lower
+        upper = self.__last if upper is None else upper
+        head = self.__free_head
+        index = bisect.bisect_right(self.__free_starts, lower, lo=head) - 1
+        if index >= head and lower <= self.__free_ends[index]:
+            return lower
+        index += 1
+        if index < len(self.__free_starts) and self.__free_starts[index] <= upper:
+            return self.__free_starts[index]
+        return None
 
-    def get_unused_set(self) :
-        """Return the set of IPv4 addresses that are available to be allocated."""
-        return self.__address_set - self.__used_set
+    def find_highest_free(self):
+        """Return the highest free address (as an integer) or None."""
+        if self.__free_head == len(self.__free_ends):
+            return None
+        return self.__free_ends[-1]
+
+    def find_free_block(self, size, excluded_firsts=(), excluded_lasts=()):
+        """Return the first address of the lowest aligned, entirely free block or None.
+
+        The block overlaps none of the excluded [first, last] intervals,
+        given as two lists sorted by first address. Addresses are never freed
+        and the excluded intervals may only be added to between calls, so
+        there is no such block below the one the previous search for that
+        size returned. The search resumes from there rather than scanning
+        the whole free pool again.
+        """
+        lower = self.__block_search_from.get(size, self.__first)
+        head = self.__free_head
+        first_index = max(head, bisect.bisect_right(self.__free_starts, lower, lo=head) - 1)
+        for index in range(first_index, len(self.__free_starts)):
+            start = max(self.__free_starts[index], lower)
+            while True:
+                aligned = (start + size - 1) // size * size
+                if aligned + size - 1 > self.__free_ends[index]:
+                    break
+                excluded = bisect.bisect_right(excluded_firsts, aligned + size - 1) - 1
+                if excluded < 0 or excluded_lasts[excluded] < aligned:
+                    self.__block_search_from[size] = aligned
+                    return aligned
+                start = excluded_lasts[excluded] + 1
+        self.__block_search_from[size] = self.__last + 1
+        return None
+
+    def __find_free_index(self, value):
+        """Return the index of the free interval holding value, or None."""
+        head = self.__free_head
+        index = bisect.bisect_right(self.__free_starts, value, lo=head) - 1
+        if index < head or value > self.__free_ends[index]:
+            return None
+        return index
+
+    def __allocate(self, value) -> bool:
+        """Mark value as used. Return False if it is not free."""
+        index = self.__find_free_index(value)
+        if index is None:
+            return False
+        self.__take(index, value)
+        return True
+
+    def __allocate_lowest(self, count) -> list:
+        """Allocate the lowest count free addresses, of which there must be enough."""
+        values = []
+        while len(values) < count:
+            head = self.__free_head
+            start = self.__free_starts[head]
+            end = self.__free_ends[head]
+            take = min(count - len(values), end - start + 1)
+            values.extend(range(start, start + take))
+            if start + take > end:
+                self.__advance_free_head()
+            else:
+                self.__free_starts[head] = start + take
+        self.__used_set.update(values)
+        return values
+
+    def __take(self, index, value) -> None:
+        """Remove value from the free interval at index, splitting it if needed."""
+        start = self.__free_starts[index]
+        end = self.__free_ends[index]
+        if start == end:
+            if index == self.__free_head:
+                self.__advance_free_head()
+            else:
+                del self.__free_starts[index]
+                del self.__free_ends[index]
+        elif value == start:
+            self.__free_starts[index] = value + 1
+        elif value == end:
+            self.__free_ends[index] = value - 1
+        else:
+            self.__free_ends[index] = value - 1
+            self.__free_starts.insert(index + 1, value + 1)
+            self.__free_ends.insert(index + 1, end)
+        self.__used_set.add(value)
+
+    def __advance_free_head(self) -> None:
+        """Drop the exhausted interval at the head of the free pool."""
+        self.__free_head += 1
+        if self.__free_head * 2 > len(self.__free_starts):
+            del self.__free_starts[:self.__free_head]
+            del self.__free_ends[:self.__free_head]
+            self.__free_head = 0
 
 class NetworkMapper :
     """Map the device table to the network space."""
-    def __init__(self, vlan_subnet, device_table) -> None:
-        self.__network_space = Ipv4PrivateNetworkSpace(vlan_subnet)
+    def __init__(self, vlan_subnet, device_table, strategy=None) -> None:
+        self.__strategy = strategy if strategy else LowestFirstStrategy()
+        self.__network_space = Ipv4PrivateNetworkSpace(vlan_subnet, self.__strategy)
         self.__device_table = device_table
 
     def map_to_network_space(self) -> None:
         # pylint: disable=invalid-name
         for ip in self.__find_ips() :
             self.__network_space.allocate_specific_address(ip)
-        for mac in self.__find_macs_needing_ip() :
-            self.__assign_ip(mac)
+        df = self.__device_table.df
+        has_ip = df['ip'] != ''
+        self.__strategy.prepare(
+            df.loc[~has_ip, 'group'].value_counts().to_dict(),
+            {group: [ip_to_int(ip) for ip in ips] for group, ips in df.loc[has_ip].groupby('group', observed=True)['ip']})
+        self.__assign_ips()
 
     def get_network_space(self) -> Ipv4PrivateNetworkSpace:
         return self.__network_space
@@ -67,15 +445,12 @@ class NetworkMapper :
         df = self.__device_table.df
         return df.query("ip != ''")['ip'].tolist()
 
-    def __find_macs_needing_ip(self) -> list:
-        """Generate a list of MACs that do not have an IP."""
+    def __assign_ips(self) -> None:
+        """Assign an IP address to every device that does not have one."""
         # pylint: disable=invalid-name
         df = self.__device_table.df
-        return df.query("ip == ''")['mac'].tolist()
-
-    def __assign_ip(self,mac) -> None:
-        """Assign an IP address to a device identified by it's MAC."""
-        # pylint: disable=invalid-name
-        df = self.__device_table.df
-        df.loc[df["mac"] == mac, "ip"] = self.__network_space.allocate_address()
-
+        needs_ip = (df['ip'] == '').to_numpy()
+        if needs_ip.any():
+            self.__device_table.set_ips(needs_ip, self.__network_space.allocate_addresses(
+                df['mac'].to_numpy()[needs_ip].tolist(),
+                df['group'].to_numpy()[needs_ip].tolist()))
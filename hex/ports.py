@@ -1,6 +1,6 @@
 from typing import NamedTuple
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Iterator, List
 import requests
 
 from devicetable import DeviceTable
@@ -18,6 +18,7 @@ class ActiveClient(NamedTuple):
     name: str
     description: str
     ip_address: str
+    vlan_id: str = None
 
     def __str__(self) -> str:
         return f'Active client: {self.name} {self.description} with MAC {self.mac} has IP address {self.ip_address}'
@@ -26,6 +27,7 @@ class FixedIpReservation(NamedTuple):
     mac: str
     name: str
     ip_address: str
+    vlan_id: str = None
 
     def __str__(self) -> str:
         return f'Fixed IP reservation: {self.mac} {self.name} {self.ip_address}'
@@ -46,6 +48,10 @@ class ActiveClientsPort(ABC): #DONE
     def load() -> List[ActiveClient]: #DONE
         pass
 
+    def iterate(self) -> Iterator[ActiveClient]:
+        """Yield the active clients one at a time (adapters that page through them override this)."""
+        return iter(self.load())
+
 class FixedIpReservationsPort(ABC): #DONE
 
     @abstractmethod
@@ -56,6 +62,28 @@ class FixedIpReservationsPort(ABC): #DONE
     def save(device_table: DeviceTable) -> None: #DONE
         pass
 
+class AsyncActiveClientsPort(ABC):
+
+    @abstractmethod
+    async def load() -> List[ActiveClient]:
+        pass
+
+    async def close(self) -> None:
+        """Release what the port holds open (e.g. an HTTP session)."""
+
+class AsyncFixedIpReservationsPort(ABC):
+
+    @abstractmethod
+    async def load() -> List[FixedIpReservation]:
+        pass
+
+    @abstractmethod
+    async def save(device_table: DeviceTable) -> None:
+        pass
+
+    async def close(self) -> None:
+        """Release what the port holds open (e.g. an HTTP session)."""
+
 class NetorgConfigurationPort(ABC):
 
     @abstractmethod
@@ -84,6 +112,9 @@ class SecureNetworkAnalyticsHostGroupManagementPort(ABC): #TODO
     def update_host_groups(device_table: DeviceTable) -> None: #TODO
         pass
 
+    class FailedToQueryTags(Exception) :
+        pass
+
     class FailedToCreateHostGroup(Exception) :
         pass
 
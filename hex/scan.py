@@ -1,4 +1,20 @@
 """This is the main module for Netorg scanning."""
+import numpy as np
+import pandas as pd
+
+# Bits of the per-device state code
+ACTIVE = 0b0001
+RESERVED = 0b0010
+KNOWN = 0b0100
+UNCLASSIFIED = 0b1000
+
+def get_state_codes(df) -> np.ndarray:
+    """Return the state code of every device in one vectorized pass."""
+    # pylint: disable=invalid-name
+    return ((df['active'].to_numpy(dtype=np.uint8) * ACTIVE)
+        | (df['reserved'].to_numpy(dtype=np.uint8) * RESERVED)
+        | (df['known'].to_numpy(dtype=np.uint8) * KNOWN)
+        | ((df['group'] == 'unclassified').to_numpy(dtype=np.uint8) * UNCLASSIFIED))
 
 class NetorgScanner:
     """All things associated with Netorg scanning"""
@@ -9,54 +25,73 @@ class NetorgScanner:
         self.analysis = {
             'not_known_not_reserved_ACTIVE': {
                 'query': 'not known and not reserved and active',
+                'state': (KNOWN | RESERVED | ACTIVE, ACTIVE),
                 'device_names': [],
                 'action': 'New device(s)? These will be known as un-classified during the next organize'
             },
             'not_known_RESERVED_not_active': {
                 'query': 'not known and reserved and not active',
+                'state': (KNOWN | RESERVED | ACTIVE, RESERVED),
                 'device_names': [],
                 'action': 'Retired device(s)? The reserved IP will be removed during the next organize'
             },
             'not_known_RESERVED_ACTIVE': {
                 'query': 'not known and reserved and active',
+                'state': (KNOWN | RESERVED | ACTIVE, RESERVED | ACTIVE),
                 'device_names': [],
                 'action': 'These will be known as un-classified during the next organize'
             },
             'KNOWN_not_reserved_not_active': {
                 'query': 'known and not reserved and not active',
+                'state': (KNOWN | RESERVED | ACTIVE, KNOWN),
                 'device_names': [],
                 'action': 'A reserved IP will be created during the next organize'
             },
             'KNOWN_not_reserved_ACTIVE': {
                 'query': 'known and not reserved and active',
+                'state': (KNOWN | RESERVED | ACTIVE, KNOWN | ACTIVE),
                 'device_names': [],
                 'action': 'The current IP will be converted to a static IP during the next organize'
             },
             'KNOWN_RESERVED_not_active': {
                 'query': 'known and reserved and not active',
+                'state': (KNOWN | RESERVED | ACTIVE, KNOWN | RESERVED),
                 'device_names': [],
                 'action': 'These devices are currently inactive - no action will be taken during the next organize'
             },
             'KNOWN_RESERVED_ACTIVE': {
                 'query': 'known and reserved and active',
+                'state': (KNOWN | RESERVED | ACTIVE, KNOWN | RESERVED | ACTIVE),
                 'device_names': [],
                 'action': 'Normal state - no action will be taken during the next organize'
             },
             'ACTIVE_UNCLASSIFIED': {
                 'query': "active and group == 'unclassified'",
+                'state': (ACTIVE | UNCLASSIFIED, ACTIVE | UNCLASSIFIED),
                 'device_names': [],
                 'action': 'You should consider classifying them before the next organize'
             }
         }
 
     def run(self):
-        """Run the analysis updating the analysis dictionary with the findings."""
+        """Run the analysis updating the analysis dictionary with the findings.
+
+        Each device gets a state code, the devices are grouped by code once
+        and every bucket is filled from the groups whose code matches its
+        (mask, value) state.
+        """
         # pylint: disable=invalid-name
         # pylint: disable=unused-variable
         df = self.device_table.df
+        names = df['name'].to_numpy()
+        codes = get_state_codes(df)
+        positions_by_code = pd.Series(codes).groupby(codes).indices
         for k, v in self.analysis.items():
-            query_result_df = df.query(v['query'])
-            v['device_names'] = query_result_df['name'].values.tolist()
+            mask, value = v['state']
+            matching = [positions for code, positions in positions_by_code.items()
+                if int(code) & mask == value]
+            positions = np.sort(np.concatenate(matching)) if matching else []
+            v['device_names'] = names[positions].tolist()
 
     def report(self) :
         """Report on the findings discovered by run()."""
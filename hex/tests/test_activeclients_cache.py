@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+import unittest
+from adapters.activeclients_cache import POLL_OVERLAP, ActiveClientsCache
+from adapters.activeclients_meraki import ActiveClientsMerakiAdapter
+from tests.test_activeclients_meraki import ClientsDashboard
+from tests.test_meraki_dashboard import CONFIG
+
+class TestActiveClientsCache(unittest.TestCase) :
+    """Test cases for the active clients cache."""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = dict(CONFIG,
+            active_clients_timespan=3600,
+            active_clients_cache=os.path.join(self.directory.name, 'clients.json'))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_window(self) :
+        """Test that the first poll asks for the whole timespan and the next only since the last poll."""
+        dashboard = ClientsDashboard()
+        ActiveClientsMerakiAdapter(self.config, dashboard).load()
+        ActiveClientsMerakiAdapter(self.config, dashboard).load()
+        first_timespan = dashboard.calls[0][2]['timespan']
+        next_timespan = dashboard.calls[1][2]['timespan']
+        self.assertEqual(3600, first_timespan)
+        self.assertLessEqual(next_timespan, 1 + POLL_OVERLAP)
+
+    def test_merge(self) :
+        """Test that clients from earlier polls are kept until they haven't been seen for the timespan."""
+        cache = ActiveClientsCache(self.config['active_clients_cache'], 3600, 'device Q2XX-XXXX-XXXX vlan 1')
+        cache.get_window(1000)
+        list(cache.merge([{'mac': 'aaa', 'ip': '192.168.128.10'}, {'mac': 'bbb', 'ip': '192.168.128.11'}], 1000))
+        self.assertEqual(1000 + POLL_OVERLAP, cache.get_window(2000))
+        merged = cache.merge([{'mac': 'bbb', 'ip': '192.168.128.12'}], 2000)
+        self.assertEqual(
+            [('bbb', '192.168.128.12'), ('aaa', '192.168.128.10')], [(client['mac'], client['ip']) for client in merged])
+        self.assertEqual(2700 + POLL_OVERLAP, cache.get_window(4700))
+        merged = cache.merge([], 4700)
+        self.assertEqual([('bbb', '192.168.128.12')], [(client['mac'], client['ip']) for client in merged])
+        self.assertEqual(3600, cache.get_window(8300))
+
+    def test_source(self) :
+        """Test that a cache of another serial or VLAN isn't used."""
+        cache = ActiveClientsCache(self.config['active_clients_cache'], 3600, 'device Q2XX-XXXX-XXXX vlan 1')
+        list(cache.merge([{'mac': 'aaa', 'ip': '192.168.128.10'}], 1000))
+        cache = ActiveClientsCache(self.config['active_clients_cache'], 3600, 'device Q2XX-XXXX-XXXX vlan 2')
+        self.assertEqual(3600, cache.get_window(1001))
+        self.assertEqual([], list(cache.merge([], 1001)))
+
+    def test_streaming(self) :
+        """Test that each recent client is passed on before the next one is polled."""
+        cache = ActiveClientsCache(self.config['active_clients_cache'], 3600, 'device Q2XX-XXXX-XXXX vlan 1')
+        polled = []
+        def recent_clients():
+            for mac in ['aaa', 'bbb']:
+                polled.append(mac)
+                yield {'mac': mac}
+        merged = cache.merge(recent_clients(), 1000)
+        self.assertEqual('aaa', next(merged)['mac'])
+        self.assertEqual(['aaa'], polled)
+        self.assertEqual(['bbb'], [client['mac'] for client in merged])
+        self.assertTrue(os.path.exists(self.config['active_clients_cache']))
+
+    def test_fields(self) :
+        """Test that clients are cached as Dashboard API clients and a cache with other fields is ignored."""
+        cache = ActiveClientsCache(self.config['active_clients_cache'], 3600, 'device Q2XX-XXXX-XXXX vlan 1')
+        merged = list(cache.merge([{'mac': 'aaa', 'ip': '192.168.128.10', 'vlan': 1, 'usage': {}}], 1000))
+        self.assertEqual([{'mac': 'aaa', 'dhcpHostname': None, 'description': None, 'ip': '192.168.128.10', 'vlan': 1}], merged)
+        with open(self.config['active_clients_cache'], 'w', encoding='utf8') as cache_file:
+            json.dump({'source': cache.source, 'polled_at': 1000, 'clients': {
+                'aaa': {'mac': 'aaa', 'ip_address': '192.168.128.10', 'seen_at': 1000}}}, cache_file)
+        self.assertEqual(3600, cache.get_window(1001))
+        self.assertEqual([], list(cache.merge([], 1001)))
+
+    def test_from_config(self) :
+        """Test that the cache is keyed by what is polled and only created when configured."""
+        self.assertIsNone(ActiveClientsCache.from_config(CONFIG, ['1']))
+        cache = ActiveClientsCache.from_config(dict(self.config, active_clients_scope='network'), ['1', '10'])
+        self.assertEqual('network L_1 vlan 1,10', cache.source)
+        self.assertEqual(3600, cache.timespan)
@@ -0,0 +1,62 @@
+import unittest
+from adapters.activeclients_meraki import ActiveClientsMerakiAdapter
+from tests.test_meraki_dashboard import CONFIG
+
+class ClientsDashboard:
+    """Stands in for SharedMerakiDashboard, recording the clients requests."""
+
+    def __init__(self) -> None:
+        self.devices = self
+        self.networks = self
+        self.calls = []
+
+    # pylint: disable=invalid-name
+    def getDeviceClients(self, serial, **kwargs) -> list:
+        self.calls.append(('getDeviceClients', serial, kwargs))
+        return [
+            {'mac': 'aaa', 'dhcpHostname': 'a', 'description': 'A', 'ip': '192.168.128.10', 'vlan': '1'},
+            {'mac': 'bbb', 'dhcpHostname': 'b', 'description': 'B', 'ip': '192.168.10.10', 'vlan': '10'}]
+
+    def getNetworkClients(self, network_id, **kwargs) -> list:
+        self.calls.append(('getNetworkClients', network_id, kwargs))
+        # The API filters on VLAN and network clients have no dhcpHostname
+        clients = [{'id': f'k{i}', 'mac': f'cc{i}', 'description': 'C', 'ip': f'192.168.128.1{i}', 'vlan': 1}
+                   for i in range(5)]
+        starting_after = [client['id'] for client in clients].index(kwargs['startingAfter']) + 1 if 'startingAfter' in kwargs else 0
+        return clients[starting_after:starting_after + kwargs['perPage']]
+
+class TestActiveClientsScope(unittest.TestCase) :
+    """Test cases for the active_clients_scope setting."""
+
+    def test_device(self) :
+        """Test that by default the clients of the configured device are loaded."""
+        dashboard = ClientsDashboard()
+        active_clients = ActiveClientsMerakiAdapter(CONFIG, dashboard).load()
+        self.assertEqual([('getDeviceClients', 'Q2XX-XXXX-XXXX', {})], dashboard.calls)
+        self.assertEqual(['aaa'], [active_client.mac for active_client in active_clients])
+
+    def test_network(self) :
+        """Test that network scope loads the network's clients on the VLAN."""
+        dashboard = ClientsDashboard()
+        config = dict(CONFIG, active_clients_scope='network')
+        active_clients = ActiveClientsMerakiAdapter(config, dashboard).load()
+        self.assertEqual([('getNetworkClients', 'L_1', {'total_pages': 1, 'perPage': 1000, 'vlan': '1'})],
+                         dashboard.calls)
+        self.assertEqual(['cc0', 'cc1', 'cc2', 'cc3', 'cc4'], [active_client.mac for active_client in active_clients])
+        self.assertIsNone(active_clients[0].name)
+
+    def test_pages(self) :
+        """Test that iterate() pages through the network's clients, fetching a page only when needed."""
+        dashboard = ClientsDashboard()
+        adapter = ActiveClientsMerakiAdapter(dict(CONFIG, active_clients_scope='network'), dashboard)
+        adapter.per_page = 2
+        active_clients = adapter.iterate()
+        self.assertEqual('cc0', next(active_clients).mac)
+        self.assertEqual(1, len(dashboard.calls))
+        self.assertEqual(['cc1', 'cc2', 'cc3', 'cc4'], [active_client.mac for active_client in active_clients])
+        self.assertEqual([None, 'k1', 'k3'], [kwargs.get('startingAfter') for _, _, kwargs in dashboard.calls])
+
+    def test_unknown(self) :
+        """Test that an unknown scope is rejected."""
+        with self.assertRaises(ValueError):
+            ActiveClientsMerakiAdapter(dict(CONFIG, active_clients_scope='site'), ClientsDashboard())
@@ -0,0 +1,24 @@
+import os
+import tempfile
+import unittest
+from adapters.allocation_history import AllocationHistory
+from tests.test_meraki_dashboard import CONFIG
+
+class TestAllocationHistory(unittest.TestCase) :
+    """Test cases for the allocation history used by the sticky strategy."""
+
+    def test_from_config(self) :
+        """Test that there is only a history with the sticky strategy."""
+        self.assertIsNone(AllocationHistory.from_config(CONFIG))
+        history = AllocationHistory.from_config(dict(
+            CONFIG, ip_allocation_strategy='sticky', ip_allocation_history='history.json'))
+        self.assertEqual('history.json', history.filename)
+
+    def test_save(self) :
+        """Test that saving adds to the devices already remembered."""
+        with tempfile.TemporaryDirectory() as directory:
+            history = AllocationHistory(os.path.join(directory, 'history.json'))
+            self.assertEqual({}, history.load())
+            history.save({'aaa': {'ip': '192.168.128.10', 'name': 'A'}})
+            history.save({'bbb': {'ip': '192.168.128.11', 'name': 'B'}})
+            self.assertEqual({'aaa': '192.168.128.10', 'bbb': '192.168.128.11'}, history.load())
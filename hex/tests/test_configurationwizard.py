@@ -0,0 +1,91 @@
+import threading
+import unittest
+from adapters.configurationwizard import MerakiTopology, MerakiWrapper
+from adapters.meraki_dashboard import MerakiRequestScheduler, ScheduledApi, SharedMerakiDashboard, get_request_scheduler
+
+class TopologyDashboard:
+    """Stands in for meraki.DashboardAPI with an org of many networks."""
+
+    def __init__(self, number_of_networks) -> None:
+        self.organizations = self
+        self.networks = self
+        self.appliance = self
+        self.number_of_networks = number_of_networks
+        self.fetched = set()
+        self.vlan_reads = 0
+        self.lock = threading.Lock()
+        self.all_fetched = threading.Event()
+
+    def __fetched(self, what, network_id) -> None:
+        with self.lock:
+            self.fetched.add((what, network_id))
+            if len(self.fetched) == 2 * self.number_of_networks:
+                self.all_fetched.set()
+
+    # pylint: disable=invalid-name
+    def getOrganizations(self) -> list:
+        return [{'id': '1'}]
+
+    def getOrganizationNetworks(self, org_id) -> list:
+        return [{'id': f'L_{i}', 'name': f'Network {i}'} for i in range(self.number_of_networks)]
+
+    def getNetworkDevices(self, network_id) -> list:
+        self.__fetched('devices', network_id)
+        return [{'model': 'MX64', 'serial': f'Q2XX-{network_id}'}]
+
+    def getNetworkApplianceVlans(self, network_id) -> list:
+        self.__fetched('vlans', network_id)
+        return [{'id': 1, 'name': 'Default', 'subnet': '192.168.128.0/24'},
+                {'id': 2, 'name': 'Guest', 'subnet': '192.168.2.0/24'}]
+
+    def getNetworkApplianceVlan(self, network_id, vlan_id) -> dict:
+        self.vlan_reads += 1
+        return {'id': vlan_id, 'subnet': '192.168.2.0/24'}
+
+class TestMerakiTopology(unittest.TestCase) :
+    """Test cases for the topology prefetch in MerakiWrapper.initialize."""
+
+    def test_prefetch(self) :
+        """Test that every network is fetched while the user chooses and the choice needs no more requests."""
+        dashboard = TopologyDashboard(100)
+        meraki_wrapper = MerakiWrapper('0123456789abcdef0123456789abcdef01234567')
+        meraki_wrapper.dashboard = dashboard
+        meraki_wrapper.topology = MerakiTopology(dashboard)
+        def chooser_func(thing, choices) -> str:
+            if thing == 'network':
+                self.assertTrue(dashboard.all_fetched.wait(timeout=10))
+                return '43'
+            return '2'
+        meraki_wrapper.initialize(chooser_func)
+        self.assertEqual('L_42', meraki_wrapper.get_network_id())
+        self.assertEqual('Q2XX-L_42', meraki_wrapper.get_serial_id())
+        self.assertEqual(2, meraki_wrapper.get_vlan_id())
+        self.assertEqual('192.168.2.0/24', meraki_wrapper.get_vlan_subnet())
+        self.assertEqual(0, dashboard.vlan_reads)
+
+    def test_scheduled(self) :
+        """Test that the wizard's requests, prefetch included, all go through the request scheduler."""
+        scheduler = MerakiRequestScheduler(rate=1000, burst=10)
+        dashboard = TopologyDashboard(20)
+        meraki_wrapper = MerakiWrapper('0123456789abcdef0123456789abcdef01234567', ScheduledApi(dashboard, scheduler))
+        def chooser_func(thing, choices) -> str:
+            if thing == 'network':
+                self.assertTrue(dashboard.all_fetched.wait(timeout=10))
+            return '1'
+        meraki_wrapper.initialize(chooser_func)
+        # The org, its networks, then the devices and VLANs of every network
+        self.assertEqual(2 + 2 * 20, scheduler.requests)
+
+    def test_shared_dashboard(self) :
+        """Test that by default the wizard uses the dashboard scheduled for its API key."""
+        api_key = 'configurationwizard0123456789abcdef0123'
+        meraki_wrapper = MerakiWrapper(api_key)
+        self.assertIsInstance(meraki_wrapper.dashboard, SharedMerakiDashboard)
+        self.assertIs(get_request_scheduler(api_key), meraki_wrapper.dashboard.scheduler)
+
+    def test_not_started(self) :
+        """Test that a network whose fetch hasn't started is fetched straight away."""
+        dashboard = TopologyDashboard(1)
+        topology = MerakiTopology(dashboard)
+        self.assertEqual('Q2XX-L_0', topology.get_devices('L_0')[0]['serial'])
+        self.assertEqual({('devices', 'L_0')}, dashboard.fetched)
@@ -1,8 +1,13 @@
-from typing import List
+from typing import Iterator, List
+import asyncio
+import contextlib
+import io
+import threading
 import unittest
+import pandas as pd
 from devicetable import DeviceTable
 from devicetableloader import DeviceTableLoader
-from ports import ActiveClient, ActiveClientsPort, DeviceTableCsvOutPort, FixedIpReservation, FixedIpReservationsPort, KnownDevice, KnownDevicesPort
+from ports import ActiveClient, ActiveClientsPort, AsyncActiveClientsPort, AsyncFixedIpReservationsPort, DeviceTableCsvOutPort, FixedIpReservation, FixedIpReservationsPort, KnownDevice, KnownDevicesPort
 
 # Test table
 #
@@ -177,3 +182,223 @@ class TestDeviceTableLoader(unittest.TestCase) :
         for mac in expected :
             self.assertIn(mac,actual)
         self.assertEqual(len(expected),len(actual))
+
+class TestColumnarEngine(unittest.TestCase) :
+    """Test that the columnar engine builds the same table as the records engine."""
+
+    @staticmethod
+    def load_both(known_devices_port, active_clients_port, fixed_ip_reservations_port) -> tuple:
+        """Load the same sources with each engine."""
+        return tuple(
+            DeviceTableLoader(known_devices_port, active_clients_port, fixed_ip_reservations_port, engine).load_all().df
+            for engine in ['records', 'columnar'])
+
+    def test_equivalent(self) :
+        """Test equivalence on the standard test table."""
+        records_df, columnar_df = self.load_both(
+            KnownDevicesTestAdapter(), ActiveClientsTestAdapter(), FixedIpReservationsTestAdapter())
+        pd.testing.assert_frame_equal(records_df, columnar_df)
+
+    def test_equivalent_duplicates(self) :
+        """Test equivalence when a source lists a MAC more than once."""
+        known_devices_port = KnownDevicesTestAdapter()
+        known_devices_port.list_of_known_devices = KnownDevicesTestAdapter.list_of_known_devices + [
+            KnownDevice(name='Meerkat 2', mac='baa', group='laptops')]
+        active_clients_port = ActiveClientsTestAdapter()
+        active_clients_port.list_of_active_clients = ActiveClientsTestAdapter.list_of_active_clients + [
+            ActiveClient(mac='aab', name=None, description='HS110', ip_address='192.168.128.205'),
+            ActiveClient(mac='ccc', name=None, description=None, ip_address=None)]
+        fixed_ip_reservations_port = FixedIpReservationsTestAdapter()
+        fixed_ip_reservations_port.list_of_fixed_ip_reservations = FixedIpReservationsTestAdapter.list_of_fixed_ip_reservations + [
+            FixedIpReservation(mac='aba', ip_address='192.168.128.192', name='Work Laptop 2'),
+            FixedIpReservation(mac='ccc', ip_address='192.168.128.193', name='CCC')]
+        records_df, columnar_df = self.load_both(
+            known_devices_port, active_clients_port, fixed_ip_reservations_port)
+        pd.testing.assert_frame_equal(records_df, columnar_df)
+
+    def test_empty(self) :
+        """Test equivalence when every source is empty."""
+        known_devices_port = KnownDevicesTestAdapter()
+        known_devices_port.list_of_known_devices = []
+        active_clients_port = ActiveClientsTestAdapter()
+        active_clients_port.list_of_active_clients = []
+        fixed_ip_reservations_port = FixedIpReservationsTestAdapter()
+        fixed_ip_reservations_port.list_of_fixed_ip_reservations = []
+        _, columnar_df = self.load_both(
+            known_devices_port, active_clients_port, fixed_ip_reservations_port)
+        self.assertEqual(0, columnar_df.shape[0])
+
+class TestStreamingEngine(unittest.TestCase) :
+    """Test the streaming engine."""
+
+    def test_streaming(self) :
+        """Test that active clients are taken from iterate() and give the same table as the records engine."""
+        class StreamingActiveClientsAdapter(ActiveClientsTestAdapter):
+            def load(self) -> List[ActiveClient]:
+                raise AssertionError('the streaming engine should not load every active client at once')
+
+            def iterate(self) -> Iterator[ActiveClient]:
+                yield from ActiveClientsTestAdapter.list_of_active_clients
+
+        records_df = DeviceTableLoader(
+            KnownDevicesTestAdapter(), ActiveClientsTestAdapter(), FixedIpReservationsTestAdapter(), 'records').load_all().df
+        streaming_df = DeviceTableLoader(
+            KnownDevicesTestAdapter(), StreamingActiveClientsAdapter(), FixedIpReservationsTestAdapter(), 'streaming').load_all().df
+        pd.testing.assert_frame_equal(records_df, streaming_df)
+
+class TestConcurrentLoad(unittest.TestCase) :
+    """Test that load_all fetches from the ports in parallel."""
+
+    def test_concurrent(self) :
+        """Each port waits for the other two, so this only completes if all three load at once."""
+        barrier = threading.Barrier(3, timeout=5)
+
+        class WaitingKnownDevicesAdapter(KnownDevicesTestAdapter):
+            def load(self) -> List[KnownDevice]:
+                barrier.wait()
+                return super().load()
+
+        class WaitingActiveClientsAdapter(ActiveClientsTestAdapter):
+            def load(self) -> List[ActiveClient]:
+                barrier.wait()
+                return super().load()
+
+        class WaitingFixedIpReservationsAdapter(FixedIpReservationsTestAdapter):
+            def load(self) -> List[FixedIpReservation]:
+                barrier.wait()
+                return super().load()
+
+        df = DeviceTableLoader(
+            WaitingKnownDevicesAdapter(),
+            WaitingActiveClientsAdapter(),
+            WaitingFixedIpReservationsAdapter(),
+            concurrent=True).load_all().df
+        self.assertEqual(TEST_TABLE_SIZE, df.shape[0])
+
+    def test_sequential(self) :
+        """Test that the sequential mode builds the same table."""
+        concurrent_df, sequential_df = [
+            DeviceTableLoader(KnownDevicesTestAdapter(), ActiveClientsTestAdapter(),
+                              FixedIpReservationsTestAdapter(), concurrent=concurrent).load_all().df
+            for concurrent in [True, False]]
+        pd.testing.assert_frame_equal(concurrent_df, sequential_df)
+
+class TestAsyncLoad(unittest.TestCase) :
+    """Test load_all_async with a mix of async and blocking ports."""
+
+    def test_load_all_async(self) :
+        """Test that the async path builds the same table as load_all."""
+
+        class AsyncActiveClientsTestAdapter(AsyncActiveClientsPort):
+            async def load(self) -> List[ActiveClient]:
+                await asyncio.sleep(0)
+                return ActiveClientsTestAdapter.list_of_active_clients
+
+        class AsyncFixedIpReservationsTestAdapter(AsyncFixedIpReservationsPort):
+            async def load(self) -> List[FixedIpReservation]:
+                await asyncio.sleep(0)
+                return FixedIpReservationsTestAdapter.list_of_fixed_ip_reservations
+
+            async def save(self, device_table: DeviceTable) -> None:
+                pass
+
+        async_df = asyncio.run(DeviceTableLoader(
+            KnownDevicesTestAdapter(),
+            AsyncActiveClientsTestAdapter(),
+            AsyncFixedIpReservationsTestAdapter()).load_all_async()).df
+        df = DeviceTableLoader(
+            KnownDevicesTestAdapter(),
+            ActiveClientsTestAdapter(),
+            FixedIpReservationsTestAdapter()).load_all().df
+        pd.testing.assert_frame_equal(df, async_df)
+
+class TestPartitionedLoad(unittest.TestCase) :
+    """Test loading a device table partitioned by VLAN."""
+
+    def setUp(self) -> None:
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+
+    def tearDown(self) -> None:
+        self.stdout.__exit__(None, None, None)
+
+    def test_partitions(self) :
+        """Test that each device goes to the VLAN it is active on, else reserved on, else the first VLAN."""
+        active_clients_port = ActiveClientsTestAdapter()
+        active_clients_port.list_of_active_clients = [
+            active_client._replace(vlan_id='10' if active_client.mac == 'bab' else '1')
+            for active_client in ActiveClientsTestAdapter.list_of_active_clients]
+        fixed_ip_reservations_port = FixedIpReservationsTestAdapter()
+        fixed_ip_reservations_port.list_of_fixed_ip_reservations = [
+            fixed_ip_reservation._replace(vlan_id='10' if fixed_ip_reservation.mac in ('bba', 'bbb') else '1')
+            for fixed_ip_reservation in FixedIpReservationsTestAdapter.list_of_fixed_ip_reservations]
+        for engine in ['records', 'columnar']:
+            device_table = DeviceTableLoader(
+                KnownDevicesTestAdapter(), active_clients_port, fixed_ip_reservations_port,
+                engine, vlan_ids=['1', '10']).load_all()
+            self.assertEqual(['1', '10'], list(device_table.partitions))
+            # bbb is active on VLAN 1 so its reservation on VLAN 10 is left behind from a move
+            self.assertEqual(['bab', 'bba'], sorted(device_table.partitions['10'].df['mac']))
+            self.assertFalse(device_table.get_by_mac('bbb')['reserved'])
+            self.assertEqual('192.168.128.191', device_table.get_by_mac('bba')['ip'])
+            df = device_table.df
+            self.assertTrue(df['mac'].is_unique)
+            self.assertEqual(sorted(DeviceTableLoader(
+                KnownDevicesTestAdapter(), ActiveClientsTestAdapter(), FixedIpReservationsTestAdapter(),
+                engine).load_all().df['mac']), sorted(df['mac']))
+            self.assertEqual('1', df.set_index('mac').loc['baa', 'vlan'])
+            self.assertEqual('10', df.set_index('mac').loc['bba', 'vlan'])
+
+    def test_reserved_on_two_vlans(self) :
+        """Test that a device reserved on two VLANs keeps the reservation on its first and drops the other."""
+        fixed_ip_reservations_port = FixedIpReservationsTestAdapter()
+        fixed_ip_reservations_port.list_of_fixed_ip_reservations = [
+            FixedIpReservation(mac='baa', ip_address='192.168.128.10', name='Meerkat', vlan_id='1'),
+            FixedIpReservation(mac='baa', ip_address='192.168.10.10', name='Meerkat', vlan_id='10')]
+        for engine in ['records', 'columnar']:
+            device_table = DeviceTableLoader(
+                KnownDevicesTestAdapter(), ActiveClientsTestAdapter(), fixed_ip_reservations_port,
+                engine, vlan_ids=['1', '10']).load_all()
+            self.assertEqual('192.168.128.10', device_table.partitions['1'].get_by_mac('baa')['ip'])
+            self.assertIsNone(device_table.partitions['10'].get_by_mac('baa'))
+
+class TestDeviceTable(unittest.TestCase) :
+    """Test cases for DeviceTable lookups."""
+
+    devices = [
+        {'mac': 'aab', 'known': False, 'reserved': False, 'active': True,
+         'ip': '192.168.128.10', 'group': '', 'name': 'JASCHAMB-M-XRDP'},
+        {'mac': 'baa', 'known': True, 'reserved': False, 'active': False,
+         'ip': '', 'group': 'printers', 'name': 'Aura-6141'}]
+
+    def test_get_by_mac(self) :
+        """Test lookup of a device by MAC."""
+        device_table = DeviceTable(self.devices)
+        self.assertEqual('Aura-6141', device_table.get_by_mac('baa')['name'])
+        self.assertIsNone(device_table.get_by_mac('zzz'))
+
+    def test_get_by_ip(self) :
+        """Test lookup of a device by IP, including after IPs change."""
+        device_table = DeviceTable(self.devices)
+        self.assertEqual('aab', device_table.get_by_ip('192.168.128.10')['mac'])
+        self.assertIsNone(device_table.get_by_ip(''))
+        device_table.set_ips(device_table.df['ip'] == '', ['192.168.128.11'])
+        self.assertEqual('baa', device_table.get_by_ip('192.168.128.11')['mac'])
+
+    def test_duplicate_mac(self) :
+        """Test that a duplicate MAC is dropped, keeping the first, with a warning."""
+        duplicate = dict(self.devices[0], name='Duplicate')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            device_table = DeviceTable(self.devices + [duplicate])
+        self.assertEqual(['aab', 'baa'], device_table.get_macs())
+        self.assertEqual('JASCHAMB-M-XRDP', device_table.get_by_mac('aab')['name'])
+        self.assertEqual('aab', device_table.get_by_ip('192.168.128.10')['mac'])
+        self.assertIn('aab', output.getvalue())
+
+    def test_schema(self) :
+        """Test that the flags are booleans and the group is categorical."""
+        df = DeviceTable(self.devices).df
+        for column in ['known', 'reserved', 'active']:
+            self.assertEqual('bool', df[column].dtype)
+        self.assertEqual('category', df['group'].dtype)
@@ -0,0 +1,94 @@
+import contextlib
+import io
+import unittest
+from devicetableloader import DeviceTableLoader
+from adapters.fixedipreservations_meraki import FixedIpReservationsMerakiAdapter, fingerprint_fixed_ip_reservations
+from adapters.meraki_dashboard import VlanSnapshotCache
+from ports import KnownDevice
+from tests.test_meraki_dashboard import CONFIG
+
+class MultiVlanDashboard:
+    """Stands in for SharedMerakiDashboard with two VLANs, counting the reads and writes of each."""
+
+    def __init__(self) -> None:
+        self.vlan_snapshots = VlanSnapshotCache()
+        self.appliance = self
+        self.reads = {'1': 0, '10': 0}
+        self.writes = {'1': 0, '10': 0}
+        self.vlans = {
+            '1': {'fixedIpAssignments': {'kra': {'ip': '192.168.128.10', 'name': 'kra'}}},
+            '10': {'fixedIpAssignments': {'krb': {'ip': '192.168.10.10', 'name': 'krb'}}}}
+
+    # pylint: disable=invalid-name
+    def getNetworkApplianceVlan(self, network_id, vlan_id) -> dict:
+        self.reads[vlan_id] += 1
+        return self.vlans[vlan_id]
+
+    def updateNetworkApplianceVlan(self, network_id, vlan_id, fixedIpAssignments) -> dict:
+        self.writes[vlan_id] += 1
+        self.vlans[vlan_id] = {'fixedIpAssignments': fixedIpAssignments}
+        return self.vlans[vlan_id]
+
+class ListPort:
+    """A port that loads a fixed list."""
+
+    def __init__(self, items) -> None:
+        self.items = items
+
+    def load(self) -> list:
+        return self.items
+
+class TestMultiVlanOrganize(unittest.TestCase) :
+    """Test cases for organizing several VLANs in one run."""
+
+    def test_one_write_per_vlan(self) :
+        """Test that each VLAN is read once, mapped into its own subnet and only written if it changed."""
+        config = dict(CONFIG, vlans=[
+            {'vlan_id': 1, 'vlan_subnet': '192.168.128.0/24'},
+            {'vlan_id': 10, 'vlan_subnet': '192.168.10.0/24'}])
+        dashboard = MultiVlanDashboard()
+        adapter = FixedIpReservationsMerakiAdapter(config, dashboard)
+        known_devices = [
+            KnownDevice(name=name, mac=name, group='servers') for name in ['kra', 'krb', 'new']]
+        device_table = DeviceTableLoader(
+            ListPort(known_devices), ListPort([]), adapter, vlan_ids=['1', '10']).load_all()
+        with contextlib.redirect_stdout(io.StringIO()):
+            adapter.save(device_table)
+        self.assertEqual({'1': 1, '10': 1}, dashboard.reads)
+        self.assertEqual({'1': 1, '10': 0}, dashboard.writes)
+        self.assertEqual(1, dashboard.vlan_snapshots.writes_avoided)
+        self.assertEqual(['kra', 'new'], sorted(dashboard.vlans['1']['fixedIpAssignments']))
+        self.assertTrue(dashboard.vlans['1']['fixedIpAssignments']['new']['ip'].startswith('192.168.128.'))
+        self.assertEqual('192.168.10.10', device_table.get_by_mac('krb')['ip'])
+
+    def test_moved_reservation(self) :
+        """Test that a device reserved on both VLANs keeps one reservation, in its VLAN's subnet."""
+        config = dict(CONFIG, vlans=[
+            {'vlan_id': 1, 'vlan_subnet': '192.168.128.0/24'},
+            {'vlan_id': 10, 'vlan_subnet': '192.168.10.0/24'}])
+        dashboard = MultiVlanDashboard()
+        dashboard.vlans['10']['fixedIpAssignments']['kra'] = {'ip': '192.168.10.11', 'name': 'kra'}
+        adapter = FixedIpReservationsMerakiAdapter(config, dashboard)
+        known_devices = [KnownDevice(name=name, mac=name, group='servers') for name in ['kra', 'krb']]
+        with contextlib.redirect_stdout(io.StringIO()):
+            device_table = DeviceTableLoader(
+                ListPort(known_devices), ListPort([]), adapter, vlan_ids=['1', '10']).load_all()
+            adapter.save(device_table)
+        self.assertEqual({'1': 0, '10': 1}, dashboard.writes)
+        self.assertEqual(['kra'], sorted(dashboard.vlans['1']['fixedIpAssignments']))
+        self.assertEqual('192.168.128.10', dashboard.vlans['1']['fixedIpAssignments']['kra']['ip'])
+        self.assertEqual(['krb'], sorted(dashboard.vlans['10']['fixedIpAssignments']))
+
+class TestFingerprint(unittest.TestCase) :
+    """Test cases for fingerprint_fixed_ip_reservations."""
+
+    def test_order(self) :
+        """Test that the fingerprint ignores order."""
+        self.assertEqual(
+            fingerprint_fixed_ip_reservations({
+                'aaa': {'ip': '192.168.128.10', 'name': 'A'},
+                'bbb': {'ip': '192.168.128.11', 'name': 'B'}}),
+            fingerprint_fixed_ip_reservations({
+                'bbb': {'name': 'B', 'ip': '192.168.128.11'},
+                'aaa': {'name': 'A', 'ip': '192.168.128.10'}}))
+        self.assertEqual(fingerprint_fixed_ip_reservations(None), fingerprint_fixed_ip_reservations({}))
@@ -0,0 +1,173 @@
+import asyncio
+import contextlib
+import io
+import unittest
+from app import NetOrganizerApp
+from devicetableloader import DeviceTableLoader
+from netorg import create_meraki_ports
+from adapters.activeclients_meraki import ActiveClientsMerakiAdapter
+from adapters.activeclients_meraki_aio import ActiveClientsMerakiAsyncAdapter
+from adapters.fixedipreservations_meraki import FixedIpReservationsMerakiAdapter
+from adapters.fixedipreservations_meraki_aio import FixedIpReservationsMerakiAsyncAdapter
+from ports import KnownDevice
+from tests.test_activeclients_meraki import ClientsDashboard
+from tests.test_fixedipreservations_meraki import ListPort, MultiVlanDashboard
+from tests.test_meraki_dashboard import CONFIG
+
+VLANS_CONFIG = {
+    'api_key': CONFIG['api_key'],
+    'serial_id': CONFIG['serial_id'],
+    'network_id': CONFIG['network_id'],
+    'vlans': [
+        {'vlan_id': 1, 'vlan_subnet': '192.168.128.0/24'},
+        {'vlan_id': 10, 'vlan_subnet': '192.168.10.0/24'}]
+}
+
+class AsyncMultiVlanDashboard(MultiVlanDashboard):
+    """Stands in for SharedAsyncMerakiDashboard with two VLANs."""
+
+    async def get_dashboard(self):
+        return self
+
+    # pylint: disable=invalid-name
+    async def getNetworkApplianceVlan(self, network_id, vlan_id) -> dict:
+        return super().getNetworkApplianceVlan(network_id, vlan_id)
+
+    async def updateNetworkApplianceVlan(self, network_id, vlan_id, fixedIpAssignments) -> dict:
+        return super().updateNetworkApplianceVlan(network_id, vlan_id, fixedIpAssignments)
+
+    async def close(self) -> None:
+        self.closed = True
+
+class AsyncClientsDashboard(ClientsDashboard):
+    """Stands in for SharedAsyncMerakiDashboard, recording the clients requests."""
+
+    async def get_dashboard(self):
+        return self
+
+    # pylint: disable=invalid-name
+    async def getDeviceClients(self, serial, **kwargs) -> list:
+        return super().getDeviceClients(serial, **kwargs)
+
+    async def getNetworkClients(self, network_id, **kwargs) -> list:
+        return super().getNetworkClients(network_id, **kwargs)
+
+    async def close(self) -> None:
+        self.closed = True
+
+class QuietAsyncClientsDashboard(AsyncClientsDashboard):
+    """An async clients dashboard whose device has no recent clients."""
+
+    # pylint: disable=invalid-name
+    async def getDeviceClients(self, serial, **kwargs) -> list:
+        self.calls.append(('getDeviceClients', serial, kwargs))
+        return []
+
+class KnownDevicesListPort(ListPort):
+    """A known devices port that loads a fixed list and keeps the device table it saves."""
+
+    def __init__(self, items) -> None:
+        super().__init__(items)
+        self.saved = None
+
+    def save(self, device_table) -> None:
+        self.saved = device_table
+
+class TestActiveClientsMerakiAsyncAdapter(unittest.TestCase) :
+    """Test cases for ActiveClientsMerakiAsyncAdapter."""
+
+    def test_device(self) :
+        """Test that the clients of the configured device on the VLAN are loaded."""
+        dashboard = AsyncClientsDashboard()
+        active_clients = asyncio.run(ActiveClientsMerakiAsyncAdapter(CONFIG, dashboard).load())
+        self.assertEqual([('getDeviceClients', 'Q2XX-XXXX-XXXX', {})], dashboard.calls)
+        self.assertEqual(['aaa'], [active_client.mac for active_client in active_clients])
+
+    def test_vlans(self) :
+        """Test that the clients on every configured VLAN are loaded."""
+        dashboard = AsyncClientsDashboard()
+        active_clients = asyncio.run(ActiveClientsMerakiAsyncAdapter(VLANS_CONFIG, dashboard).load())
+        self.assertEqual({'aaa': '1', 'bbb': '10'}, {
+            active_client.mac: active_client.vlan_id for active_client in active_clients})
+
+    def test_network(self) :
+        """Test that network scope loads every page of the network's clients on the VLAN."""
+        dashboard = AsyncClientsDashboard()
+        config = dict(CONFIG, active_clients_scope='network', active_clients_timespan=3600)
+        active_clients = asyncio.run(ActiveClientsMerakiAsyncAdapter(config, dashboard).load())
+        self.assertEqual([('getNetworkClients', 'L_1', {
+            'total_pages': 'all', 'perPage': 1000, 'vlan': '1', 'timespan': 3600})], dashboard.calls)
+        self.assertEqual(5, len(active_clients))
+
+class TestFixedIpReservationsMerakiAsyncAdapter(unittest.TestCase) :
+    """Test cases for FixedIpReservationsMerakiAsyncAdapter."""
+
+    def test_vlans(self) :
+        """Test that every VLAN is read once, mapped into its own subnet and only written if it changed."""
+        dashboard = AsyncMultiVlanDashboard()
+        adapter = FixedIpReservationsMerakiAsyncAdapter(VLANS_CONFIG, dashboard)
+        known_devices = [
+            KnownDevice(name=name, mac=name, group='servers') for name in ['kra', 'krb', 'new']]
+        async def organize():
+            device_table = await DeviceTableLoader(
+                ListPort(known_devices), ListPort([]), adapter, vlan_ids=['1', '10']).load_all_async()
+            await adapter.save(device_table)
+            return device_table
+        with contextlib.redirect_stdout(io.StringIO()):
+            device_table = asyncio.run(organize())
+        self.assertEqual({'1': 1, '10': 1}, dashboard.reads)
+        self.assertEqual({'1': 1, '10': 0}, dashboard.writes)
+        self.assertEqual(['kra', 'new'], sorted(dashboard.vlans['1']['fixedIpAssignments']))
+        self.assertTrue(dashboard.vlans['1']['fixedIpAssignments']['new']['ip'].startswith('192.168.128.'))
+        self.assertEqual('192.168.10.10', device_table.get_by_mac('krb')['ip'])
+
+    def test_one_vlan(self) :
+        """Test that a single VLAN is saved from an unpartitioned device table."""
+        dashboard = AsyncMultiVlanDashboard()
+        adapter = FixedIpReservationsMerakiAsyncAdapter(CONFIG, dashboard)
+        known_devices = [KnownDevice(name=name, mac=name, group='servers') for name in ['kra', 'new']]
+        async def organize():
+            device_table = await DeviceTableLoader(
+                ListPort(known_devices), ListPort([]), adapter).load_all_async()
+            await adapter.save(device_table)
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(organize())
+        self.assertEqual({'1': 1, '10': 0}, dashboard.writes)
+        self.assertEqual(['kra', 'new'], sorted(dashboard.vlans['1']['fixedIpAssignments']))
+
+class TestNetOrganizerAppAsync(unittest.TestCase) :
+    """Test cases for running the app on the async Meraki adapters."""
+
+    def test_create_meraki_ports(self) :
+        """Test that meraki_io chooses the adapters and the async ones share one dashboard."""
+        active_clients_port, fixed_ip_reservations_port = create_meraki_ports(CONFIG)
+        self.assertIsInstance(active_clients_port, ActiveClientsMerakiAdapter)
+        self.assertIsInstance(fixed_ip_reservations_port, FixedIpReservationsMerakiAdapter)
+        active_clients_port, fixed_ip_reservations_port = create_meraki_ports(dict(CONFIG, meraki_io='asyncio'))
+        self.assertIsInstance(active_clients_port, ActiveClientsMerakiAsyncAdapter)
+        self.assertIsInstance(fixed_ip_reservations_port, FixedIpReservationsMerakiAsyncAdapter)
+        self.assertIs(active_clients_port.dashboard, fixed_ip_reservations_port.dashboard)
+        with self.assertRaises(ValueError):
+            create_meraki_ports(dict(CONFIG, meraki_io='trio'))
+
+    def test_organize(self) :
+        """Test that organize loads and saves through the async adapters, then closes them."""
+        clients_dashboard = QuietAsyncClientsDashboard()
+        vlans_dashboard = AsyncMultiVlanDashboard()
+        known_devices_port = KnownDevicesListPort(
+            [KnownDevice(name=name, mac=name, group='servers') for name in ['kra', 'new']])
+        net_organizer_app = NetOrganizerApp(
+            known_devices_port=known_devices_port,
+            active_clients_port=ActiveClientsMerakiAsyncAdapter(CONFIG, clients_dashboard),
+            fixed_ip_reservations_port=FixedIpReservationsMerakiAsyncAdapter(CONFIG, vlans_dashboard),
+            device_table_csv_out_port=None,
+            sna_hostgroup_port=None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            with net_organizer_app:
+                net_organizer_app.do_organize()
+        self.assertEqual(1, len(clients_dashboard.calls))
+        self.assertEqual({'1': 1, '10': 0}, vlans_dashboard.writes)
+        self.assertIn('new', vlans_dashboard.vlans['1']['fixedIpAssignments'])
+        self.assertIsNotNone(known_devices_port.saved)
+        self.assertTrue(clients_dashboard.closed)
+        self.assertTrue(vlans_dashboard.closed)
@@ -0,0 +1,183 @@
+import contextlib
+import io
+import threading
+import time
+import unittest
+import meraki.exceptions
+from devicetable import DeviceTable
+from adapters.activeclients_meraki import ActiveClientsMerakiAdapter
+from adapters.fixedipreservations_meraki import FixedIpReservationsMerakiAdapter
+from adapters.meraki_dashboard import MerakiRequestScheduler, SharedAsyncMerakiDashboard, SharedMerakiDashboard, VlanSnapshotCache, get_request_scheduler
+
+CONFIG = {
+    'api_key': '0123456789abcdef0123456789abcdef01234567',
+    'serial_id': 'Q2XX-XXXX-XXXX',
+    'network_id': 'L_1',
+    'vlan_id': 1,
+    'vlan_subnet': '192.168.128.0/24'
+}
+
+class TestSharedMerakiDashboard(unittest.TestCase) :
+    """Test cases for SharedMerakiDashboard."""
+
+    def test_shared(self) :
+        """Test that the adapters share one lazily created, pooled DashboardAPI."""
+        dashboard = SharedMerakiDashboard(CONFIG['api_key'])
+        active_clients_adapter = ActiveClientsMerakiAdapter(CONFIG, dashboard)
+        fixed_ip_reservations_adapter = FixedIpReservationsMerakiAdapter(CONFIG, dashboard)
+        self.assertIs(active_clients_adapter.dashboard.get_dashboard(),
+                      fixed_ip_reservations_adapter.dashboard.get_dashboard())
+        self.assertIs(active_clients_adapter.dashboard.appliance,
+                      fixed_ip_reservations_adapter.dashboard.appliance)
+        # pylint: disable=protected-access
+        https_adapter = dashboard.get_dashboard()._session._req_session.get_adapter('https://api.meraki.com')
+        self.assertEqual(dashboard.pool_size, https_adapter._pool_maxsize)
+
+class CountingDashboard:
+    """Stands in for SharedMerakiDashboard, counting the VLAN reads and writes."""
+
+    def __init__(self, vlan_snapshot_max_age=None) -> None:
+        self.vlan_snapshots = VlanSnapshotCache(vlan_snapshot_max_age)
+        self.appliance = self
+        self.reads = 0
+        self.writes = 0
+        self.vlan = {'fixedIpAssignments': {
+            'kra': {'ip': '192.168.128.10', 'name': 'kra'}}}
+
+    # pylint: disable=invalid-name
+    def getNetworkApplianceVlan(self, network_id, vlan_id) -> dict:
+        self.reads += 1
+        return self.vlan
+
+    def updateNetworkApplianceVlan(self, network_id, vlan_id, fixedIpAssignments) -> dict:
+        self.writes += 1
+        self.vlan = {'fixedIpAssignments': fixedIpAssignments}
+        return self.vlan
+
+class TestVlanSnapshotCache(unittest.TestCase) :
+    """Test cases for VlanSnapshotCache."""
+
+    @staticmethod
+    def organize(dashboard, new_devices) -> None:
+        """Load the reservations, add new_devices to the device table and save."""
+        adapter = FixedIpReservationsMerakiAdapter(CONFIG, dashboard)
+        device_table = DeviceTable([
+            {'mac': reservation.mac, 'known': True, 'reserved': True, 'active': False,
+             'ip': reservation.ip_address, 'group': 'servers', 'name': reservation.name}
+            for reservation in adapter.load()] + new_devices)
+        with contextlib.redirect_stdout(io.StringIO()):
+            adapter.save(device_table)
+
+    def test_one_read_per_organize(self) :
+        """Test that loading then saving reads the VLAN once and writes it once."""
+        dashboard = CountingDashboard()
+        TestVlanSnapshotCache.organize(dashboard, [
+            {'mac': 'k__', 'known': True, 'reserved': False, 'active': False,
+             'ip': '', 'group': 'servers', 'name': 'k__'}])
+        self.assertEqual(1, dashboard.reads)
+        self.assertEqual(1, dashboard.writes)
+        self.assertEqual(dashboard.vlan, dashboard.vlan_snapshots.get('L_1', 1))
+
+    def test_unchanged(self) :
+        """Test that the update is skipped, and counted, when the reservations are unchanged."""
+        dashboard = CountingDashboard()
+        TestVlanSnapshotCache.organize(dashboard, [])
+        self.assertEqual(1, dashboard.reads)
+        self.assertEqual(0, dashboard.writes)
+        self.assertEqual(1, dashboard.vlan_snapshots.writes_avoided)
+
+    def test_stale(self) :
+        """Test that a snapshot older than max_age is read again."""
+        dashboard = CountingDashboard(vlan_snapshot_max_age=0)
+        adapter = FixedIpReservationsMerakiAdapter(CONFIG, dashboard)
+        adapter.load()
+        adapter.load()
+        self.assertEqual(2, dashboard.reads)
+
+class RateLimitedResponse:
+    """A 429 response asking the caller to retry after a short while."""
+    status_code = 429
+    reason = 'Too Many Requests'
+    headers = {'Retry-After': '0.2'}
+
+    def json(self) -> dict:
+        return {'errors': ['API rate limit exceeded for organization']}
+
+class TestMerakiRequestScheduler(unittest.TestCase) :
+    """Test cases for MerakiRequestScheduler."""
+
+    def test_rate(self) :
+        """Test that requests beyond the burst wait for tokens."""
+        scheduler = MerakiRequestScheduler(rate=50, burst=5)
+        start = time.monotonic()
+        for _ in range(15):
+            scheduler.acquire()
+        # 10 requests beyond the burst at 50 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+        self.assertEqual(15, scheduler.requests)
+
+    def test_reads_first(self) :
+        """Test that a waiting read is sent before a waiting write."""
+        scheduler = MerakiRequestScheduler(rate=20, burst=1)
+        scheduler.acquire()
+        order = []
+        def send(name):
+            scheduler.call(name, lambda: order.append(name))
+        writer = threading.Thread(target=send, args=['updateNetworkApplianceVlan'])
+        reader = threading.Thread(target=send, args=['getNetworkApplianceVlan'])
+        writer.start()
+        reader.start()
+        writer.join()
+        reader.join()
+        self.assertEqual(['getNetworkApplianceVlan', 'updateNetworkApplianceVlan'], order)
+
+    def test_writes_not_starved(self) :
+        """Test that a write goes once it has waited maximum_write_deferral, even while reads keep coming."""
+        scheduler = MerakiRequestScheduler(rate=100, burst=1, maximum_write_deferral=0.1)
+        stop = threading.Event()
+        def read():
+            deadline = time.monotonic() + 2
+            while not stop.is_set() and time.monotonic() < deadline:
+                scheduler.call('getNetworkApplianceVlan', lambda: None)
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        scheduler.call('updateNetworkApplianceVlan', lambda: None)
+        elapsed = time.monotonic() - start
+        stop.set()
+        for reader in readers:
+            reader.join()
+        self.assertLess(elapsed, 0.5)
+
+    def test_retry_after(self) :
+        """Test that a 429 pauses the scheduler for Retry-After and the call is retried."""
+        scheduler = MerakiRequestScheduler(rate=100, burst=10)
+        attempts = []
+        def operation():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise meraki.exceptions.APIError(
+                    {'tags': ['appliance'], 'operation': 'getNetworkApplianceVlan'},
+                    RateLimitedResponse())
+            return 'vlan'
+        self.assertEqual('vlan', scheduler.call('getNetworkApplianceVlan', operation))
+        self.assertEqual(2, len(attempts))
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.2)
+        self.assertEqual(1, scheduler.throttled)
+
+    def test_configured_rate(self) :
+        """Test that dashboards the adapters create themselves use the configured rate."""
+        config = dict(CONFIG, api_key='fedcba9876543210fedcba9876543210fedcba98', meraki_requests_per_second=4)
+        self.assertEqual(4, ActiveClientsMerakiAdapter(config).dashboard.scheduler.rate)
+        self.assertEqual(4, FixedIpReservationsMerakiAdapter(config).dashboard.scheduler.rate)
+        self.assertEqual(4, SharedAsyncMerakiDashboard.from_config(config).scheduler.rate)
+        self.assertIs(get_request_scheduler(config['api_key'], 4), ActiveClientsMerakiAdapter(config).dashboard.scheduler)
+
+    def test_different_rate(self) :
+        """Test that asking for a different rate for an API key that is already scheduled raises."""
+        api_key = '00112233445566778899aabbccddeeff00112233'
+        get_request_scheduler(api_key, 5)
+        with self.assertRaises(ValueError):
+            get_request_scheduler(api_key, 20)
@@ -0,0 +1,117 @@
+import unittest
+from devicetable import DeviceTable
+from networkspace import GroupBlockStrategy, Ipv4PrivateNetworkSpace, NetworkIsOutOfSpace, NetworkMapper, collapse_ips, ip_to_int
+
+def build_device_table() -> DeviceTable:
+    """Build a device table with devices needing IPs in two groups."""
+    data = []
+    for i in range(5):
+        data.append({'mac': f'lights-{i}', 'known': True, 'reserved': False, 'active': False,
+                     'ip': '', 'group': 'Lights', 'name': f'Light {i}'})
+    for i in range(2):
+        data.append({'mac': f'ring-{i}', 'known': True, 'reserved': False, 'active': False,
+                     'ip': '', 'group': 'Ring', 'name': f'Ring {i}'})
+    data.append({'mac': 'eero-0', 'known': True, 'reserved': True, 'active': True,
+                 'ip': '192.168.128.1', 'group': 'Eero', 'name': 'Eero'})
+    return DeviceTable(data)
+
+class TestNetworkMapper(unittest.TestCase):
+
+    def test_map_lowest_first(self):
+        """Devices needing an IP are given the lowest free addresses in table order."""
+        device_table = build_device_table()
+        NetworkMapper("192.168.128.0/24", device_table).map_to_network_space()
+        ips = device_table.df['ip'].tolist()
+        self.assertListEqual([f'192.168.128.{i}' for i in range(2, 9)] + ['192.168.128.1'], ips)
+
+    def test_map_group_blocks(self):
+        """Each group is placed in its own aligned block and collapses to a CIDR."""
+        device_table = build_device_table()
+        strategy = GroupBlockStrategy()
+        NetworkMapper("192.168.128.0/24", device_table, strategy).map_to_network_space()
+        df = device_table.df
+        # The Eero's block keeps the other groups out of 192.168.128.0/30
+        self.assertDictEqual(
+            {'Eero': ['192.168.128.0/30'], 'Lights': ['192.168.128.8/29'], 'Ring': ['192.168.128.4/30']},
+            strategy.get_block_cidrs())
+        self.assertListEqual(
+            ['192.168.128.8/30', '192.168.128.12'],
+            collapse_ips(df.query("group == 'Lights'")['ip'].tolist()))
+        self.assertListEqual(
+            ['192.168.128.4/31'],
+            collapse_ips(df.query("group == 'Ring'")['ip'].tolist()))
+
+    def test_map_out_of_space(self):
+        """A subnet too small for every device raises and leaves the space unchanged."""
+        device_table = build_device_table()
+        network_mapper = NetworkMapper("192.168.128.0/29", device_table)
+        self.assertRaises(NetworkIsOutOfSpace, network_mapper.map_to_network_space)
+        network_space = network_mapper.get_network_space()
+        self.assertSetEqual({'192.168.128.1'}, network_space.get_used_set())
+        self.assertEqual(5, len(network_space.get_unused_set()))
+
+    def test_map_group_blocks_extend_existing_block(self):
+        """A group's new devices join the block its other devices are already in."""
+        data = [{'mac': f'lights-{i}', 'known': True, 'reserved': True, 'active': False,
+                 'ip': f'192.168.128.{100 + i}', 'group': 'Lights', 'name': f'Light {i}'} for i in range(20)]
+        data.append({'mac': 'lights-new', 'known': True, 'reserved': False, 'active': False,
+                     'ip': '', 'group': 'Lights', 'name': 'Light new'})
+        device_table = DeviceTable(data)
+        strategy = GroupBlockStrategy()
+        NetworkMapper("192.168.128.0/24", device_table, strategy).map_to_network_space()
+        self.assertDictEqual({'Lights': ['192.168.128.96/27']}, strategy.get_block_cidrs())
+        self.assertEqual('192.168.128.96', device_table.get_by_mac('lights-new')['ip'])
+
+    def test_map_group_blocks_sized_to_new_devices(self):
+        """A group spread over the subnet gets a block only sized for the devices that need an IP."""
+        data = [{'mac': f'lights-{i}', 'known': True, 'reserved': True, 'active': False,
+                 'ip': f'192.168.128.{10 * i + 5}', 'group': 'Lights', 'name': f'Light {i}'} for i in range(20)]
+        data.append({'mac': 'lights-new', 'known': True, 'reserved': False, 'active': False,
+                     'ip': '', 'group': 'Lights', 'name': 'Light new'})
+        strategy = GroupBlockStrategy()
+        NetworkMapper("192.168.128.0/24", DeviceTable(data), strategy).map_to_network_space()
+        self.assertDictEqual({'Lights': ['192.168.128.8/30']}, strategy.get_block_cidrs())
+
+class TestIpv4PrivateNetworkSpace(unittest.TestCase):
+
+    def test_group_block_fallback(self):
+        """Test that a group with no whole block left avoids the other groups' blocks while it can."""
+        strategy = GroupBlockStrategy(block_size=4)
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/28", strategy)
+        for ip in ['192.168.128.1', '192.168.128.2', '192.168.128.3']:
+            network_space.allocate_specific_address(ip)
+        self.assertEqual('192.168.128.4', network_space.allocate_address('m1', 'Lights'))
+        self.assertEqual('192.168.128.8', network_space.allocate_address('m2', 'Ring'))
+        self.assertListEqual(
+            ['192.168.128.12', '192.168.128.13', '192.168.128.14'],
+            [network_space.allocate_address(f'c{i}', 'Cameras') for i in range(3)])
+        # Only the other groups' blocks are left
+        self.assertEqual('192.168.128.5', network_space.allocate_address('c3', 'Cameras'))
+
+    def test_find_free_block(self):
+        """Test that repeated searches find the same blocks as a search of the whole space."""
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24")
+        base = ip_to_int('192.168.128.0')
+        self.assertEqual(base + 16, network_space.find_free_block(16))
+        network_space.allocate_specific_address('192.168.128.20')
+        self.assertEqual(base + 32, network_space.find_free_block(16))
+        self.assertEqual(base + 4, network_space.find_free_block(4))
+        network_space.allocate_specific_address('192.168.128.5')
+        self.assertEqual(base + 8, network_space.find_free_block(4))
+        self.assertIsNone(network_space.find_free_block(256))
+        self.assertIsNone(network_space.find_free_block(256))
+
+    def test_group_blocks_do_not_overlap(self):
+        """Blocks for groups of different sizes in a partly used subnet never overlap."""
+        strategy = GroupBlockStrategy()
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24", strategy)
+        for i in range(1, 8):
+            network_space.allocate_specific_address(f'192.168.128.{i}')
+        strategy.prepare({'A': 5, 'B': 2})
+        groups = ['A', 'B', 'A', 'A', 'B', 'A', 'A']
+        ips = network_space.allocate_addresses([f'm{i}' for i in range(len(groups))], groups)
+        a_ips = [ip for ip, group in zip(ips, groups) if group == 'A']
+        b_ips = [ip for ip, group in zip(ips, groups) if group == 'B']
+        self.assertDictEqual({'A': ['192.168.128.8/29'], 'B': ['192.168.128.16/30']}, strategy.get_block_cidrs())
+        self.assertListEqual(['192.168.128.8/30', '192.168.128.12'], collapse_ips(a_ips))
+        self.assertListEqual(['192.168.128.16/31'], collapse_ips(b_ips))
@@ -2,21 +2,28 @@
 
 from devicetable import DeviceTableLoader
 from knowndevicesloader import KnownDevicesLoader
-from netorgmeraki import MerakiActiveClientsLoader, MerakiFixedIpReservationsLoader, MerakiWrapper
+from netorgmeraki import ActiveClientsCache, MerakiActiveClientsLoader, MerakiFixedIpReservationsLoader, MerakiWrapper
 
-def create(config) -> DeviceTableLoader:
-    """Create a DeviceTableLoader."""
-    meraki_wrapper = MerakiWrapper(config['api_key'])
+def create(config, meraki_wrapper=None) -> DeviceTableLoader:
+    """Create a DeviceTableLoader, sharing meraki_wrapper if one is given."""
+    if meraki_wrapper is None:
+        meraki_wrapper = MerakiWrapper(config['api_key'], config.get('vlan_snapshot_max_age'))
     known_devices_loader = KnownDevicesLoader(config['devices_yml'])
     meraki_active_clients_loader = MerakiActiveClientsLoader(
         meraki_wrapper.dashboard,
         config['serial_id'],
-        config['vlan_id'])
+        config['vlan_id'],
+        config['network_id'],
+        config.get('active_clients_scope', 'device'),
+        config.get('active_clients_timespan'),
+        ActiveClientsCache.from_config(config))
     meraki_fixed_ip_reservations_loader = MerakiFixedIpReservationsLoader(
         meraki_wrapper.dashboard,
         config['network_id'],
-        config['vlan_id'])
+        config['vlan_id'],
+        meraki_wrapper.vlan_snapshots)
     return DeviceTableLoader(
         known_devices_loader,
         meraki_active_clients_loader,
-        meraki_fixed_ip_reservations_loader)
+        meraki_fixed_ip_reservations_loader,
+        config.get('device_table_load_engine', 'columnar'))
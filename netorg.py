@@ -3,14 +3,14 @@ import argparse
 import sys
 import merakidevicetableloaderfactory
 from configure import NetorgConfigurator
-from netorgmeraki import MerakiNetworkMapper
+from netorgmeraki import MerakiNetworkMapper, MerakiWrapper
 from netorgsna import SnaAdapter
 from scan import NetorgScanner
 from generate import NetorgGenerator
 
-def load_device_table(config):
+def load_device_table(config, meraki_wrapper=None):
     """Load the device table."""
-    device_table_loader = merakidevicetableloaderfactory.create(config)
+    device_table_loader = merakidevicetableloaderfactory.create(config, meraki_wrapper)
     return device_table_loader.load_all()
 
 def load_config():
@@ -53,10 +53,12 @@ def do_organize() -> None:
     """Perform organize."""
     print("Organize")
     config = load_config()
-    device_table = load_device_table(config)
+    # One dashboard client (and its connections) for loading and pushing
+    meraki_wrapper = MerakiWrapper(config['api_key'], config.get('vlan_snapshot_max_age'))
+    device_table = load_device_table(config, meraki_wrapper)
     generator = NetorgGenerator(config, device_table)
     generator.generate()
-    meraki_network_mapper = MerakiNetworkMapper(config, device_table)
+    meraki_network_mapper = MerakiNetworkMapper(config, device_table, meraki_wrapper)
     meraki_network_mapper.update_fixed_ip_reservations()
 
 def do_devicetable() -> None:
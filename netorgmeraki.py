@@ -1,8 +1,16 @@
 """Module for all things interacting directly with the Meraki Dashboard API."""
+import hashlib
+import json
+import math
+import os
 import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import meraki
+from requests.adapters import HTTPAdapter
 from deepdiff import DeepDiff
-from ipv4privatenetworkspace import Ipv4PrivateNetworkSpace
+from ipv4privatenetworkspace import Ipv4PrivateNetworkSpace, create_allocation_strategy, ip_to_int
 
 class MerakiWrapperException(Exception) :
     # pylint: disable=missing-class-docstring
@@ -36,6 +44,108 @@ class NoVlansFound(MerakiWrapperException) :
     # pylint: disable=missing-class-docstring
     pass
 
+def fingerprint_fixed_ip_reservations(fixed_ip_reservations) -> str:
+    """Return a hash of fixed IP reservations that ignores the order of MACs and fields."""
+    canonical = json.dumps(fixed_ip_reservations or {}, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf8')).hexdigest()
+
+class VlanSnapshotCache :
+    """Run-scoped snapshots of VLANs read from the Dashboard API.
+
+    Loading the fixed IP reservations reads the VLAN and updating them needs
+    it again. Keeping the snapshot means one organize does one read and one
+    write per VLAN. If max_age (seconds) is set, a snapshot older than that
+    is treated as stale and read again. Updates skipped because the VLAN
+    already matched are counted in writes_avoided.
+    """
+
+    def __init__(self, max_age=None) -> None:
+        self.max_age = max_age
+        self.writes_avoided = 0
+        self.__snapshots = {}
+        self.__lock = threading.Lock()
+
+    def get(self, network_id, vlan_id):
+        """Return the snapshot of the VLAN, or None if there isn't a fresh one."""
+        with self.__lock:
+            snapshot = self.__snapshots.get((network_id, str(vlan_id)))
+        if snapshot is None:
+            return None
+        vlan, taken_at = snapshot
+        if self.max_age is not None and time.monotonic() - taken_at > self.max_age:
+            return None
+        return vlan
+
+    def put(self, network_id, vlan_id, vlan) -> None:
+        """Remember the VLAN as read from (or written to) the Dashboard API."""
+        with self.__lock:
+            self.__snapshots[(network_id, str(vlan_id))] = (vlan, time.monotonic())
+
+    def count_write_avoided(self) -> int:
+        """Count a VLAN update that was skipped because nothing changed and return the total this run."""
+        with self.__lock:
+            self.writes_avoided += 1
+            return self.writes_avoided
+
+    def get_vlan(self, dashboard, network_id, vlan_id) -> dict:
+        """Return the VLAN, reading it from the Dashboard API only if there is no fresh snapshot."""
+        vlan = self.get(network_id, vlan_id)
+        if vlan is None:
+            vlan = dashboard.appliance.getNetworkApplianceVlan(network_id, str(vlan_id))
+            self.put(network_id, vlan_id, vlan)
+        return vlan
+
+class MerakiTopology :
+    """The devices and VLANs of the networks in an org, kept for the session.
+
+    prefetch() starts fetching them for every network in the background,
+    a few at a time, as soon as the networks are known. By the time a
+    network has been chosen its devices and VLANs are usually in already.
+    A network whose fetch hasn't started yet is fetched straight away
+    rather than waiting behind the others.
+    """
+
+    def __init__(self, dashboard, max_workers=8) -> None:
+        self.dashboard = dashboard
+        self.max_workers = max_workers
+        self.__executor = None
+        self.__devices = {}
+        self.__vlans = {}
+
+    def prefetch(self, networks) -> None:
+        """Start fetching the devices and VLANs of every network."""
+        self.__executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        for network in networks:
+            network_id = network['id']
+            self.__devices[network_id] = self.__executor.submit(
+                self.dashboard.networks.getNetworkDevices, network_id)
+            self.__vlans[network_id] = self.__executor.submit(
+                self.dashboard.appliance.getNetworkApplianceVlans, network_id)
+
+    def get_devices(self, network_id) -> list:
+        """Return the devices in the network."""
+        return MerakiTopology.__get(self.__devices, network_id, self.dashboard.networks.getNetworkDevices)
+
+    def get_vlans(self, network_id) -> list:
+        """Return the VLANs of the network."""
+        return MerakiTopology.__get(self.__vlans, network_id, self.dashboard.appliance.getNetworkApplianceVlans)
+
+    def close(self) -> None:
+        """Stop fetching. Whatever has been fetched already is kept."""
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
+
+    @staticmethod
+    def __get(futures, network_id, fetch) -> list:
+        """Return the result of the fetch for the network, fetching it now if it hasn't started."""
+        future = futures.get(network_id)
+        if future is None or future.cancel():
+            future = Future()
+            future.set_result(fetch(network_id))
+            futures[network_id] = future
+        return future.result()
+
 class MerakiWrapper :
     """Wrapper for the Meraki dashboard API."""
 
@@ -107,6 +217,11 @@ class MerakiWrapper :
     def find_network_id(dashboard, org_id, chooser_func) -> str:
         """Return the network id."""
         networks = dashboard.organizations.getOrganizationNetworks(org_id)
+        return MerakiWrapper.choose_network_id(networks, chooser_func)
+
+    @staticmethod
+    def choose_network_id(networks, chooser_func) -> str:
+        """Return the id of the only network, or the one selected by the user."""
         if len(networks) == 0 :
             raise NoNetworksFound
         if len(networks) > 1 :
@@ -117,6 +232,11 @@ class MerakiWrapper :
     def find_device_serial_id(dashboard, network_id, chooser_func) -> str:
         """Return the device serial id."""
         devices = dashboard.networks.getNetworkDevices(network_id)
+        return MerakiWrapper.choose_device_serial_id(devices, chooser_func)
+
+    @staticmethod
+    def choose_device_serial_id(devices, chooser_func) -> str:
+        """Return the serial id of the only device, or the one selected by the user."""
         if len(devices) == 0 :
             raise NoDevicesFound
         if len(devices) > 1 :
@@ -127,6 +247,11 @@ class MerakiWrapper :
     def find_vlan_id(dashboard, network_id, chooser_func) -> str:
         """Return the VLAN id."""
         vlans = dashboard.appliance.getNetworkApplianceVlans(network_id)
+        return MerakiWrapper.choose_vlan_id(vlans, chooser_func)
+
+    @staticmethod
+    def choose_vlan_id(vlans, chooser_func) -> str:
+        """Return the id of the only VLAN, or the one selected by the user."""
         if len(vlans) == 0 :
             raise NoVlansFound
         if len(vlans) > 1 :
@@ -139,10 +264,18 @@ class MerakiWrapper :
         vlan = dashboard.appliance.getNetworkApplianceVlan(network_id, str(vlan_id))
         return vlan['subnet']
 
-    def __init__(self, api_key) :
+    def __init__(self, api_key, vlan_snapshot_max_age=None) :
         if not api_key :
             raise InvalidApiKey
+        self.vlan_snapshots = VlanSnapshotCache(vlan_snapshot_max_age)
         self.dashboard = meraki.DashboardAPI(api_key, suppress_logging=True)
+        # Keep a pool of connections so every call made through this wrapper
+        # reuses the same TLS sessions. The API redirects to a shard, so pool
+        # a few hosts.
+        # pylint: disable=protected-access
+        self.dashboard._session._req_session.mount(
+            'https://', HTTPAdapter(pool_connections=4, pool_maxsize=10))
+        self.topology = MerakiTopology(self.dashboard)
         self.org_id = ''
         self.network_id = ''
         self.serial_id = ''
@@ -153,33 +286,167 @@ class MerakiWrapper :
         """Fully initialize the wrapper."""
         try :
             self.org_id = MerakiWrapper.find_org_id(self.dashboard)
-            self.network_id = MerakiWrapper.find_network_id(
-                self.dashboard, self.org_id, chooser_func)
-            self.serial_id = MerakiWrapper.find_device_serial_id(
-                self.dashboard, self.network_id, chooser_func)
-            self.vlan_id = MerakiWrapper.find_vlan_id(
-                self.dashboard, self.network_id, chooser_func)
-            self.vlan_subnet = MerakiWrapper.find_vlan_subnet(
-                self.dashboard,self.network_id,self.vlan_id)
+            networks = self.dashboard.organizations.getOrganizationNetworks(self.org_id)
+            # Fetch every network's devices and VLANs while the user chooses
+            self.topology.prefetch(networks)
+            self.network_id = MerakiWrapper.choose_network_id(networks, chooser_func)
+            self.serial_id = MerakiWrapper.choose_device_serial_id(
+                self.topology.get_devices(self.network_id), chooser_func)
+            vlans = self.topology.get_vlans(self.network_id)
+            self.vlan_id = MerakiWrapper.choose_vlan_id(vlans, chooser_func)
+            self.vlan_subnet = next(vlan['subnet'] for vlan in vlans if vlan['id'] == self.vlan_id)
         except meraki.exceptions.APIError as exc:
             print(f'Failed to initialize MerakiWrapper: {exc}')
             raise MerakiWrapperException from exc
+        finally:
+            self.topology.close()
+
+# Where active clients are collected from: the clients of the one device
+# (serial_id) chosen during configure, or every client in the network.
+ACTIVE_CLIENTS_SCOPES = ['device', 'network']
+
+# Largest page the network clients endpoint allows
+NETWORK_CLIENTS_PER_PAGE = 1000
+
+# Lookback (in seconds) the Dashboard API uses when no timespan is given
+DEFAULT_ACTIVE_CLIENTS_TIMESPAN = 86400
+
+# The Dashboard API client fields a cached client keeps. The hex adapters
+# keep the same fields, so either can read a cache the other wrote.
+CLIENT_FIELDS = ['mac', 'dhcpHostname', 'description', 'ip', 'vlan']
+
+# Seconds the window asked for overlaps the previous poll, so a client seen
+# while that poll was in flight isn't missed
+POLL_OVERLAP = 60
+
+class ActiveClientsCache :
+    """The clients seen over the last timespan seconds, keyed by MAC, kept in a JSON file.
+
+    The first poll (or one after more than timespan seconds) asks for the
+    whole timespan. Later polls only ask for the window since the previous
+    poll and merge what comes back into the cached clients. A client not
+    seen for timespan seconds is dropped. A cache of another source (serial
+    or network and VLAN), or written with other fields, is ignored.
+    """
+
+    def __init__(self, filename, timespan, source) -> None:
+        self.filename = filename
+        self.timespan = timespan
+        self.source = source
+        self.__clients = {}
+
+    @classmethod
+    def from_config(cls, config) :
+        """Create the active clients cache if one is configured, otherwise return None."""
+        if not config.get('active_clients_cache'):
+            return None
+        scope = config.get('active_clients_scope', 'device')
+        polled = config['serial_id'] if scope == 'device' else config['network_id']
+        return cls(
+            config['active_clients_cache'],
+            config.get('active_clients_timespan', DEFAULT_ACTIVE_CLIENTS_TIMESPAN),
+            f'{scope} {polled} vlan {config["vlan_id"]}')
+
+    def get_window(self, now) -> int:
+        """Load the cache and return how many seconds back the next poll needs to ask for."""
+        self.__clients = {}
+        polled_at = None
+        if os.path.exists(self.filename):
+            with open(self.filename, encoding='utf8') as cache_file:
+                cache = json.load(cache_file)
+            if cache.get('source') == self.source and cache.get('fields') == CLIENT_FIELDS:
+                polled_at = cache['polled_at']
+                self.__clients = cache['clients']
+        if polled_at is None or now - polled_at >= self.timespan:
+            return self.timespan
+        return min(self.timespan, math.ceil(now - polled_at) + POLL_OVERLAP)
+
+    def merge(self, recent_clients, now) :
+        """Yield every client, the ones from the latest poll first, then save the cache.
+
+        Only the CLIENT_FIELDS of each client are kept. The recent clients
+        are passed on as they arrive; the cached clients are held in memory
+        and the cache is only saved once every client has been yielded.
+        """
+        for client in recent_clients:
+            previous = self.__clients.get(client['mac'])
+            if previous is not None and previous['seen_at'] == now:
+                # Already yielded from this poll
+                continue
+            client = {field: client.get(field) for field in CLIENT_FIELDS}
+            self.__clients[client['mac']] = {**client, 'seen_at': now}
+            yield client
+        self.__clients = {
+            mac: client for mac, client in self.__clients.items()
+            if now - client['seen_at'] < self.timespan}
+        for client in self.__clients.values():
+            if client['seen_at'] != now:
+                yield {key: value for key, value in client.items() if key != 'seen_at'}
+        with open(self.filename, 'w', encoding='utf8') as cache_file:
+            cache_file.write(json.dumps(
+                {'source': self.source, 'fields': CLIENT_FIELDS, 'polled_at': now, 'clients': self.__clients},
+                indent=2))
 
 class MerakiActiveClientsLoader:
     """Load active clients from Meraki."""
     # pylint: disable=too-few-public-methods
 
-    def __init__(self, meraki_dashboard, serial_id, vlan_id) -> None:
+    # pylint: disable=too-many-arguments
+    def __init__(self, meraki_dashboard, serial_id, vlan_id, network_id=None, scope='device',
+                 timespan=None, cache=None) -> None:
+        if scope not in ACTIVE_CLIENTS_SCOPES:
+            raise ValueError(f'unknown active clients scope {scope}')
         self.dashboard = meraki_dashboard
         self.serial_id = serial_id
         self.vlan_id = vlan_id
+        self.network_id = network_id
+        self.scope = scope
+        self.per_page = NETWORK_CLIENTS_PER_PAGE
+        self.timespan = timespan
+        self.cache = cache
 
     def load(self) :
         """Load active clients."""
-        device_clients = self.dashboard.devices.getDeviceClients(self.serial_id)
-        # pylint: disable=line-too-long
-        filtered_for_vlan = [ device_client for device_client in device_clients if device_client['vlan'] == self.vlan_id]
-        return filtered_for_vlan
+        return list(self.iterate())
+
+    def iterate(self) :
+        """Yield the active clients one page at a time, so only one page is held in memory.
+
+        With a cache, only the clients seen since the previous poll are
+        fetched and they are merged into the cached clients.
+        """
+        if self.cache is None:
+            yield from self.__iterate_recent(self.timespan)
+            return
+        now = time.time()
+        yield from self.cache.merge(self.__iterate_recent(self.cache.get_window(now)), now)
+
+    def __iterate_recent(self, timespan) :
+        """Yield the clients on the VLAN seen over the last timespan seconds."""
+        for page in self.__get_pages(timespan):
+            if self.scope == 'network':
+                # The VLAN filter has been applied by the API
+                yield from page
+            else:
+                # pylint: disable=line-too-long
+                yield from (device_client for device_client in page if device_client['vlan'] == self.vlan_id)
+
+    def __get_pages(self, timespan=None) :
+        """Yield the pages of clients seen over the last timespan seconds (the API default if None)."""
+        timespan_kwargs = {} if timespan is None else {'timespan': timespan}
+        if self.scope != 'network':
+            # The device clients endpoint isn't paginated
+            yield self.dashboard.devices.getDeviceClients(self.serial_id, **timespan_kwargs)
+            return
+        starting_after = {}
+        while True:
+            page = self.dashboard.networks.getNetworkClients(
+                self.network_id, total_pages=1, perPage=self.per_page, vlan=str(self.vlan_id),
+                **timespan_kwargs, **starting_after)
+            yield page
+            if len(page) < self.per_page:
+                return
+            starting_after = {'startingAfter': page[-1]['id']}
 
 class MerakiFixedIpReservationsGenerator:
     """Generate fixed IP reservations for Meraki."""
@@ -187,52 +454,88 @@ class MerakiFixedIpReservationsGenerator:
 
     @staticmethod
     def generate(device_table) -> dict:
-        """Generate fixed IP reservations."""
-        # pylint: disable=invalid-name
+        """Generate fixed IP reservations in a single pass over the device table's MAC index."""
         ip_reservations_dict = {}
-        df = device_table.df
-        skip_these_macs = df.query("not known and reserved and not active").mac.unique().tolist()
-        macs = df.mac.unique().tolist()
-        for mac in macs :
-            if mac not in skip_these_macs:
-                device_df = df.query('mac == @mac')
-                if device_df.shape[0] == 1:
-                    ip = device_df.iloc[0]['ip']
-                    name = device_df.iloc[0]['name']
-                    ip_reservations_dict[mac] = {
-                        'ip': ip,
-                        'name': name
-                    }
-            else:
+        for mac in device_table.get_macs():
+            device = device_table.get_by_mac(mac)
+            if device['reserved'] and not device['known'] and not device['active']:
                 print(f'MerakiFixedIpReservationsGenerator: skipping {mac}')
+                continue
+            holder = device_table.get_by_ip(device['ip'])
+            if holder is not None and holder['mac'] != mac:
+                print(f'MerakiFixedIpReservationsGenerator: {mac} has the same IP {device["ip"]} as {holder["mac"]}')
+            ip_reservations_dict[mac] = {
+                'ip': device['ip'],
+                'name': device['name']
+            }
         return ip_reservations_dict
 
 class MerakiFixedIpReservationsLoader:
     """Load fixed IP reservations from Meraki."""
     # pylint: disable=too-few-public-methods
 
-    def __init__(self, meraki_dashboard, network_id, vlan_id) -> None:
+    def __init__(self, meraki_dashboard, network_id, vlan_id, vlan_snapshots=None) -> None:
         self.dashboard = meraki_dashboard
         self.network_id = network_id
         self.vlan_id = vlan_id
+        self.vlan_snapshots = vlan_snapshots if vlan_snapshots else VlanSnapshotCache()
 
     def load(self) :
         """Load fixed iP reservations."""
-        vlan = self.dashboard.appliance.getNetworkApplianceVlan(self.network_id, str(self.vlan_id))
+        vlan = self.vlan_snapshots.get_vlan(self.dashboard, self.network_id, self.vlan_id)
         existing_reservations = vlan['fixedIpAssignments']
         return existing_reservations
 
+class AllocationHistory :
+    """MAC -> IP history used by the sticky allocation strategy, kept in a JSON file."""
+
+    def __init__(self, filename) -> None:
+        self.filename = filename
+
+    @classmethod
+    def from_config(cls, config) :
+        """Create the allocation history if the sticky strategy is configured, otherwise return None."""
+        if config.get('ip_allocation_strategy', 'lowest') != 'sticky':
+            return None
+        return cls(config.get(
+            'ip_allocation_history',
+            os.path.join(os.path.expanduser('~'), '.netorg.history.json')))
+
+    def load(self) -> dict:
+        """Load the MAC -> IP history, which is empty before the first save."""
+        if not os.path.exists(self.filename):
+            return {}
+        with open(self.filename, encoding='utf8') as history_file:
+            return json.load(history_file)
+
+    def save(self, fixed_ip_reservations) -> None:
+        """Remember the IP each device in the fixed IP reservations was given."""
+        history = self.load()
+        for mac, reservation_details in fixed_ip_reservations.items():
+            history[mac] = reservation_details['ip']
+        with open(self.filename, 'w', encoding='utf8') as history_file:
+            history_file.write(json.dumps(history, indent=2))
+
 class MerakiNetworkMapper :
     """Map the address space to Meraki."""
-    def __init__(self, config, device_table) -> None:
+    def __init__(self, config, device_table, meraki_wrapper=None) -> None:
         self.config = config
         self.device_table = device_table
-        self.network_space = Ipv4PrivateNetworkSpace(config['vlan_subnet'])
+        self.meraki_wrapper = meraki_wrapper
+        self.allocation_strategy = config.get('ip_allocation_strategy', 'lowest')
+        self.allocation_history = AllocationHistory.from_config(config)
+        strategy = create_allocation_strategy(
+            self.allocation_strategy, self.allocation_history.load() if self.allocation_history else {})
+        self.network_space = Ipv4PrivateNetworkSpace(config['vlan_subnet'], strategy)
         # pylint: disable=invalid-name
         for ip in self.find_ips() :
             self.network_space.allocate_specific_address(ip)
-        for mac in self.find_macs_needing_ip() :
-            self.assign_ip(mac)
+        df = self.device_table.df
+        has_ip = df['ip'] != ''
+        strategy.prepare(
+            df.loc[~has_ip, 'group'].value_counts().to_dict(),
+            {group: [ip_to_int(ip) for ip in ips] for group, ips in df.loc[has_ip].groupby('group', observed=True)['ip']})
+        self.assign_ips()
 
     def find_ips(self) -> list:
         """Generate a list of IPs from the device table."""
@@ -240,17 +543,20 @@ class MerakiNetworkMapper :
         df = self.device_table.df
         return df.query("ip != ''")['ip'].tolist()
 
-    def find_macs_needing_ip(self) -> list:
-        """Generate a list of MACs that do not have an IP."""
+    def assign_ips(self) -> None:
+        """Assign an IP address to every device that does not have one."""
         # pylint: disable=invalid-name
         df = self.device_table.df
-        return df.query("ip == ''")['mac'].tolist()
+        needs_ip = (df['ip'] == '').to_numpy()
+        if needs_ip.any():
+            self.device_table.set_ips(needs_ip, self.network_space.allocate_addresses(
+                df['mac'].to_numpy()[needs_ip].tolist(),
+                df['group'].to_numpy()[needs_ip].tolist()))
 
-    def assign_ip(self,mac) -> None:
-        """Assign an IP address to a device identified by it's MAC."""
-        # pylint: disable=invalid-name
-        df = self.device_table.df
-        df.loc[df["mac"] == mac, "ip"] = self.network_space.allocate_address()
+    def save_history(self, fixed_ip_reservations) -> None:
+        """Remember the IP each device was given for the sticky allocation strategy."""
+        if self.allocation_history:
+            self.allocation_history.save(fixed_ip_reservations)
 
     def generate_fixed_ip_reservations(self) -> dict:
         """Generate fixed IP reservations."""
@@ -289,18 +595,28 @@ class MerakiNetworkMapper :
     def update_fixed_ip_reservations(self) :
         """Update fixed IP reservations in Meraki."""
         new_fixed_ip_reservations = self.generate_fixed_ip_reservations()
-        meraki_wrapper = MerakiWrapper(self.config['api_key'])
+        if self.meraki_wrapper is None:
+            self.meraki_wrapper = MerakiWrapper(
+                self.config['api_key'], self.config.get('vlan_snapshot_max_age'))
 
-        dashboard = meraki_wrapper.dashboard
+        dashboard = self.meraki_wrapper.dashboard
+        vlan_snapshots = self.meraki_wrapper.vlan_snapshots
         network_id = self.config['network_id']
         vlan_id = str(self.config['vlan_id'])
 
-        before_vlan = dashboard.appliance.getNetworkApplianceVlan(network_id, str(vlan_id))
+        before_vlan = vlan_snapshots.get_vlan(dashboard, network_id, vlan_id)
         old_fixed_ip_reservations = before_vlan['fixedIpAssignments']
 
         self.show_diffs(old_fixed_ip_reservations, new_fixed_ip_reservations)
 
-        # pylint: disable=unused-variable
-        response = dashboard.appliance.updateNetworkApplianceVlan(
-            network_id, vlan_id,
-            fixedIpAssignments=new_fixed_ip_reservations)
+        if (fingerprint_fixed_ip_reservations(old_fixed_ip_reservations)
+                == fingerprint_fixed_ip_reservations(new_fixed_ip_reservations)):
+            writes_avoided = vlan_snapshots.count_write_avoided()
+            # pylint: disable=line-too-long
+            print(f'Fixed IP reservations for VLAN {vlan_id} are unchanged, skipping the update ({writes_avoided} write(s) avoided this run)')
+        else:
+            after_vlan = dashboard.appliance.updateNetworkApplianceVlan(
+                network_id, vlan_id,
+                fixedIpAssignments=new_fixed_ip_reservations)
+            vlan_snapshots.put(network_id, vlan_id, after_vlan)
+        self.save_history(new_fixed_ip_reservations)
@@ -1,8 +1,13 @@
 """Module for integrating Secure Network Analytics."""
-import re
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, NamedTuple
 import requests
-from deepdiff import DeepDiff
+from requests.adapters import HTTPAdapter
+from ipv4privatenetworkspace import collapse_ips
 try:
     requests.packages.urllib3.disable_warnings()
 except:
@@ -19,19 +24,21 @@ class SnaAdapter:
         """Synchronize Secure Network Analytics with the device table."""
         # pylint: disable=invalid-name
         hostgroups = self.build_hostgroups(df)
-        sna_session = SnaSession(self.config['sna.manager.host'])
+        max_workers = self.config.get('sna_max_concurrent_requests', MAX_WORKERS)
+        sna_session = SnaSession(self.config['sna.manager.host'], max_workers)
         sna_session.login(self.config['sna.manager.username'], self.config['sna.manager.password'])
-        sna_hostgroup_manager = SnaHostGroupManager(sna_session)
+        sna_hostgroup_manager = SnaHostGroupManager(sna_session, max_workers)
         sna_hostgroup_manager.push_changes(hostgroups)
         sna_session.logout()
 
     def build_hostgroups(self, df):
         """From the specified DataFrame, build a dictionary of hostgroups.
+        Contiguous IPs are collapsed into CIDRs.
         Returns something similar to the following:
         hostgroups = {
-            'Lights': ['192.168.128.10', '192.168.128.191', '192.168.128.192'],
+            'Lights': ['192.168.128.10', '192.168.128.32/28'],
             'Eero':   ['192.168.128.11'],
-            'Ring': ['192.168.128.15', '192.168.128.16', '192.168.128.17'],
+            'Ring': ['192.168.128.15', '192.168.128.16/31'],
             'Laptops': ['192.168.128.190']
         }
         """
@@ -39,7 +46,7 @@ class SnaAdapter:
         hostgroups = {}
         groups = self.get_groups(df)
         for group_name in groups :
-            hostgroups[group_name] = self.get_device_ips_in_group(df,group_name)
+            hostgroups[group_name] = collapse_ips(self.get_device_ips_in_group(df,group_name))
         return hostgroups
 
     def get_groups(self, df) -> list :
@@ -60,6 +67,10 @@ class FailedToLogin(Exception) :
     # pylint: disable=missing-class-docstring
     pass
 
+class FailedToQueryTags(Exception) :
+    # pylint: disable=missing-class-docstring
+    pass
+
 class FailedToCreateNetOrganizerGroupsGroup(Exception) :
     # pylint: disable=missing-class-docstring
     pass
@@ -76,14 +87,36 @@ class FailedToDeleteHostGroup(Exception) :
     # pylint: disable=missing-class-docstring
     pass
 
+# Most hostgroup requests made at once over the API session
+MAX_WORKERS = 8
+# Most hostgroups created by one POST
+CREATE_CHUNK_SIZE = 50
+
+class HostGroupOperation(NamedTuple):
+    """A create, update or delete of one hostgroup."""
+    action: str
+    name: str
+    run: Callable[[], None]
+
+class HostGroupOperationResult(NamedTuple):
+    """How a HostGroupOperation went: the seconds it took and what it raised, if anything."""
+    action: str
+    name: str
+    latency: float
+    error: Exception = None
+
 class SnaHostGroupManager:
     """Facade for the Secure Network Analytics Host Group REST API."""
 
     INSIDE_HOSTS = 'Inside Hosts'
     NET_ORGANIZER_GROUPS = 'Net Organizer Groups'
 
-    def __init__(self, session) -> None:
+    def __init__(self, session, max_workers=MAX_WORKERS) -> None:
         self.session = session
+        self.max_workers = max_workers
+        self.hostgroup_index = None
+        self.hostgroup_index_lock = threading.RLock()
+        self.operation_results = []
         self.hostgroups_to_create_set = set()
         self.hostgroups_to_update_set = set()
         self.hostgroups_to_delete_set = set()
@@ -93,12 +126,45 @@ class SnaHostGroupManager:
         Newly discovered hostgroups are created.
         Existing hostgroups that have changed are updated.
         Hostgroups that are no longer needed are deleted.
+        'Net Organizer Groups' is created first if needed, then every
+        create, update and delete is run concurrently.
         """
         current_hostgroups = self.query_current_hostgroups()
         self.analyze_changes(current_hostgroups, hostgroups_changes)
-        self.create_hostgroups(self.hostgroups_to_create_set,hostgroups_changes)
-        self.update_hostgroups(self.hostgroups_to_update_set,hostgroups_changes)
-        self.delete_hostgroups(self.hostgroups_to_delete_set)
+        net_organizer_hostgroup_id = self.ensure_net_organizer_groups_exists()
+        self.run_operations(
+            self.get_create_operations(self.hostgroups_to_create_set, hostgroups_changes, net_organizer_hostgroup_id) +
+            self.get_update_operations(self.hostgroups_to_update_set, hostgroups_changes) +
+            self.get_delete_operations(self.hostgroups_to_delete_set))
+
+    def run_operations(self, operations) -> list:
+        """Run hostgroup operations concurrently, at most max_workers at a time.
+
+        Each operation is on a different hostgroup, so they can run in any
+        order. Every operation is run even if another fails. The results
+        are kept in operation_results and the first failure is raised once
+        they have all finished.
+        """
+        self.operation_results = []
+        if operations:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(operations))) as executor:
+                self.operation_results = list(executor.map(SnaHostGroupManager.run_operation, operations))
+        failures = [result for result in self.operation_results if result.error]
+        for failure in failures:
+            print(f'Failed to {failure.action} {failure.name}: {failure.error!r}')
+        if failures:
+            raise failures[0].error
+        return self.operation_results
+
+    @staticmethod
+    def run_operation(operation) -> HostGroupOperationResult:
+        """Run one hostgroup operation, timing it and catching what it raises."""
+        start = time.perf_counter()
+        try:
+            operation.run()
+        except Exception as exc: # pylint: disable=broad-except
+            return HostGroupOperationResult(operation.action, operation.name, time.perf_counter() - start, exc)
+        return HostGroupOperationResult(operation.action, operation.name, time.perf_counter() - start)
 
     def query_current_hostgroups(self) -> dict:
         """Query the current hostgroups that exist in Secure Network Analytics."""
@@ -113,99 +179,123 @@ class SnaHostGroupManager:
                 inside_host_children = SnaHostGroupManager.get_group_children(hostgroup_tree[0]['root'],inside_hosts_id)
                 net_org_hostgroup_children = SnaHostGroupManager.get_group_children(inside_host_children,net_organizer_groups_id)
                 hostgroup_map = SnaHostGroupManager.build_hostgroup_name_to_id_map(net_org_hostgroup_children)
-                for name,hostgroup_id in hostgroup_map.items():
-                    current_hostgroups[name] = self.get_list_of_ips_for_hostgroup(hostgroup_id)
+                # The tree is authoritative for the groups under Net Organizer Groups
+                self.get_hostgroup_index().update(hostgroup_map)
+                current_hostgroups = self.get_ranges_for_hostgroups(net_org_hostgroup_children)
         return current_hostgroups
 
+    def get_ranges_for_hostgroups(self, hostgroups) -> dict:
+        """Return hostgroup name -> ranges for hostgroups from the tag tree.
+
+        Ranges already carried in the tree are used as they are. The rest
+        are fetched concurrently, at most max_workers at a time, over the
+        one API session.
+        """
+        ranges = {hostgroup['name']: hostgroup['ranges'] for hostgroup in hostgroups if 'ranges' in hostgroup}
+        to_fetch = [hostgroup for hostgroup in hostgroups if 'ranges' not in hostgroup]
+        if to_fetch:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(to_fetch))) as executor:
+                fetched = executor.map(lambda hostgroup: self.get_list_of_ips_for_hostgroup(hostgroup['id']), to_fetch)
+                for hostgroup, list_of_ips in zip(to_fetch, fetched):
+                    ranges[hostgroup['name']] = list_of_ips
+        return {hostgroup['name']: ranges[hostgroup['name']] for hostgroup in hostgroups}
+
     def analyze_changes(self, old, new): # Tested
-        """Analyze the changes between what currently exists and the new modifications."""
-        diff = DeepDiff(old, new)
-        self.hostgroups_to_create_set = SnaHostGroupManager.get_hostgroups_to_create(diff)
-        self.hostgroups_to_update_set = SnaHostGroupManager.get_hostgroups_to_update(diff)
-        self.hostgroups_to_delete_set = SnaHostGroupManager.get_hostgroups_to_delete(diff)
+        """Analyze the changes between what currently exists and the new modifications.
 
-    @staticmethod # Tested
-    def get_hostgroups_to_create(diff) -> set:
-        """Determine the hostgroups that need to be created."""
-        create_set = set()
-        if diff:
-            if 'dictionary_item_added' in diff:
-                added_list = diff['dictionary_item_added']
-                for added in added_list:
-                    added = re.search(r"'(.*?)'", added, re.DOTALL).group()
-                    added = added.strip("'")
-                    create_set.add(added)
-        return create_set
+        Hostgroups are matched by name. Their ranges are compared as sets of
+        collapsed CIDRs, so the same addresses in a different order (or
+        written differently, e.g. two IPs rather than a /31) are not a change.
+        """
+        self.hostgroups_to_create_set = new.keys() - old.keys()
+        self.hostgroups_to_delete_set = old.keys() - new.keys()
+        self.hostgroups_to_update_set = {
+            name for name in new.keys() & old.keys()
+            if SnaHostGroupManager.normalize_ranges(old[name]) != SnaHostGroupManager.normalize_ranges(new[name])}
+
+    @staticmethod
+    def normalize_ranges(ranges) -> frozenset:
+        """Return the ranges of a hostgroup as a set of collapsed CIDRs (or as they are if they aren't all IPv4)."""
+        try:
+            return frozenset(collapse_ips(ranges))
+        except ValueError:
+            return frozenset(ranges)
 
     def create_hostgroups(self, hostgroups_to_create_set, hostgroups_changes): #Tested
         """Create the hostgroups."""
         net_organizer_hostgroup_id = self.ensure_net_organizer_groups_exists()
+        self.run_operations(self.get_create_operations(hostgroups_to_create_set, hostgroups_changes, net_organizer_hostgroup_id))
+
+    def get_create_operations(self, hostgroups_to_create_set, hostgroups_changes, parent_id) -> list:
+        """Return the operations that create the hostgroups under parent_id.
+
+        Each operation creates up to CREATE_CHUNK_SIZE hostgroups with one POST.
+        """
         if not hostgroups_to_create_set:
             print('No new host groups to add')
-        for hostgroup_name in hostgroups_to_create_set:
-            list_of_ips = hostgroups_changes[hostgroup_name]
-            print(f'Adding {hostgroup_name} {list_of_ips}')
-            self.create_hostgroup(hostgroup_name, list_of_ips, net_organizer_hostgroup_id)
+        hostgroups = {}
+        for hostgroup_name in sorted(hostgroups_to_create_set):
+            hostgroups[hostgroup_name] = hostgroups_changes[hostgroup_name]
+            print(f'Adding {hostgroup_name} {hostgroups[hostgroup_name]}')
+        names = list(hostgroups)
+        operations = []
+        for start in range(0, len(names), CREATE_CHUNK_SIZE):
+            chunk = {name: hostgroups[name] for name in names[start:start + CREATE_CHUNK_SIZE]}
+            operations.append(HostGroupOperation('create', ', '.join(chunk), partial(self.create_hostgroups_in_one_request, chunk, parent_id)))
+        return operations
 
     def create_hostgroup(self, name, list_of_ips_in_group, parent_id): # Tested
         """Create a single hostgroup."""
+        self.create_hostgroups_in_one_request({name: list_of_ips_in_group}, parent_id)
+
+    def create_hostgroups_in_one_request(self, hostgroups, parent_id):
+        """Create hostgroups (name -> list of IPs) under parent_id with one POST.
+
+        The ids returned are matched back to the names and added to the index.
+        """
         request_headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
-        request_data = [{
-            'parentDisplay': {
-                'name': SnaHostGroupManager.NET_ORGANIZER_GROUPS,
-                'path': [SnaHostGroupManager.INSIDE_HOSTS]
-            },
-            'display': {
-                'path': [SnaHostGroupManager.INSIDE_HOSTS, SnaHostGroupManager.NET_ORGANIZER_GROUPS]},
-                'parentId': parent_id,
-                'location': 'INSIDE',
-                'hostBaselines': True,
-                'suppressExcludedServices': True,
-                'inverseSuppression': False,
-                'hostTrap': False,
-                'name': name,
-                'ranges': list_of_ips_in_group}]
+        request_data = [SnaHostGroupManager.build_hostgroup(name, list_of_ips, parent_id) for name, list_of_ips in hostgroups.items()]
         url = f'https://{self.session.host}/smc-configuration/rest/v1/tenants/{self.session.tenant_id}/tags'
         response = self.session.api_session.request("POST", url, verify=False, data=json.dumps(request_data), headers=request_headers)
         if response.status_code != 200:
             raise FailedToCreateHostGroup()
+        for name, created in zip(hostgroups, json.loads(response.content)['data']):
+            self.remember_hostgroup_id(created.get('name', name), created['id'])
 
-    @staticmethod # Tested
-    def get_hostgroups_to_update(diff) -> set:
-        """Determine the hostgroups that have changed and need to be updated."""
-        # pylint: disable=invalid-name
-        # pylint: disable=unused-variable
-        update_set = set()
-        if diff:
-            if 'iterable_item_added' in diff:
-                added_list = diff['iterable_item_added']
-                for k,v in added_list.items():
-                    hostgroup = re.search(r"'(.*?)'", k, re.DOTALL).group()
-                    hostgroup = hostgroup.strip("'")
-                    update_set.add(hostgroup)
-            if 'iterable_item_removed' in diff:
-                removed_list = diff['iterable_item_removed']
-                for k,v in removed_list.items():
-                    hostgroup = re.search(r"'(.*?)'", k, re.DOTALL).group()
-                    hostgroup = hostgroup.strip("'")
-                    update_set.add(hostgroup)
-            if 'values_changed' in diff:
-                print(diff['values_changed'])
-                print(type(diff['values_changed']))
-                for k in diff['values_changed'].keys():
-                    hostgroup = re.search(r"'(.*?)'", k, re.DOTALL).group()
-                    hostgroup = hostgroup.strip("'")
-                    update_set.add(hostgroup)
-        return update_set
+    @staticmethod
+    def build_hostgroup(name, list_of_ips_in_group, parent_id) -> dict:
+        """Build the request for a hostgroup under Net Organizer Groups."""
+        return {
+            'parentDisplay': {
+                'name': SnaHostGroupManager.NET_ORGANIZER_GROUPS,
+                'path': [SnaHostGroupManager.INSIDE_HOSTS]
+            },
+            'display': {
+                'path': [SnaHostGroupManager.INSIDE_HOSTS, SnaHostGroupManager.NET_ORGANIZER_GROUPS]
+            },
+            'parentId': parent_id,
+            'location': 'INSIDE',
+            'hostBaselines': True,
+            'suppressExcludedServices': True,
+            'inverseSuppression': False,
+            'hostTrap': False,
+            'name': name,
+            'ranges': list_of_ips_in_group}
 
     def update_hostgroups(self, hostgroups_to_update_set, hostgroups_changes):
         """Update the hostgroups that have changed."""
+        self.run_operations(self.get_update_operations(hostgroups_to_update_set, hostgroups_changes))
+
+    def get_update_operations(self, hostgroups_to_update_set, hostgroups_changes) -> list:
+        """Return the operations that update the hostgroups that have changed."""
         if not hostgroups_to_update_set:
             print('No host groups to update')
+        operations = []
         for hostgroup_name in hostgroups_to_update_set:
             id_to_update = self.find_hostgroup_id(hostgroup_name)
             print(f'Updating {hostgroup_name} {id_to_update}')
-            self.update_hostgroup(id_to_update,hostgroups_changes[hostgroup_name])
+            operations.append(HostGroupOperation('update', hostgroup_name, partial(self.update_hostgroup, id_to_update, hostgroups_changes[hostgroup_name])))
+        return operations
 
     def update_hostgroup(self, id_to_update, new_ranges):
         """Update a single hostgroup."""
@@ -220,27 +310,20 @@ class SnaHostGroupManager:
             if response.status_code != 200:
                 raise FailedToUpdateHostGroup()
 
-    @staticmethod # Tested
-    def get_hostgroups_to_delete(diff) -> set:
-        """Determine the hostgroups that are no longer needed and need to be deleted."""
-        delete_set = set()
-        if diff:
-            if 'dictionary_item_removed' in diff:
-                removed_list = diff['dictionary_item_removed']
-                for removed in removed_list:
-                    removed = re.search(r"'(.*?)'", removed, re.DOTALL).group()
-                    removed = removed.strip("'")
-                    delete_set.add(removed)
-        return delete_set
-
     def delete_hostgroups(self, hostgroups_to_delete_set): #Tested
         """Delete the hostgroups that are no longer needed."""
+        self.run_operations(self.get_delete_operations(hostgroups_to_delete_set))
+
+    def get_delete_operations(self, hostgroups_to_delete_set) -> list:
+        """Return the operations that delete the hostgroups that are no longer needed."""
         if not hostgroups_to_delete_set:
             print('No host groups to delete')
+        operations = []
         for hostgroup_name in hostgroups_to_delete_set:
             id_to_delete = self.find_hostgroup_id(hostgroup_name)
             print(f'Deleting {hostgroup_name} {id_to_delete}')
-            self.delete_hostgroup(id_to_delete)
+            operations.append(HostGroupOperation('delete', hostgroup_name, partial(self.delete_hostgroup, id_to_delete)))
+        return operations
 
     def delete_hostgroup(self, hostgroup_id): # Tested
         """Delete a single hostgroup."""
@@ -249,6 +332,7 @@ class SnaHostGroupManager:
             response = self.session.api_session.request("DELETE", url, verify=False)
             if response.status_code != 200:
                 raise FailedToDeleteHostGroup()
+            self.forget_hostgroup_id(hostgroup_id)
 
     @staticmethod # Tested
     def get_group_children(root, hostgroup_id):
@@ -295,15 +379,47 @@ class SnaHostGroupManager:
                 break
         return found_id
 
+    @staticmethod
+    def build_hostgroup_index(tags) -> dict:
+        """Build a map from hostgroup name -> id from tags, the first tag with a name winning."""
+        hostgroup_index = {}
+        for tag in tags:
+            hostgroup_index.setdefault(tag['name'], tag['id'])
+        return hostgroup_index
+
+    def get_hostgroup_index(self) -> dict:
+        """Return the hostgroup name -> id index, fetching the tags the first time it is needed.
+
+        The index is kept current as hostgroups are created and deleted, so a
+        push fetches the tags once rather than once per hostgroup. Raises
+        FailedToQueryTags if the tags can't be fetched.
+        """
+        with self.hostgroup_index_lock:
+            if self.hostgroup_index is None:
+                url = f'https://{self.session.host}/smc-configuration/rest/v1/tenants/{self.session.tenant_id}/tags'
+                response = self.session.api_session.request("GET", url, verify=False)
+                if response.status_code != 200:
+                    raise FailedToQueryTags()
+                tags = json.loads(response.content)["data"]
+                self.hostgroup_index = SnaHostGroupManager.build_hostgroup_index(tags)
+            return self.hostgroup_index
+
+    def remember_hostgroup_id(self, hostgroup_name, hostgroup_id) -> None:
+        """Add a created hostgroup to the index."""
+        with self.hostgroup_index_lock:
+            self.get_hostgroup_index()[hostgroup_name] = hostgroup_id
+
+    def forget_hostgroup_id(self, hostgroup_id) -> None:
+        """Remove a deleted hostgroup from the index."""
+        with self.hostgroup_index_lock:
+            if not self.hostgroup_index:
+                return
+            for name in [name for name, found_id in self.hostgroup_index.items() if found_id == hostgroup_id]:
+                del self.hostgroup_index[name]
+
     def find_hostgroup_id(self, hostgroup_name): # Tested
         """Find the hostgroup ID from Secure Network Analytics given the name."""
-        url = f'https://{self.session.host}/smc-configuration/rest/v1/tenants/{self.session.tenant_id}/tags'
-        response = self.session.api_session.request("GET", url, verify=False)
-        found_id = ''
-        if response.status_code == 200:
-            tags = json.loads(response.content)["data"]
-            found_id = SnaHostGroupManager.find_hostgroup_id_in_tags_data(tags, hostgroup_name)
-        return found_id
+        return self.get_hostgroup_index().get(hostgroup_name, '')
 
     def create_net_organizer_groups_group(self): # Tested
         """Create the root group 'Net Organizer Groups' under 'Inside Hosts'."""
@@ -327,7 +443,9 @@ class SnaHostGroupManager:
         url = f'https://{self.session.host}/smc-configuration/rest/v1/tenants/{self.session.tenant_id}/tags'
         response = self.session.api_session.request("POST", url, verify=False, data=json.dumps(request_data), headers=request_headers)
         if response.status_code == 200:
-            return json.loads(response.content)['data'][0]['id']
+            net_organizer_hostgroup_id = json.loads(response.content)['data'][0]['id']
+            self.remember_hostgroup_id(SnaHostGroupManager.NET_ORGANIZER_GROUPS, net_organizer_hostgroup_id)
+            return net_organizer_hostgroup_id
         raise FailedToCreateNetOrganizerGroupsGroup()
 
 class SnaSession:
@@ -335,8 +453,9 @@ class SnaSession:
 
     XSRF_HEADER_NAME = 'X-XSRF-TOKEN'
 
-    def __init__(self, host) -> None:
+    def __init__(self, host, pool_size=MAX_WORKERS) -> None:
         self.host = host
+        self.pool_size = pool_size
         self.api_session = None
         self.tenant_id = ''
 
@@ -345,9 +464,15 @@ class SnaSession:
         self.authenticate(user,password)
         self.get_set_tenant_id()
 
+    def create_api_session(self) -> requests.Session:
+        """Create a requests session pooling enough connections for the hostgroup requests made at once."""
+        api_session = requests.Session()
+        api_session.mount('https://', HTTPAdapter(pool_maxsize=self.pool_size))
+        return api_session
+
     def authenticate(self, user, password):
         """Authenticate with Secure Network Analytics."""
-        self.api_session = requests.Session()
+        self.api_session = self.create_api_session()
         uri = "https://" + self.host + "/token/v2/authenticate"
         login_request_data = {
             "username": user,
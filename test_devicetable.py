@@ -1,6 +1,9 @@
 """Tests for devicetable module."""
+import contextlib
+import io
 import unittest
-from devicetable import DeviceTableBuilder, DeviceTableLoader
+import pandas as pd
+from devicetable import DeviceTable, DeviceTableBuilder, DeviceTableLoader
 
 class TestDeviceTableBuilder(unittest.TestCase):
     """Tests for devicetable.DeviceTableBuilder."""
@@ -243,3 +246,77 @@ class TestDeviceTableLoader(unittest.TestCase) :
         for mac in expected :
             self.assertIn(mac,actual)
         self.assertEqual(len(expected),len(actual))
+
+class TestColumnarEngine(unittest.TestCase) :
+    """Test that the columnar engine builds the same table as the records engine."""
+
+    def test_equivalent(self) :
+        """Test equivalence on the standard test table."""
+        records_df, columnar_df = [
+            DeviceTableLoader(MockKnownDevicesLoader(), MockActiveClientsLoader(),
+                              MockFixedIpReservationsLoader(), engine).load_all().df
+            for engine in ['records', 'columnar']]
+        pd.testing.assert_frame_equal(records_df, columnar_df)
+
+    def test_streaming(self) :
+        """Test that the streaming engine takes active clients from iterate() and gives the same table."""
+        class StreamingActiveClientsLoader(MockActiveClientsLoader):
+            """Only yields active clients one at a time."""
+            def load(self) -> list:
+                raise AssertionError('the streaming engine should not load every active client at once')
+
+            def iterate(self):
+                """Yield the test data."""
+                yield from MockActiveClientsLoader.active_clients_list
+
+        records_df = DeviceTableLoader(MockKnownDevicesLoader(), MockActiveClientsLoader(),
+                                       MockFixedIpReservationsLoader(), 'records').load_all().df
+        streaming_df = DeviceTableLoader(MockKnownDevicesLoader(), StreamingActiveClientsLoader(),
+                                         MockFixedIpReservationsLoader(), 'streaming').load_all().df
+        pd.testing.assert_frame_equal(records_df, streaming_df)
+
+    def test_unknown_engine(self) :
+        """Test that an unknown engine is rejected."""
+        with self.assertRaises(ValueError):
+            DeviceTableLoader(None, None, None, 'rows')
+
+class TestDeviceTable(unittest.TestCase) :
+    """Test cases for DeviceTable lookups."""
+
+    devices = [
+        {'mac': 'aab', 'known': False, 'reserved': False, 'active': True,
+         'ip': '192.168.128.10', 'group': '', 'name': 'JASCHAMB-M-XRDP'},
+        {'mac': 'baa', 'known': True, 'reserved': False, 'active': False,
+         'ip': '', 'group': 'printers', 'name': 'Aura-6141'}]
+
+    def test_get_by_mac(self) :
+        """Test lookup of a device by MAC."""
+        device_table = DeviceTable(self.devices)
+        self.assertEqual('Aura-6141', device_table.get_by_mac('baa')['name'])
+        self.assertIsNone(device_table.get_by_mac('zzz'))
+
+    def test_get_by_ip(self) :
+        """Test lookup of a device by IP, including after IPs change."""
+        device_table = DeviceTable(self.devices)
+        self.assertEqual('aab', device_table.get_by_ip('192.168.128.10')['mac'])
+        self.assertIsNone(device_table.get_by_ip(''))
+        device_table.set_ips(device_table.df['ip'] == '', ['192.168.128.11'])
+        self.assertEqual('baa', device_table.get_by_ip('192.168.128.11')['mac'])
+
+    def test_duplicate_mac(self) :
+        """Test that a duplicate MAC is dropped, keeping the first, with a warning."""
+        duplicate = dict(self.devices[0], name='Duplicate')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            device_table = DeviceTable(self.devices + [duplicate])
+        self.assertEqual(['aab', 'baa'], device_table.get_macs())
+        self.assertEqual('JASCHAMB-M-XRDP', device_table.get_by_mac('aab')['name'])
+        self.assertEqual('aab', device_table.get_by_ip('192.168.128.10')['mac'])
+        self.assertIn('aab', output.getvalue())
+
+    def test_schema(self) :
+        """Test that the flags are booleans and the group is categorical."""
+        df = DeviceTable(self.devices).df
+        for column in ['known', 'reserved', 'active']:
+            self.assertEqual('bool', df[column].dtype)
+        self.assertEqual('category', df['group'].dtype)
@@ -1,8 +1,10 @@
 """Tests for generate.py."""
+import contextlib
+import io
 import unittest
 import pandas as pd
 from generate import KnownDevicesGenerator, NetorgGenerator
-from devicetable import DeviceTableBuilder, DeviceTableLoader
+from devicetable import DeviceTable, DeviceTableBuilder, DeviceTableLoader
 from knowndevicesloader import KnownDevicesLoader
 from netorgmeraki import MerakiFixedIpReservationsGenerator
 
@@ -136,3 +138,18 @@ class TestKnownDevicesGenerator(unittest.TestCase):
                                                 MockFixedIpReservationsLoader())
         device_table = device_table_loader.load_all()
         MerakiFixedIpReservationsGenerator.generate(device_table)
+
+    def test_meraki_fixed_ip_reservations_generator_same_ip(self):
+        """ Test MerakiFixedIpReservationsGenerator.generate() reports devices given the same IP."""
+        device_table = DeviceTable([
+            {'mac': 'kra', 'known': True, 'reserved': True, 'active': False,
+             'ip': '192.168.128.10', 'group': 'servers', 'name': 'kra'},
+            {'mac': 'k_a', 'known': True, 'reserved': False, 'active': True,
+             'ip': '192.168.128.10', 'group': 'servers', 'name': 'k_a'},
+            {'mac': '_r_', 'known': False, 'reserved': True, 'active': False,
+             'ip': '192.168.128.11', 'group': 'unclassified', 'name': '_r_'}])
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            fixed_ip_reservations = MerakiFixedIpReservationsGenerator.generate(device_table)
+        self.assertEqual(['kra', 'k_a'], list(fixed_ip_reservations))
+        self.assertIn('k_a has the same IP 192.168.128.10 as kra', output.getvalue())
@@ -2,6 +2,8 @@
 import unittest
 from ipv4privatenetworkspace import Ipv4PrivateNetworkSpace
 from ipv4privatenetworkspace import NetworkIsOutOfSpace
+from ipv4privatenetworkspace import GroupBlockStrategy, HighestFirstStrategy, LowestFirstStrategy, StickyStrategy
+from ipv4privatenetworkspace import collapse_ips, create_allocation_strategy, ip_to_int
 
 class TestIpv4PrivateNetworkSpace(unittest.TestCase):
     """Tests for Ipv4PrivateNetworkSpace."""
@@ -45,3 +47,160 @@ class TestIpv4PrivateNetworkSpace(unittest.TestCase):
         allocated_address = network_space.allocate_specific_address("192.168.128.254")
         self.assertEqual('192.168.128.254', allocated_address, "Expected allocate_address to return 192.168.128.254")
         self.assertRaises(ValueError, network_space.allocate_specific_address, "192.168.128.254") # Already in use
+
+    def test_large_network_space(self) :
+        """Test a /8 can be created and allocated from without enumerating every host."""
+        network_space = Ipv4PrivateNetworkSpace("10.0.0.0/8")
+        self.assertEqual(2**24 - 2, len(network_space.get_address_set()))
+        self.assertIn('10.255.255.254', network_space.get_unused_set())
+        self.assertNotIn('10.255.255.255', network_space.get_unused_set())
+        network_space.allocate_specific_address("10.0.0.1")
+        self.assertEqual('10.0.0.2', network_space.allocate_address())
+        self.assertEqual(2**24 - 4, len(network_space.get_unused_set()))
+        self.assertSetEqual({'10.0.0.1', '10.0.0.2'}, network_space.get_used_set())
+
+    def test_allocate_around_specific_addresses(self) :
+        """Test allocation fills the gaps left between specific addresses."""
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.248/29")
+        network_space.allocate_specific_address("192.168.128.250")
+        network_space.allocate_specific_address("192.168.128.252")
+        allocated = { network_space.allocate_address() for _ in range(4) }
+        self.assertSetEqual({'192.168.128.249', '192.168.128.251', '192.168.128.253', '192.168.128.254'}, allocated)
+        self.assertEqual(set(), set(network_space.get_unused_set()))
+        self.assertRaises(NetworkIsOutOfSpace, network_space.allocate_address)
+
+    def test_allocate_from_fragmented_space(self) :
+        """Test the free pool stays consistent as fragmented intervals are exhausted."""
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24")
+        for host in range(2, 255, 2):
+            network_space.allocate_specific_address(f'192.168.128.{host}')
+        allocated = [ network_space.allocate_address() for _ in range(127) ]
+        self.assertListEqual([f'192.168.128.{host}' for host in range(1, 255, 2)], allocated)
+        self.assertEqual(254, len(network_space.get_used_set()))
+        self.assertEqual(0, len(network_space.get_unused_set()))
+        self.assertRaises(NetworkIsOutOfSpace, network_space.allocate_address)
+        self.assertRaises(ValueError, network_space.allocate_specific_address, "192.168.128.1")
+
+    def test_lowest_first_is_deterministic(self) :
+        """Test the same input always produces the same allocations."""
+        plans = []
+        for _ in range(2):
+            network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24")
+            network_space.allocate_specific_address("192.168.128.1")
+            network_space.allocate_specific_address("192.168.128.3")
+            plans.append([network_space.allocate_address() for _ in range(3)])
+        self.assertListEqual(['192.168.128.2', '192.168.128.4', '192.168.128.5'], plans[0])
+        self.assertListEqual(plans[0], plans[1])
+
+    def test_highest_first_strategy(self) :
+        """Test allocation from the top of the space."""
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24", HighestFirstStrategy())
+        network_space.allocate_specific_address("192.168.128.253")
+        self.assertEqual('192.168.128.254', network_space.allocate_address())
+        self.assertEqual('192.168.128.252', network_space.allocate_address())
+
+    def test_group_block_strategy(self) :
+        """Test each group is given its own aligned block."""
+        # pylint: disable=line-too-long
+        strategy = GroupBlockStrategy(block_size=16)
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24", strategy)
+        network_space.allocate_specific_address("192.168.128.20")
+        self.assertEqual('192.168.128.32', network_space.allocate_address('m1', 'Lights'))
+        self.assertEqual('192.168.128.48', network_space.allocate_address('m2', 'Ring'))
+        self.assertEqual('192.168.128.33', network_space.allocate_address('m3', 'Lights'))
+        self.assertEqual(1, len(strategy.get_blocks()['Lights']))
+        for _ in range(14):
+            network_space.allocate_address('mx', 'Lights')
+        self.assertEqual('192.168.128.64', network_space.allocate_address('m4', 'Lights'))
+        self.assertEqual(2, len(strategy.get_blocks()['Lights']))
+
+    def test_group_block_fallback(self) :
+        """Test that a group with no whole block left avoids the other groups' blocks while it can."""
+        strategy = GroupBlockStrategy(block_size=4)
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/28", strategy)
+        for ip in ['192.168.128.1', '192.168.128.2', '192.168.128.3']:
+            network_space.allocate_specific_address(ip)
+        self.assertEqual('192.168.128.4', network_space.allocate_address('m1', 'Lights'))
+        self.assertEqual('192.168.128.8', network_space.allocate_address('m2', 'Ring'))
+        self.assertListEqual(
+            ['192.168.128.12', '192.168.128.13', '192.168.128.14'],
+            [network_space.allocate_address(f'c{i}', 'Cameras') for i in range(3)])
+        # Only the other groups' blocks are left
+        self.assertEqual('192.168.128.5', network_space.allocate_address('c3', 'Cameras'))
+
+    def test_find_free_block(self) :
+        """Test that repeated searches find the same blocks as a search of the whole space."""
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24")
+        base = ip_to_int('192.168.128.0')
+        self.assertEqual(base + 16, network_space.find_free_block(16))
+        network_space.allocate_specific_address('192.168.128.20')
+        self.assertEqual(base + 32, network_space.find_free_block(16))
+        self.assertEqual(base + 4, network_space.find_free_block(4))
+        network_space.allocate_specific_address('192.168.128.5')
+        self.assertEqual(base + 8, network_space.find_free_block(4))
+        self.assertIsNone(network_space.find_free_block(256))
+        self.assertIsNone(network_space.find_free_block(256))
+
+    def test_group_blocks_do_not_overlap(self) :
+        """Blocks for groups of different sizes in a partly used subnet never overlap."""
+        strategy = GroupBlockStrategy()
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24", strategy)
+        for i in range(1, 8):
+            network_space.allocate_specific_address(f'192.168.128.{i}')
+        strategy.prepare({'A': 5, 'B': 2})
+        groups = ['A', 'B', 'A', 'A', 'B', 'A', 'A']
+        ips = network_space.allocate_addresses([f'm{i}' for i in range(len(groups))], groups)
+        a_ips = [ip for ip, group in zip(ips, groups) if group == 'A']
+        b_ips = [ip for ip, group in zip(ips, groups) if group == 'B']
+        self.assertDictEqual({'A': ['192.168.128.8/29'], 'B': ['192.168.128.16/30']}, strategy.get_block_cidrs())
+        self.assertListEqual(['192.168.128.8/30', '192.168.128.12'], collapse_ips(a_ips))
+        self.assertListEqual(['192.168.128.16/31'], collapse_ips(b_ips))
+
+    def test_sticky_strategy(self) :
+        """Test a device is given its previous address when it is still free."""
+        history = {'aa': '192.168.128.100', 'bb': '192.168.128.101'}
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24", StickyStrategy(history))
+        network_space.allocate_specific_address("192.168.128.101")
+        self.assertEqual('192.168.128.100', network_space.allocate_address('aa'))
+        self.assertEqual('192.168.128.1', network_space.allocate_address('bb'))
+        self.assertEqual('192.168.128.2', network_space.allocate_address('cc'))
+
+    def test_create_allocation_strategy(self) :
+        """Test strategies can be created by name."""
+        self.assertIsInstance(create_allocation_strategy('highest'), HighestFirstStrategy)
+        self.assertIsInstance(create_allocation_strategy('sticky', {}), StickyStrategy)
+        self.assertRaises(ValueError, create_allocation_strategy, 'random')
+
+    def test_allocate_addresses_matches_allocate_address(self) :
+        """Test batch allocation gives the same result as one call per device."""
+        macs = [f'mac{i}' for i in range(40)]
+        groups = ['a', 'b', 'c', 'd'] * 10
+        for strategy_name in ['lowest', 'highest', 'group_block']:
+            per_device_space = Ipv4PrivateNetworkSpace("192.168.128.0/24", create_allocation_strategy(strategy_name))
+            batch_space = Ipv4PrivateNetworkSpace("192.168.128.0/24", create_allocation_strategy(strategy_name))
+            for network_space in (per_device_space, batch_space):
+                for host in (1, 2, 5, 9, 30):
+                    network_space.allocate_specific_address(f'192.168.128.{host}')
+            expected = [per_device_space.allocate_address(mac, group) for mac, group in zip(macs, groups)]
+            self.assertListEqual(expected, batch_space.allocate_addresses(macs, groups))
+            self.assertSetEqual(per_device_space.get_used_set(), batch_space.get_used_set())
+            self.assertSetEqual(set(per_device_space.get_unused_set()), set(batch_space.get_unused_set()))
+
+    def test_allocate_addresses_out_of_space(self) :
+        """Test batch allocation raises when the space is exhausted."""
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.252/30")
+        self.assertRaises(NetworkIsOutOfSpace, network_space.allocate_addresses, ['a', 'b', 'c'])
+        # Nothing was allocated, so the space can still be used
+        self.assertSetEqual(set(), network_space.get_used_set())
+        self.assertListEqual(['192.168.128.253', '192.168.128.254'], network_space.allocate_addresses(['a', 'b']))
+
+    def test_allocate_batch(self) :
+        """Test that a strategy decides how a batch is allocated."""
+        class CountingStrategy(LowestFirstStrategy):
+            batches = []
+            def allocate_batch(self, network_space, macs, groups) -> list:
+                self.batches.append(list(macs))
+                return super().allocate_batch(network_space, macs, groups)
+        network_space = Ipv4PrivateNetworkSpace("192.168.128.0/24", CountingStrategy())
+        self.assertListEqual(['192.168.128.1', '192.168.128.2'], network_space.allocate_addresses(['a', 'b']))
+        self.assertListEqual([['a', 'b']], CountingStrategy.batches)
@@ -0,0 +1,83 @@
+"""Tests for netorgmeraki."""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from netorgmeraki import ActiveClientsCache, MerakiActiveClientsLoader
+
+# Loads the active clients with the hex adapter, from a dashboard that
+# returns the clients given on the command line
+HEX_LOAD = '''
+import json
+import sys
+from adapters.activeclients_meraki import ActiveClientsMerakiAdapter
+
+class ClientsDashboard:
+    def __init__(self) -> None:
+        self.devices = self
+
+    # pylint: disable=invalid-name
+    def getDeviceClients(self, serial, **kwargs) -> list:
+        return json.loads(sys.argv[2])
+
+config = json.loads(sys.argv[1])
+active_clients = ActiveClientsMerakiAdapter(config, ClientsDashboard()).load()
+print(json.dumps([active_client._asdict() for active_client in active_clients]))
+'''
+
+class ClientsDashboard:
+    """Stands in for the Meraki dashboard, returning the given device clients."""
+
+    def __init__(self, device_clients) -> None:
+        self.devices = self
+        self.device_clients = device_clients
+
+    # pylint: disable=invalid-name
+    def getDeviceClients(self, serial, **kwargs) -> list:
+        return self.device_clients
+
+class TestActiveClientsCache(unittest.TestCase):
+    """Tests for the active clients cache shared with the hex adapters."""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = {
+            'serial_id': 'Q2XX-XXXX-XXXX',
+            'vlan_id': 1,
+            'active_clients_timespan': 3600,
+            'active_clients_cache': os.path.join(self.directory.name, 'clients.json')}
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def legacy_load(self, device_clients) -> list:
+        """Load the active clients with the legacy loader."""
+        return MerakiActiveClientsLoader(
+            ClientsDashboard(device_clients), self.config['serial_id'], self.config['vlan_id'],
+            timespan=self.config['active_clients_timespan'], cache=ActiveClientsCache.from_config(self.config)).load()
+
+    def hex_load(self, device_clients) -> list:
+        """Load the active clients with the hex adapter."""
+        completed = subprocess.run(
+            [sys.executable, '-c', HEX_LOAD, json.dumps(self.config), json.dumps(device_clients)],
+            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hex'),
+            capture_output=True, check=True, text=True)
+        return json.loads(completed.stdout)
+
+    def test_legacy_then_hex(self):
+        """Test that the hex adapter reads a cache the legacy loader wrote."""
+        self.legacy_load([{'mac': 'aaa', 'dhcpHostname': 'a', 'description': 'A', 'ip': '192.168.128.10', 'vlan': 1}])
+        self.assertEqual(
+            [{'mac': 'aaa', 'name': 'a', 'description': 'A', 'ip_address': '192.168.128.10', 'vlan_id': '1'}],
+            self.hex_load([]))
+
+    def test_hex_then_legacy(self):
+        """Test that the legacy loader reads a cache the hex adapter wrote."""
+        self.hex_load([{'mac': 'bbb', 'dhcpHostname': 'b', 'description': 'B', 'ip': '192.168.128.11', 'vlan': 1}])
+        active_clients = self.legacy_load([])
+        self.assertEqual(
+            [('bbb', 'B', '192.168.128.11')],
+            [(client['mac'], client['description'], client['ip']) for client in active_clients])
@@ -1,7 +1,105 @@
 """Tests for netorgsna.py."""
+import contextlib
+import io
+import json
+import threading
+import time
 import unittest
+from collections import Counter
 
-from netorgsna import SnaHostGroupManager
+import pandas as pd
+from netorgsna import CREATE_CHUNK_SIZE, FailedToQueryTags, FailedToUpdateHostGroup, SnaAdapter, SnaHostGroupManager, SnaSession
+
+class FakeResponse:
+    """A response from FakeSnaApi."""
+
+    def __init__(self, status_code, data=None) -> None:
+        self.status_code = status_code
+        self.content = json.dumps({'data': data}).encode('utf8')
+
+class FakeSnaApi:
+    """Stands in for the Secure Network Analytics tags API, counting the requests made."""
+
+    def __init__(self, hostgroups, tree_has_ranges=False, latency=0, failing=()) -> None:
+        self.tree_has_ranges = tree_has_ranges
+        self.latency = latency
+        self.failing = set(failing)
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.tags = {
+            1: {'id': 1, 'name': 'Inside Hosts', 'parentId': 0, 'ranges': []},
+            2: {'id': 2, 'name': 'Servers', 'parentId': 1, 'ranges': []},
+            50132: {'id': 50132, 'name': 'Net Organizer Groups', 'parentId': 1, 'ranges': []}}
+        self.next_id = 60000
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        for name, ranges in hostgroups.items():
+            self.add({'name': name, 'parentId': 50132, 'ranges': ranges})
+
+    def add(self, tag) -> dict:
+        """Add a tag, giving it the next id."""
+        self.next_id += 1
+        self.tags[self.next_id] = {**tag, 'id': self.next_id}
+        return self.tags[self.next_id]
+
+    def get_hostgroups(self) -> dict:
+        """Return the groups under Net Organizer Groups as name -> ranges."""
+        return {tag['name']: tag['ranges'] for tag in self.tags.values() if tag['parentId'] == 50132}
+
+    def get_tree(self, parent_id) -> list:
+        """Return the children of a tag as the tags/tree endpoint does."""
+        return [
+            {'id': tag['id'], 'name': tag['name'], 'children': self.get_tree(tag['id']),
+             **({'ranges': tag['ranges']} if self.tree_has_ranges else {})}
+            for tag in self.tags.values() if tag['parentId'] == parent_id]
+
+    # pylint: disable=unused-argument
+    def request(self, method, url, verify=None, data=None, headers=None) -> FakeResponse:
+        """Answer a request to the tags API."""
+        with self.lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        try:
+            return self.answer(method, url, data)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def answer(self, method, url, data) -> FakeResponse:
+        """Answer a request to the tags API once it has arrived."""
+        path = url.split('/tags', 1)[1]
+        with self.lock:
+            self.requests[(method, 'tree' if path == '/tree' else 'tag' if path else 'tags')] += 1
+            if path == '/tree':
+                return FakeResponse(200, [{'root': self.get_tree(0)}])
+            if not path:
+                if method == 'POST':
+                    tags = json.loads(data)
+                    if any(tag['name'] in self.failing or tag['parentId'] not in self.tags for tag in tags):
+                        return FakeResponse(400)
+                    return FakeResponse(200, [self.add(tag) for tag in tags])
+                return FakeResponse(200, [{'id': tag['id'], 'name': tag['name']} for tag in self.tags.values()])
+            tag_id = int(path.strip('/'))
+            if tag_id not in self.tags:
+                return FakeResponse(404)
+            if method == 'GET':
+                return FakeResponse(200, dict(self.tags[tag_id]))
+            if self.tags[tag_id]['name'] in self.failing:
+                return FakeResponse(500)
+            if method == 'PUT':
+                self.tags[tag_id] = json.loads(data)
+                return FakeResponse(200, self.tags[tag_id])
+            del self.tags[tag_id]
+            return FakeResponse(200)
+
+class FakeSnaSession:
+    """Stands in for SnaSession."""
+
+    def __init__(self, api) -> None:
+        self.host = 'sna.example.com'
+        self.tenant_id = 101
+        self.api_session = api
 
 class TestSnaHostGroupManager(unittest.TestCase) :
     """Tests for SnaHostGroupManager."""
@@ -141,6 +239,24 @@ class TestSnaHostGroupManager(unittest.TestCase) :
         self.assertIn('unclassified', sna_hostgroup_manager.hostgroups_to_update_set)
         self.assertIn('lights', sna_hostgroup_manager.hostgroups_to_update_set)
 
+    def test_analyze_changes_same_ranges(self):
+        """Test that the same addresses in a different order or collapsed differently are not a change."""
+        current_hostgroups = {
+            'lights': ['192.168.129.61', '192.168.129.21', '192.168.129.16/31'],
+            'ring': ['192.168.128.15', '192.168.128.16'],
+            'eero': ['192.168.128.11']
+        }
+        new_hostgroups = {
+            'lights': ['192.168.129.16', '192.168.129.17', '192.168.129.21', '192.168.129.61'],
+            'ring': ['192.168.128.16', '192.168.128.15'],
+            'eero': ['192.168.128.11', '192.168.128.12']
+        }
+        sna_hostgroup_manager = SnaHostGroupManager(None)
+        sna_hostgroup_manager.analyze_changes(current_hostgroups,new_hostgroups)
+        self.assertEqual(set(), sna_hostgroup_manager.hostgroups_to_create_set)
+        self.assertEqual({'eero'}, sna_hostgroup_manager.hostgroups_to_update_set)
+        self.assertEqual(set(), sna_hostgroup_manager.hostgroups_to_delete_set)
+
     def test_get_group_children(self):
         """Test SnaHostGroupManager.get_group_children()."""
         inside_host_children = SnaHostGroupManager.get_group_children(
@@ -165,3 +281,133 @@ class TestSnaHostGroupManager(unittest.TestCase) :
             net_org_hostgroup_children)
         expected = {'Eero': 50134, 'Lights': 50133, 'Ring': 50136, 'Speakers': 50135}
         self.assertDictEqual(expected, hostgroup_name_to_id_map)
+
+class TestSnaHostGroupIndex(unittest.TestCase) :
+    """Tests for the hostgroup name -> id index."""
+
+    def test_one_tags_fetch_per_push(self):
+        """Test that a push fetches the tags once however many groups change."""
+        api = FakeSnaApi({f'group{i}': [f'192.168.128.{i}'] for i in range(20)})
+        new_hostgroups = {f'group{i}': [f'192.168.129.{i}'] for i in range(10, 30)}
+        sna_hostgroup_manager = SnaHostGroupManager(FakeSnaSession(api))
+        with contextlib.redirect_stdout(io.StringIO()):
+            sna_hostgroup_manager.push_changes(new_hostgroups)
+        self.assertEqual(new_hostgroups, api.get_hostgroups())
+        self.assertEqual(1, api.requests[('GET', 'tags')])
+
+    def test_index_kept_current(self):
+        """Test that created and deleted groups are reflected in the index."""
+        api = FakeSnaApi({'Lights': ['192.168.128.10']})
+        sna_hostgroup_manager = SnaHostGroupManager(FakeSnaSession(api))
+        with contextlib.redirect_stdout(io.StringIO()):
+            sna_hostgroup_manager.create_hostgroup('Eero', ['192.168.128.11'], 50132)
+            lights_id = sna_hostgroup_manager.find_hostgroup_id('Lights')
+            sna_hostgroup_manager.delete_hostgroup(lights_id)
+        self.assertEqual('', sna_hostgroup_manager.find_hostgroup_id('Lights'))
+        self.assertIn(sna_hostgroup_manager.find_hostgroup_id('Eero'), api.tags)
+        self.assertEqual(1, api.requests[('GET', 'tags')])
+
+    def test_tags_unavailable(self):
+        """Test that failing to fetch the tags raises rather than pushing with an empty index."""
+        api = FakeSnaApi({'Lights': ['192.168.128.10']})
+        requests_made = []
+        api.answer = lambda method, url, data: requests_made.append((method, url)) or FakeResponse(500)
+        sna_hostgroup_manager = SnaHostGroupManager(FakeSnaSession(api))
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(FailedToQueryTags):
+                sna_hostgroup_manager.push_changes({'Lights': ['192.168.128.11']})
+        self.assertEqual(1, len(requests_made))
+
+class TestSnaQueryCurrentHostGroups(unittest.TestCase) :
+    """Tests for reading the hostgroups under Net Organizer Groups."""
+
+    def test_ranges_fetched_concurrently(self):
+        """Test that each hostgroup's ranges are fetched, a bounded number at a time."""
+        hostgroups = {f'group{i}': [f'192.168.128.{i}'] for i in range(40)}
+        api = FakeSnaApi(hostgroups, latency=0.01)
+        sna_hostgroup_manager = SnaHostGroupManager(FakeSnaSession(api), max_workers=4)
+        self.assertEqual(hostgroups, sna_hostgroup_manager.query_current_hostgroups())
+        self.assertEqual(40, api.requests[('GET', 'tag')])
+        self.assertGreater(api.most_in_flight, 1)
+        self.assertLessEqual(api.most_in_flight, 4)
+
+    def test_ranges_from_tree(self):
+        """Test that no hostgroup is fetched when the tree carries the ranges."""
+        hostgroups = {f'group{i}': [f'192.168.128.{i}'] for i in range(40)}
+        api = FakeSnaApi(hostgroups, tree_has_ranges=True)
+        sna_hostgroup_manager = SnaHostGroupManager(FakeSnaSession(api))
+        self.assertEqual(hostgroups, sna_hostgroup_manager.query_current_hostgroups())
+        self.assertEqual(0, api.requests[('GET', 'tag')])
+
+class TestSnaHostGroupOperations(unittest.TestCase) :
+    """Tests for running the hostgroup creates, updates and deletes."""
+
+    def test_concurrent_push(self):
+        """Test that the creates, updates and deletes run concurrently and each is timed."""
+        api = FakeSnaApi({f'group{i}': [f'192.168.128.{i}'] for i in range(30)}, tree_has_ranges=True, latency=0.01)
+        new_hostgroups = {f'group{i}': [f'192.168.129.{i}'] for i in range(10, 40)}
+        sna_hostgroup_manager = SnaHostGroupManager(FakeSnaSession(api), max_workers=4)
+        with contextlib.redirect_stdout(io.StringIO()):
+            sna_hostgroup_manager.push_changes(new_hostgroups)
+        self.assertEqual(new_hostgroups, api.get_hostgroups())
+        self.assertLessEqual(api.most_in_flight, 4)
+        self.assertGreater(api.most_in_flight, 1)
+        results = sna_hostgroup_manager.operation_results
+        self.assertEqual({'create': 1, 'update': 20, 'delete': 10}, Counter(result.action for result in results))
+        self.assertTrue(all(result.latency > 0 and result.error is None for result in results))
+
+    def test_parent_created_first(self):
+        """Test that Net Organizer Groups is created before the groups under it."""
+        api = FakeSnaApi({})
+        del api.tags[50132]
+        new_hostgroups = {f'group{i}': [f'192.168.129.{i}'] for i in range(10)}
+        sna_hostgroup_manager = SnaHostGroupManager(FakeSnaSession(api))
+        with contextlib.redirect_stdout(io.StringIO()):
+            sna_hostgroup_manager.push_changes(new_hostgroups)
+        parent_id = sna_hostgroup_manager.find_hostgroup_id('Net Organizer Groups')
+        self.assertEqual(10, sum(1 for tag in api.tags.values() if tag['parentId'] == parent_id))
+
+    def test_failures_collected(self):
+        """Test that every operation runs when one fails and the failure is raised afterwards."""
+        api = FakeSnaApi({f'group{i}': [f'192.168.128.{i}'] for i in range(10)}, tree_has_ranges=True, failing={'group3'})
+        new_hostgroups = {f'group{i}': [f'192.168.129.{i}'] for i in range(10)}
+        sna_hostgroup_manager = SnaHostGroupManager(FakeSnaSession(api))
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(FailedToUpdateHostGroup):
+                sna_hostgroup_manager.push_changes(new_hostgroups)
+        failures = [result.name for result in sna_hostgroup_manager.operation_results if result.error]
+        self.assertEqual(['group3'], failures)
+        self.assertEqual(['192.168.129.9'], api.get_hostgroups()['group9'])
+
+    def test_bulk_create(self):
+        """Test that new hostgroups are created in chunked POSTs and each id is mapped back to its name."""
+        api = FakeSnaApi({})
+        new_hostgroups = {f'group{i}': [f'192.168.129.{i}'] for i in range(2 * CREATE_CHUNK_SIZE + 1)}
+        sna_hostgroup_manager = SnaHostGroupManager(FakeSnaSession(api))
+        with contextlib.redirect_stdout(io.StringIO()):
+            sna_hostgroup_manager.create_hostgroups(set(new_hostgroups), new_hostgroups)
+        self.assertEqual(new_hostgroups, api.get_hostgroups())
+        self.assertEqual(3, api.requests[('POST', 'tags')])
+        for name in new_hostgroups:
+            self.assertEqual(name, api.tags[sna_hostgroup_manager.find_hostgroup_id(name)]['name'])
+
+class TestSnaAdapter(unittest.TestCase) :
+    """Tests for SnaAdapter."""
+
+    def test_build_hostgroups(self):
+        """Test that contiguous IPs in a group are collapsed into CIDRs."""
+        df = pd.DataFrame({
+            'group': ['Lights'] * 5 + ['Eero'],
+            'ip': ['192.168.128.10'] + [f'192.168.128.{i}' for i in range(32, 36)] + ['192.168.128.11']})
+        self.assertDictEqual(
+            {'Lights': ['192.168.128.10', '192.168.128.32/30'], 'Eero': ['192.168.128.11']},
+            SnaAdapter({}).build_hostgroups(df))
+
+class TestSnaSession(unittest.TestCase) :
+    """Tests for SnaSession."""
+
+    def test_pool_size(self):
+        """Test that the session pools as many connections as requests are made at once."""
+        api_session = SnaSession('sna.example.com', pool_size=16).create_api_session()
+        # pylint: disable=protected-access
+        self.assertEqual(16, api_session.get_adapter('https://sna.example.com')._pool_maxsize)
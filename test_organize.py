@@ -1,7 +1,7 @@
 """Tests for organize.py."""
 import unittest
 
-from devicetable import DeviceTableLoader
+from devicetable import DeviceTable, DeviceTableLoader
 from ipv4privatenetworkspace import NetworkIsOutOfSpace
 from netorgmeraki import MerakiNetworkMapper
 
@@ -305,3 +305,25 @@ class TestNetorgOrganizer(unittest.TestCase) :
         self.assertEqual(len(fixed_ip_reservations), 2, "Expected there to be 2 reservations")
         self.assertEqual(fixed_ip_reservations['__a_201']['ip'], '192.168.128.201')
         self.assertEqual(fixed_ip_reservations['__a_202']['ip'], '192.168.128.202')
+
+    def test_group_block_extends_existing_block(self):
+        """Test that a group's new devices join the block its other devices are already in."""
+        data = [{'mac': f'lights-{i}', 'known': True, 'reserved': True, 'active': False,
+                 'ip': f'192.168.128.{100 + i}', 'group': 'Lights', 'name': f'Light {i}'} for i in range(20)]
+        data.append({'mac': 'lights-new', 'known': True, 'reserved': False, 'active': False,
+                     'ip': '', 'group': 'Lights', 'name': 'Light new'})
+        device_table = DeviceTable(data)
+        MerakiNetworkMapper({'vlan_subnet': '192.168.128.0/24', 'ip_allocation_strategy': 'group_block'}, device_table)
+        # The 21 lights fit in 192.168.128.96/27, which already holds the other 20
+        self.assertEqual('192.168.128.96', device_table.get_by_mac('lights-new')['ip'])
+
+    def test_group_block_sized_to_new_devices(self):
+        """Test that a group spread over the subnet gets a block only sized for the devices that need an IP."""
+        data = [{'mac': f'lights-{i}', 'known': True, 'reserved': True, 'active': False,
+                 'ip': f'192.168.128.{10 * i + 5}', 'group': 'Lights', 'name': f'Light {i}'} for i in range(20)]
+        data.append({'mac': 'lights-new', 'known': True, 'reserved': False, 'active': False,
+                     'ip': '', 'group': 'Lights', 'name': 'Light new'})
+        device_table = DeviceTable(data)
+        MerakiNetworkMapper({'vlan_subnet': '192.168.128.0/24', 'ip_allocation_strategy': 'group_block'}, device_table)
+        # A block of 4 (not 32) is enough for the one new light
+        self.assertEqual('192.168.128.8', device_table.get_by_mac('lights-new')['ip'])